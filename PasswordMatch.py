@@ -1,5 +1,234 @@
-import re
 import string
+from config import (
+    MIN_PASSWORD_LENGTH, REQUIRE_UPPERCASE, REQUIRE_LOWERCASE, REQUIRE_NUMBERS,
+    REQUIRE_SPECIAL_CHARS
+)
+from blocklist import default_blocklist
+from metrics import metrics
+
+# Character classes, as bit flags
+UPPER = 1
+LOWER = 2
+DIGIT = 4
+SPECIAL = 8
+
+# Extra verdict flags
+TOO_SHORT = 16
+BLOCKLISTED = 32
+
+# Class letters produced by the lookup table, and their bit flags
+_CLASS_CODES = {"U": UPPER, "L": LOWER, "D": DIGIT, "S": SPECIAL}
+
+def _char_class(c):
+    """Classify one character the way the original checks did"""
+    if c.isupper():
+        return UPPER
+    if c.islower():
+        return LOWER
+    if c.isdigit():
+        return DIGIT
+    if c in string.punctuation:
+        return SPECIAL
+    return 0
+
+def _build_class_table():
+    """Map every ASCII character to its class letter (or delete it) for str.translate"""
+    table = {}
+    codes = {bit: code for code, bit in _CLASS_CODES.items()}
+    for i in range(128):
+        table[i] = codes.get(_char_class(chr(i)))
+    return table
+
+
+class PasswordPolicy:
+    def __init__(self, min_length=MIN_PASSWORD_LENGTH, require_uppercase=REQUIRE_UPPERCASE,
+                 require_lowercase=REQUIRE_LOWERCASE, require_numbers=REQUIRE_NUMBERS,
+                 require_special=REQUIRE_SPECIAL_CHARS, blocklist="default"):
+        """Compile the password requirements into a class mask and lookup table.
+
+        blocklist is any container of banned passwords, None to disable the
+        check, or "default" to use the configured index on first use.
+        """
+        self.min_length = min_length
+        self._blocklist = blocklist
+        self.required = (
+            (UPPER if require_uppercase else 0) |
+            (LOWER if require_lowercase else 0) |
+            (DIGIT if require_numbers else 0) |
+            (SPECIAL if require_special else 0)
+        )
+        self._table = _build_class_table()
+
+        # Reported in this order when missing
+        self._requirements = [
+            (bit, message) for bit, message in (
+                (UPPER, "At least one uppercase letter"),
+                (LOWER, "At least one lowercase letter"),
+                (DIGIT, "At least one digit"),
+                (SPECIAL, "At least one special character (!@#$%^&*)"),
+            ) if self.required & bit
+        ]
+
+    def classify(self, password):
+        """Return the bit mask of character classes present in the password.
+
+        str.translate maps the whole string through the lookup table in C,
+        so each character is visited once; only non-ASCII characters left
+        untouched by the table are classified individually.
+        """
+        mask = 0
+        for c in set(password.translate(self._table)):
+            bit = _CLASS_CODES.get(c)
+            mask |= bit if bit is not None else _char_class(c)
+        return mask
+
+    @property
+    def blocklist(self):
+        """The blocklist in use, resolving the configured default lazily"""
+        if self._blocklist == "default":
+            self._blocklist = default_blocklist()
+        return self._blocklist
+
+    def is_blocklisted(self, password):
+        """Return True if the password is a known common or breached password"""
+        blocklist = self.blocklist
+        return blocklist is not None and password in blocklist
+
+    def _verdict_key(self, password):
+        """Encode the outcome as blocklist/too-short flags | missing class bits"""
+        key = TOO_SHORT if len(password) < self.min_length else 0
+        key |= self.required & ~self.classify(password)
+        if self.is_blocklisted(password):
+            key |= BLOCKLISTED
+        return key
+
+    def _verdict(self, key):
+        """Return the (label, issues) analysis for a verdict key"""
+        problems = []
+        if key & TOO_SHORT:
+            problems.append(f"At least {self.min_length} characters")
+        problems.extend(message for bit, message in self._requirements if key & bit)
+        if key & BLOCKLISTED:
+            problems.append("Not a common or previously breached password")
+            return "Weak", problems
+        if not problems:
+            return "Strong", []
+        elif len(problems) <= 2:
+            return "Medium", problems
+        else:
+            return "Weak", problems
+
+    @metrics.timed("password_policy_seconds", "issues")
+    def issues(self, password):
+        """Return the list of unmet requirements"""
+        return self._verdict(self._verdict_key(password))[1]
+
+    @metrics.timed("password_policy_seconds", "is_strong")
+    def is_strong(self, password):
+        """Return True if the password meets every requirement"""
+        if len(password) < self.min_length:
+            return False
+        if self.required & ~self.classify(password):
+            return False
+        return not self.is_blocklisted(password)
+
+    @metrics.timed("password_policy_seconds", "strength")
+    def strength(self, password):
+        """Return a (label, issues) strength analysis"""
+        return self._verdict(self._verdict_key(password))
+
+    def strength_many(self, passwords):
+        """Yield a (label, issues) analysis for each password in an iterable"""
+        for password in passwords:
+            yield self.strength(password)
+
+    def audit(self, passwords):
+        """Summarize an iterable of candidate passwords in one streaming pass.
+
+        Returns counts per strength label and per unmet requirement. Only
+        the compact verdict key is tallied per password; labels and
+        messages are expanded once per distinct outcome at the end.
+        """
+        verdict_key = self._verdict_key
+        tallies = {}
+        for password in passwords:
+            key = verdict_key(password)
+            tallies[key] = tallies.get(key, 0) + 1
+
+        summary = {"total": 0, "Strong": 0, "Medium": 0, "Weak": 0, "issues": {}}
+        for key, count in tallies.items():
+            label, problems = self._verdict(key)
+            summary["total"] += count
+            summary[label] += count
+            for problem in problems:
+                summary["issues"][problem] = summary["issues"].get(problem, 0) + count
+        return summary
+
+# Global policy instance built from config
+policy = PasswordPolicy()
+
+
+class StrengthMeter:
+    def __init__(self, password_policy=None):
+        """Incremental strength evaluation for a password being typed.
+
+        Keeps a running count per character class plus the length.
+        insert() and delete() adjust the counts for the edited characters
+        only, so a keystroke costs O(edit) however long the password is.
+        """
+        self.policy = password_policy or policy
+        self.length = 0
+        self.counts = {UPPER: 0, LOWER: 0, DIGIT: 0, SPECIAL: 0}
+
+    def _apply(self, text, sign):
+        classes = text.translate(self.policy._table)
+        counted = 0
+        for code, bit in _CLASS_CODES.items():
+            n = classes.count(code)
+            self.counts[bit] += sign * n
+            counted += n
+        if counted < len(classes):
+            # Non-ASCII characters pass through the table unchanged
+            for c in classes:
+                bit = _char_class(c) if ord(c) > 127 else 0
+                if bit:
+                    self.counts[bit] += sign
+        self.length += sign * len(text)
+
+    def insert(self, text):
+        """Account for characters added anywhere in the password"""
+        self._apply(text, 1)
+
+    def delete(self, text):
+        """Account for characters removed from the password"""
+        self._apply(text, -1)
+
+    def reset(self, password=""):
+        """Start over from a known password (e.g. after the field was set directly)"""
+        self.length = 0
+        self.counts = dict.fromkeys(self.counts, 0)
+        self._apply(password, 1)
+
+    def mask(self):
+        """Bit mask of the character classes currently present"""
+        mask = 0
+        for bit, count in self.counts.items():
+            if count > 0:
+                mask |= bit
+        return mask
+
+    def strength(self, password=None):
+        """Return a (label, issues) analysis from the running counts.
+
+        Pass the current password to include the blocklist check, which
+        needs the whole string; leave it out for a per-keystroke estimate.
+        """
+        key = TOO_SHORT if self.length < self.policy.min_length else 0
+        key |= self.policy.required & ~self.mask()
+        if password is not None and self.policy.is_blocklisted(password):
+            key |= BLOCKLISTED
+        return self.policy._verdict(key)
+
 
 class PasswordMatch:
     def __init__(self, password):
@@ -13,36 +242,12 @@ class PasswordMatch:
     @staticmethod
     def is_strong(value):
         """Enhanced password validation with detailed requirements"""
-        return (
-            len(value) >= 8 and
-            any(c.isupper() for c in value) and
-            any(c.islower() for c in value) and
-            any(c.isdigit() for c in value) and
-            any(c in string.punctuation for c in value)  # Require special characters
-        )
+        return policy.is_strong(value)
     
     @staticmethod
     def get_password_strength(password):
         """Return detailed password strength analysis"""
-        issues = []
-        
-        if len(password) < 8:
-            issues.append("At least 8 characters")
-        if not any(c.isupper() for c in password):
-            issues.append("At least one uppercase letter")
-        if not any(c.islower() for c in password):
-            issues.append("At least one lowercase letter")
-        if not any(c.isdigit() for c in password):
-            issues.append("At least one digit")
-        if not any(c in string.punctuation for c in password):
-            issues.append("At least one special character (!@#$%^&*)")
-        
-        if not issues:
-            return "Strong", []
-        elif len(issues) <= 2:
-            return "Medium", issues
-        else:
-            return "Weak", issues
+        return policy.strength(password)
     
     @staticmethod
     def suggest_password():
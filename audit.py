@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Structured audit log with per-user, per-time-bucket index
+
+Events are appended as JSON lines to segment files that rotate by size or
+age. Every segment has a sidecar index mapping each username to the byte
+offsets of its records, grouped into time buckets, so a history query for
+one user reads only the matching lines of the matching segments.
+
+record() only queues the event; a background thread writes queued events
+in batches with one flush per batch (AUDIT_ASYNC), so logging a login does
+no file I/O on the caller's thread. Security events are never dropped: a
+full queue makes record() wait.
+
+Each process writes its own segments, named with its pid. The index of the
+open segment is checkpointed every AUDIT_INDEX_CHECKPOINT_SECONDS and
+records how many bytes it covers, so a query only reads the unindexed tail
+of another process's live segment. A closed segment is renamed to carry its
+end time, which lets queries skip it without opening anything. Whenever a
+segment is opened, segments left open by dead processes are closed and
+segments past AUDIT_RETENTION_DAYS or beyond AUDIT_MAX_SEGMENTS are deleted.
+
+Layout of the audit directory:
+    audit-<start ms>-<pid>.jsonl         open segment, one JSON object per line
+    audit-<start ms>-<end ms>-<pid>.jsonl  closed segment
+    audit-<...>.idx                      {"end": ..., "size": ..., "users": {name: {bucket: [offsets]}}}
+
+Usage:
+    python audit.py query --user alice --since 2026-10-11 --event login --failed
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from config import (
+    AUDIT_LOG_DIR, AUDIT_SEGMENT_MAX_BYTES, AUDIT_SEGMENT_MAX_SECONDS, AUDIT_INDEX_BUCKET_SECONDS,
+    AUDIT_ASYNC, AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE, AUDIT_INDEX_CHECKPOINT_SECONDS,
+    AUDIT_RETENTION_DAYS, AUDIT_MAX_SEGMENTS
+)
+
+SEGMENT_PREFIX = "audit-"
+
+def _segment_fields(path):
+    """(start ms, end ms or None, writer pid or None) encoded in a segment's file name"""
+    fields = [int(field) for field in
+              os.path.basename(path)[len(SEGMENT_PREFIX):].split(".")[0].split("-")]
+    if len(fields) == 3:
+        return fields[0], fields[1], fields[2]
+    return fields[0], None, fields[1] if len(fields) > 1 else None
+
+def _segment_start(path):
+    """Segment start time (epoch seconds) encoded in its file name"""
+    return _segment_fields(path)[0] / 1000
+
+def _segment_order(path):
+    start_ms, end_ms, pid = _segment_fields(path)
+    return start_ms, pid or 0, end_ms or 0
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists but belongs to someone else
+    return True
+
+def _index_path(segment_path):
+    return segment_path[:-len(".jsonl")] + ".idx"
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # Already removed by another process
+
+
+class AuditLog:
+    def __init__(self, directory=AUDIT_LOG_DIR, max_bytes=AUDIT_SEGMENT_MAX_BYTES,
+                 max_seconds=AUDIT_SEGMENT_MAX_SECONDS, bucket_seconds=AUDIT_INDEX_BUCKET_SECONDS,
+                 clock=time.time, async_writes=AUDIT_ASYNC, queue_size=AUDIT_QUEUE_SIZE,
+                 batch_size=AUDIT_BATCH_SIZE, checkpoint_seconds=AUDIT_INDEX_CHECKPOINT_SECONDS,
+                 retention_days=AUDIT_RETENTION_DAYS, max_segments=AUDIT_MAX_SEGMENTS):
+        """Append-only JSONL audit log with size/time rotation and a sidecar index"""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.bucket_seconds = bucket_seconds
+        self.clock = clock
+        self.checkpoint_seconds = checkpoint_seconds
+        self.retention_seconds = retention_days * 86400
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._started = 0
+        self._index = None
+        self._checkpointed = 0
+        self.batch_size = batch_size
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue = None
+        self._writer = None
+        if async_writes:
+            self._queue = queue.Queue(queue_size)
+            self._writer = threading.Thread(target=self._write_loop, name="audit-writer",
+                                            daemon=True)
+            self._writer.start()
+
+    def _expire_segments(self, now):
+        """Close segments whose writer died and delete segments past retention
+        (caller holds the lock).
+
+        Segments still being written by a live process are left alone.
+        """
+        closed = []
+        for path in self.segments():
+            start_ms, end_ms, pid = _segment_fields(path)
+            if end_ms is None:
+                if pid is not None and _pid_alive(pid):
+                    continue
+                try:
+                    path = self._seal_segment(path, self._scan_segment(path, self._load_index(path)))
+                except OSError:
+                    continue  # Closed by another process meanwhile
+            closed.append(path)
+        excess = len(closed) - self.max_segments
+        cutoff = now - self.retention_seconds
+        for i, path in enumerate(closed):
+            if i < excess or _segment_fields(path)[1] / 1000 < cutoff:
+                _remove(path)
+                _remove(_index_path(path))
+
+    def _load_index(self, path):
+        """A segment's stored index, or None if it has none yet"""
+        try:
+            with open(_index_path(path)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if "size" not in index:
+            index["size"] = os.path.getsize(path)  # Written at close by older versions
+        return index
+
+    def _scan_segment(self, path, index=None):
+        """Index a segment by reading it, or just the part `index` doesn't cover yet"""
+        if index is None:
+            index = {"end": _segment_start(path), "size": 0, "users": {}}
+        offset = index["size"]
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Still being written
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Torn final line
+                self._index_record(index, record, offset)
+                offset += len(line)
+        index["size"] = offset
+        return index
+
+    def _index_record(self, index, record, offset):
+        user = record.get("user")
+        if user is not None:
+            bucket = str(int(record["ts"] // self.bucket_seconds))
+            index["users"].setdefault(user, {}).setdefault(bucket, []).append(offset)
+        index["end"] = max(index["end"], record["ts"])
+
+    def _write_index(self, segment_path, index):
+        tmp_path = _index_path(segment_path) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(tmp_path, _index_path(segment_path))
+
+    def _seal_segment(self, path, index):
+        """Rename a finished segment to carry its end time, next to its final index"""
+        start_ms, _, pid = _segment_fields(path)
+        end_ms = math.ceil(index["end"] * 1000)
+        sealed = os.path.join(self.directory, f"{SEGMENT_PREFIX}{start_ms}-{end_ms}-{pid or 0}.jsonl")
+        self._write_index(sealed, index)
+        os.replace(path, sealed)
+        _remove(_index_path(path))
+        return sealed
+
+    def _open_segment(self, now):
+        """Start a new segment (caller holds the lock)"""
+        self._expire_segments(now)
+        start_ms = int(now * 1000)
+        pid = os.getpid()
+        self._path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{start_ms}-{pid}.jsonl")
+        while os.path.exists(self._path) or glob.glob(
+                os.path.join(self.directory, f"{SEGMENT_PREFIX}{start_ms}-*-{pid}.jsonl")):
+            start_ms += 1  # Rotated twice within a millisecond
+            self._path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{start_ms}-{pid}.jsonl")
+        self._file = open(self._path, "ab")
+        self._started = now
+        self._index = {"end": now, "size": 0, "users": {}}
+        self._checkpointed = time.monotonic()
+
+    def _close_segment(self):
+        """Finish the current segment and persist its index (caller holds the lock)"""
+        if self._file is not None:
+            self._file.close()
+            self._seal_segment(self._path, self._index)
+            self._file = None
+            self._path = None
+            self._index = None
+
+    def record(self, event, user=None, success=None, ip=None, details=None):
+        """Append one audit event (queued for the writer thread in async mode)"""
+        now = self.clock()
+        record = {"ts": round(now, 3), "event": event}
+        if user is not None:
+            record["user"] = user
+        if success is not None:
+            record["success"] = success
+        if ip is not None:
+            record["ip"] = ip
+        if details is not None:
+            record["details"] = details
+        if self._writer is not None:
+            self._queue.put((now, record))
+        else:
+            self._write_batch([(now, record)])
+
+    def _write_loop(self):
+        """Writer thread: drain the queue in batches, flushing once per batch"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._write_batch(batch)
+            except OSError:
+                pass  # Like logging handlers, never let a full disk kill the writer
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        with self._lock:
+            for now, record in batch:
+                line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+                if self._file is not None and (
+                    self._file.tell() + len(line) > self.max_bytes or
+                    now - self._started >= self.max_seconds
+                ):
+                    self._close_segment()
+                if self._file is None:
+                    self._open_segment(now)
+                offset = self._file.tell()
+                self._file.write(line)
+                self._index_record(self._index, record, offset)
+                self._index["size"] = offset + len(line)
+            self._file.flush()
+            if time.monotonic() - self._checkpointed >= self.checkpoint_seconds:
+                self._write_index(self._path, self._index)
+                self._checkpointed = time.monotonic()
+
+    def flush(self):
+        """Wait until every event recorded so far is written"""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.join()
+
+    def segments(self):
+        """All segment files, oldest first"""
+        return sorted(glob.glob(os.path.join(self.directory, f"{SEGMENT_PREFIX}*.jsonl")),
+                      key=_segment_order)
+
+    def query(self, user, since=None, until=None, event=None, success=None):
+        """Yield a user's events in time order, reading only indexed records.
+
+        since/until are epoch seconds; event and success filter the results.
+        """
+        since = since if since is not None else 0
+        until = until if until is not None else float("inf")
+        first_bucket = int(since // self.bucket_seconds)
+        last_bucket = until // self.bucket_seconds if until != float("inf") else until
+
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            active_path = self._path
+            # Snapshot just this user's part of the live index
+            active_buckets = {}
+            if self._index is not None:
+                for bucket, offsets in self._index["users"].get(user, {}).items():
+                    active_buckets[bucket] = list(offsets)
+
+        # Closed segments' names give their time span without opening them.
+        # A segment can be closed (renamed) or deleted by its writer while we
+        # read: list the directory again and continue with the new names.
+        pending = self.segments()
+        seen = set()
+        while pending:
+            path = pending.pop(0)
+            seen.add(path)
+            start_ms, end_ms, _ = _segment_fields(path)
+            if start_ms / 1000 > until or (end_ms is not None and end_ms / 1000 < since):
+                continue
+            try:
+                records = self._read_user_records(path, user, first_bucket, last_bucket,
+                                                  active_buckets if path == active_path else None)
+            except FileNotFoundError:
+                pending = [p for p in self.segments() if p not in seen]
+                continue
+            for record in records:
+                if not since <= record["ts"] <= until:
+                    continue
+                if event is not None and record.get("event") != event:
+                    continue
+                if success is not None and record.get("success") != success:
+                    continue
+                yield record
+
+    def _read_user_records(self, path, user, first_bucket, last_bucket, buckets=None):
+        """A user's records in a segment's matching buckets; without `buckets`
+        they come from the stored index, plus a scan of whatever it doesn't cover"""
+        if buckets is None:
+            index = self._load_index(path)
+            if index is None or index["size"] < os.path.getsize(path):
+                index = self._scan_segment(path, index)
+            buckets = index["users"].get(user)
+        if not buckets:
+            return []
+
+        offsets = []
+        for bucket, bucket_offsets in buckets.items():
+            if first_bucket <= int(bucket) <= last_bucket:
+                offsets.extend(bucket_offsets)
+        records = []
+        if offsets:
+            with open(path, "rb") as f:
+                for offset in sorted(offsets):
+                    f.seek(offset)
+                    records.append(json.loads(f.readline()))
+        return records
+
+    def close(self):
+        """Write queued events, close the active segment and write its index.
+
+        Events recorded after close() are written synchronously.
+        """
+        writer, self._writer = self._writer, None
+        if writer is not None and writer.is_alive():
+            self._queue.put(None)
+            writer.join()
+        with self._lock:
+            self._close_segment()
+
+
+def _parse_time(value):
+    """Accept epoch seconds or an ISO date/datetime"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit log tool")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    query = subparsers.add_parser("query", help="show one user's audit history")
+    query.add_argument("--user", required=True)
+    query.add_argument("--since", type=_parse_time, help="epoch seconds or ISO date")
+    query.add_argument("--until", type=_parse_time, help="epoch seconds or ISO date")
+    query.add_argument("--event", help="only this event type, e.g. login")
+    outcome = query.add_mutually_exclusive_group()
+    outcome.add_argument("--failed", action="store_const", const=False, dest="success")
+    outcome.add_argument("--succeeded", action="store_const", const=True, dest="success")
+    query.add_argument("--dir", default=AUDIT_LOG_DIR, help="audit log directory")
+    args = parser.parse_args()
+
+    audit_log = AuditLog(args.dir)
+    for record in audit_log.query(args.user, args.since, args.until, args.event, args.success):
+        print(json.dumps(record))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Local network auth service
+
+Serves the login system over line-delimited JSON on a TCP socket, for load
+testing and for running as a daemon. Each request is one JSON object on
+its own line; each response is one JSON object on its own line, in the
+same order as the requests on that connection. An "id" in a request is
+echoed back in its response.
+
+Operations:
+    {"op": "ping"}
+    {"op": "register",  "username": ..., "password": ..., "ip": ...}
+    {"op": "verify",    "username": ..., "password": ..., "ip": ...}  -> "token"
+    {"op": "session",   "token": ..., "renew": true}        -> "username", "expires_in"
+    {"op": "user_info", "token": ...}                      -> "username", "created_at", "last_login"
+    {"op": "logout",    "token": ...}
+
+Lockout and rate limits are keyed on the client's address, taken from
+the connection. Only a front end listed in AUTH_SERVER_TRUSTED_PROXIES
+(or --trusted-proxy) may relay the end user's address as "ip" in
+register and verify requests; its requests without "ip" have no source,
+so only the per-username limits apply. "ip" from any other peer is ignored.
+
+Clients may pipeline: send many requests without waiting for responses.
+Pipelined requests run concurrently, so wait for a response before
+sending a request that depends on it (e.g. verify after register).
+Hashing and SQLite calls run on a bounded thread pool. When too many
+requests are in flight the server stops reading, so TCP pushes back on
+the clients. SIGINT/SIGTERM stop accepting new work, let in-flight
+requests finish and answer, then close the database.
+
+Usage:
+    python auth_server.py
+    python auth_server.py --port 9000 --db staging.db
+    python auth_server.py --metrics-port 9464   # Prometheus scrape at /metrics
+    python auth_server.py --trusted-proxy 127.0.0.1   # behind a front end on this host
+    printf '{"id":1,"op":"ping"}\\n' | nc 127.0.0.1 8765
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    DATABASE_NAME, SESSION_PERSISTENCE, MESSAGES,
+    AUTH_SERVER_HOST, AUTH_SERVER_PORT, AUTH_SERVER_WORKERS, AUTH_SERVER_MAX_PENDING,
+    AUTH_SERVER_PIPELINE_DEPTH, AUTH_SERVER_MAX_LINE_BYTES, AUTH_SERVER_DRAIN_SECONDS,
+    AUTH_SERVER_TRUSTED_PROXIES, METRICS_PORT, METRICS_FILE,
+)
+from sharding import open_database
+from session import SessionStore
+from PasswordMatch import policy
+from logger import logger
+from metrics import metrics
+
+
+class RequestError(ValueError):
+    """A malformed request; reported to the client, not logged"""
+
+
+def _field(request, name):
+    value = request.get(name)
+    if not isinstance(value, str) or not value:
+        raise RequestError(f"Missing field: {name}")
+    return value
+
+def _source(request, peer, trusted_proxies=()):
+    """Client address for lockout and rate limits.
+
+    This is the peer address unless the peer is a configured trusted proxy,
+    which names the end user's address in "ip"; a trusted proxy's request
+    without "ip" has no source. Any other client's "ip" is ignored, since
+    it could name anyone.
+    """
+    try:
+        trusted = peer is not None and any(
+            ipaddress.ip_address(peer) in network for network in trusted_proxies)
+    except ValueError:
+        trusted = False
+    if not trusted:
+        return peer
+    ip = request.get("ip")
+    return ip if isinstance(ip, str) and ip else None
+
+def _encode(response):
+    return (json.dumps(response, separators=(",", ":")) + "\n").encode()
+
+
+class AuthServer:
+    def __init__(self, db=None, sessions=None, host=AUTH_SERVER_HOST, port=AUTH_SERVER_PORT,
+                 workers=AUTH_SERVER_WORKERS, max_pending=AUTH_SERVER_MAX_PENDING,
+                 pipeline_depth=AUTH_SERVER_PIPELINE_DEPTH,
+                 max_line_bytes=AUTH_SERVER_MAX_LINE_BYTES,
+                 trusted_proxies=AUTH_SERVER_TRUSTED_PROXIES):
+        """asyncio front end over UserDatabase and SessionStore.
+
+        max_pending bounds requests in flight across all connections and
+        pipeline_depth bounds requests read ahead of their responses on one
+        connection; either limit pauses reading until work completes.
+        trusted_proxies are addresses or networks allowed to relay "ip".
+        """
+        self.db = db if db is not None else open_database()
+        self.sessions = sessions if sessions is not None else SessionStore(
+            db=self.db if SESSION_PERSISTENCE else None)
+        self.host = host
+        self.port = port
+        self.pipeline_depth = pipeline_depth
+        self.max_line_bytes = max_line_bytes
+        self.max_pending = max_pending
+        self.trusted_proxies = tuple(ipaddress.ip_network(proxy, strict=False)
+                                     for proxy in trusted_proxies)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="auth-worker")
+        self._server = None
+        self._slots = None           # asyncio.Semaphore, created on the server's loop
+        self._connections = {}       # handler task -> True while it is waiting to read
+        self._draining = False
+        self.in_flight = 0
+        self.handlers = {
+            "register": self.register,
+            "verify": self.verify,
+            "session": self.session,
+            "user_info": self.user_info,
+            "logout": self.logout,
+        }
+
+    async def start(self):
+        """Start listening; with port 0 the chosen port is stored in self.port"""
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, limit=self.max_line_bytes)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def _release(self, future):
+        self.in_flight -= 1
+        self._slots.release()
+
+    # -----------------------------------------------------------------------
+    # Connections
+    # -----------------------------------------------------------------------
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = False
+        peername = writer.get_extra_info("peername")
+        peer = peername[0] if peername else None
+        responses = asyncio.Queue(self.pipeline_depth)
+        sender = asyncio.create_task(self._send_responses(responses, writer))
+        try:
+            while not self._draining:
+                self._connections[task] = True
+                try:
+                    line = await reader.readline()
+                except (asyncio.CancelledError, ConnectionError):
+                    break  # Cancelled by shutdown() while idle, or the peer went away
+                except ValueError:
+                    # Longer than max_line_bytes; the stream cannot be resynchronised
+                    await responses.put(self._reply({"ok": False, "error": "Request too large"}))
+                    break
+                finally:
+                    self._connections[task] = False
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                await self._slots.acquire()  # Global backpressure
+                self.in_flight += 1
+                future = asyncio.ensure_future(self._process(line, peer))
+                future.add_done_callback(self._release)
+                await responses.put(future)  # Per-connection backpressure
+        finally:
+            try:
+                await responses.put(None)
+                await sender
+            finally:
+                sender.cancel()  # Only still running if shutdown() gave up waiting
+                writer.close()
+                self._connections.pop(task, None)
+
+    async def _send_responses(self, responses, writer):
+        """Write responses in request order as they complete"""
+        connected = True
+        while True:
+            future = await responses.get()
+            if future is None:
+                return
+            response = await future
+            if not connected:
+                continue  # Keep awaiting so queued work is accounted for
+            try:
+                writer.write(response)
+                await writer.drain()  # Stop when the client is not reading
+            except ConnectionError:
+                connected = False
+
+    def _reply(self, response):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(_encode(response))
+        return future
+
+    async def _process(self, line, peer):
+        """Parse one request line, run its handler on the pool and encode the response"""
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError
+        except ValueError:
+            return _encode({"ok": False, "error": "Invalid JSON request"})
+        op = request.get("op")
+        source = _source(request, peer, self.trusted_proxies)
+        try:
+            if op == "ping":
+                response = {"ok": True}
+            elif op in self.handlers:
+                response = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self.handlers[op], request, source)
+            else:
+                response = {"ok": False, "error": f"Unknown op: {op}"}
+        except RequestError as e:
+            response = {"ok": False, "error": str(e)}
+        except Exception as e:
+            logger.log_system_error(str(e), f"Auth server {op}")
+            response = {"ok": False, "error": "Internal error"}
+        if "id" in request:
+            response["id"] = request["id"]
+        return _encode(response)
+
+    # -----------------------------------------------------------------------
+    # Operations (run on worker threads)
+    # -----------------------------------------------------------------------
+
+    def register(self, request, source):
+        username = _field(request, "username").strip()
+        password = _field(request, "password")
+        strength, issues = policy.strength(password)
+        if strength != "Strong":
+            return {"ok": False, "message": MESSAGES["weak_password"], "issues": issues}
+        success, message = self.db.create_user(username, password, source)
+        logger.log_user_registration(username, success)
+        return {"ok": success, "message": message}
+
+    def verify(self, request, source):
+        username = _field(request, "username").strip()
+        success, message = self.db.verify_user(username, _field(request, "password"), source)
+        logger.log_login_attempt(username, success, source)
+        if not success:
+            return {"ok": False, "message": message}
+        return {"ok": True, "message": message, "token": self.sessions.create(username)}
+
+    def session(self, request, source):
+        token = _field(request, "token")
+        username = self.sessions.validate(token, renew=request.get("renew", True) is not False)
+        if username is None:
+            return {"ok": False, "message": MESSAGES["session_expired"]}
+        return {"ok": True, "username": username,
+                "expires_in": round(self.sessions.time_remaining(token))}
+
+    def user_info(self, request, source):
+        """Account details for the user the session token belongs to"""
+        username = self.sessions.validate(_field(request, "token"))
+        if username is None:
+            return {"ok": False, "message": MESSAGES["session_expired"]}
+        info = self.db.get_user_info(username)
+        if not info:
+            return {"ok": False, "message": "User not found"}
+        return {"ok": True, "username": info[0], "created_at": info[1], "last_login": info[2]}
+
+    def logout(self, request, source):
+        token = _field(request, "token")
+        username = self.sessions.validate(token, renew=False)
+        self.sessions.revoke(token)
+        if username is not None:
+            logger.log_logout(username)
+        return {"ok": True}
+
+    # -----------------------------------------------------------------------
+    # Shutdown
+    # -----------------------------------------------------------------------
+
+    async def shutdown(self, timeout=AUTH_SERVER_DRAIN_SECONDS):
+        """Stop accepting, answer every request already read, then close the database.
+
+        Connections idle in a read are closed at once; the rest stop
+        reading and finish their in-flight requests. Anything still running
+        after timeout seconds is cancelled.
+        """
+        if self._draining:
+            return
+        self._draining = True
+        if self._server is not None:
+            self._server.close()
+        for task, reading in list(self._connections.items()):
+            if reading:
+                task.cancel()
+        if self._connections:
+            _, stuck = await asyncio.wait(list(self._connections), timeout=timeout)
+            for task in stuck:
+                task.cancel()
+        if self._server is not None:
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=True)
+        self.db.close()
+
+    async def serve_forever(self):
+        """Run until SIGINT/SIGTERM, then drain"""
+        await self.start()
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+        print(f"Auth server listening on {self.host}:{self.port}")
+        try:
+            await stop.wait()
+        finally:
+            print("Draining...")
+            await self.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Line-delimited JSON auth service")
+    parser.add_argument("--host", default=AUTH_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=AUTH_SERVER_PORT)
+    parser.add_argument("--db", default=DATABASE_NAME, help="database file")
+    parser.add_argument("--workers", type=int, default=AUTH_SERVER_WORKERS,
+                        help="threads for hashing and database calls")
+    parser.add_argument("--max-pending", type=int, default=AUTH_SERVER_MAX_PENDING,
+                        help="requests in flight before reading pauses")
+    parser.add_argument("--trusted-proxy", action="append", default=list(AUTH_SERVER_TRUSTED_PROXIES),
+                        help="address or network allowed to relay the client's \"ip\" (repeatable)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve Prometheus metrics on this port (enables metrics)")
+    parser.add_argument("--metrics-file", default=METRICS_FILE,
+                        help="write Prometheus metrics to this file periodically (enables metrics)")
+    args = parser.parse_args()
+
+    if args.metrics_port is not None or args.metrics_file:
+        metrics.enabled = True
+    metrics.start_exporters(args.metrics_port, args.metrics_file)
+
+    server = AuthServer(open_database(args.db), host=args.host, port=args.port,
+                        workers=args.workers, max_pending=args.max_pending,
+                        trusted_proxies=args.trusted_proxy)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        metrics.stop_exporters()
+
+
+if __name__ == "__main__":
+    main()
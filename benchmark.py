@@ -0,0 +1,808 @@
+#!/usr/bin/env python3
+"""
+Performance benchmarks for the login system
+
+Measures throughput and p50/p95/p99 latency of the login, registration and
+validation hot paths, plus before/after comparisons for individual
+optimizations. Results are printed as JSON; --output appends one JSON line
+per run so results can be compared over time.
+
+Usage:
+    python benchmark.py                          # hot paths at 1k and 10k users
+    python benchmark.py --sizes 1000,100000,1000000 --output bench.jsonl
+    python benchmark.py --suite comparisons
+    python benchmark.py --suite startup          # exits 1 if over the startup budget
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from audit import AuditLog
+from cache import LRUCache
+from database import UserDatabase
+from hashing import PasswordHasher
+from metrics import Metrics, metrics
+from PasswordMatch import policy
+from replica import ReadReplica
+from sharding import ShardedUserDatabase, shard_paths
+
+# Minimal-cost scrypt so database benchmarks measure SQL, not the KDF
+FAST_HASHER = PasswordHasher(cost=4, workers=1)
+
+BENCH_PASSWORD = "Passw0rd!"
+SEED_CHUNK_SIZE = 50000
+
+
+def time_calls(func, args_list):
+    """Call func once per argument tuple and return per-call latencies in microseconds"""
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+
+def summarize(latencies):
+    """Return throughput and mean/p50/p95/p99 latency (microseconds) for a list of samples"""
+    ordered = sorted(latencies)
+    count = len(ordered)
+    total = sum(ordered)
+
+    def percentile(pct):
+        # Nearest-rank percentile
+        rank = max(1, int(round(pct / 100 * count)))
+        return round(ordered[rank - 1], 2)
+
+    return {
+        "calls": count,
+        "ops_per_sec": round(count / (total / 1e6), 1) if total else None,
+        "mean_us": round(total / count, 2),
+        "p50_us": percentile(50),
+        "p95_us": percentile(95),
+        "p99_us": percentile(99),
+    }
+
+
+def seed_users(db, count):
+    """Fill the users table with count users sharing one precomputed hash"""
+    password_hash = db.hash_password(BENCH_PASSWORD)
+    conn = db.get_connection()
+    for start in range(0, count, SEED_CHUNK_SIZE):
+        stop = min(start + SEED_CHUNK_SIZE, count)
+        with conn:
+            conn.executemany(
+                "INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                ((f"user{i}", password_hash) for i in range(start, stop))
+            )
+    if db.username_filter is not None:
+        # Rows were written behind the filter's back
+        db.rebuild_username_filter()
+
+
+# ---------------------------------------------------------------------------
+# Hot path suite
+# ---------------------------------------------------------------------------
+
+def bench_database(size, calls, hasher):
+    """Benchmark UserDatabase operations against a table of `size` users"""
+    rng = random.Random(size)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db = UserDatabase(os.path.join(tmp, "bench_users.db"), hasher=hasher)
+        seed_users(db, size)
+
+        existing = [(f"user{rng.randrange(size)}",) for _ in range(calls)]
+        missing = [(f"nobody{i}",) for i in range(calls)]
+        logins = [(name, BENCH_PASSWORD) for (name,) in existing]
+        bad_logins = [(name, "wrong-password") for (name,) in existing]
+        new_users = [(f"new{i}", BENCH_PASSWORD) for i in range(calls)]
+
+        # Measure the full hashing path; the lockout and rate limit short-circuits
+        # have their own cases
+        lockout, db.lockout = db.lockout, None
+        rate_limiter, db.rate_limiter = db.rate_limiter, None
+        cases = [
+            ("verify_user", db.verify_user, logins),
+            ("verify_user_wrong_password", db.verify_user, bad_logins),
+            ("create_user", db.create_user, new_users),
+            ("user_exists_hit", db.user_exists, existing),
+            ("user_exists_miss", db.user_exists, missing),
+            ("get_user_info", db.get_user_info, existing),
+        ]
+        for name, func, args_list in cases:
+            result = {"benchmark": f"database.{name}", "users": size}
+            result.update(summarize(time_calls(func, args_list)))
+            results.append(result)
+
+        if lockout is not None:
+            db.lockout = lockout
+            for _ in range(lockout.limits["user"]):
+                lockout.record_failure("user0")
+            result = {"benchmark": "database.verify_user_locked", "users": size}
+            result.update(summarize(time_calls(db.verify_user, [("user0", "wrong")] * calls)))
+            results.append(result)
+
+        if rate_limiter is not None:
+            # A flood against one username, rejected by its bucket after the burst
+            db.lockout, db.rate_limiter = None, rate_limiter
+            result = {"benchmark": "database.verify_user_rate_limited", "users": size}
+            result.update(summarize(time_calls(db.verify_user, [("user1", "wrong")] * calls)))
+            results.append(result)
+        db.close()
+    return results
+
+
+def bench_password_policy(calls):
+    """Benchmark PasswordMatch validation on a mix of weak and strong passwords"""
+    from PasswordMatch import PasswordMatch, policy
+
+    samples = ["123", "password", "Password123", "MyP@ssw0rd123", "x" * 64 + "A1!"]
+    args_list = [(samples[i % len(samples)],) for i in range(calls)]
+    results = []
+    for name, func in (("is_strong", PasswordMatch.is_strong),
+                       ("get_password_strength", PasswordMatch.get_password_strength),
+                       ("is_blocklisted", policy.is_blocklisted)):
+        result = {"benchmark": f"PasswordMatch.{name}"}
+        result.update(summarize(time_calls(func, args_list)))
+        results.append(result)
+    return results
+
+
+def bench_rate_limiter(calls):
+    """Benchmark token-bucket checks in-process and in a shared memory-mapped file"""
+    from ratelimit import TokenBuckets, SharedTokenBuckets
+
+    # Many distinct sources, as in a distributed flood
+    args_list = [(f"10.0.{i // 256 % 256}.{i % 256}",) for i in range(calls)]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [("TokenBuckets", TokenBuckets(5.0, 30))]
+        try:
+            backends.append(("SharedTokenBuckets",
+                             SharedTokenBuckets(os.path.join(tmp, "buckets"), 5.0, 30)))
+        except ImportError:
+            pass  # No fcntl on this platform
+        for name, buckets in backends:
+            result = {"benchmark": f"ratelimit.{name}.allow"}
+            result.update(summarize(time_calls(buckets.allow, args_list)))
+            results.append(result)
+            if name == "SharedTokenBuckets":
+                buckets.close()
+    return results
+
+
+def bench_logger(calls):
+    """Benchmark SystemLogger methods writing to a scratch log file"""
+    from logger import logger
+
+    root = logging.getLogger()
+    saved_handlers = root.handlers[:]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        handler = logging.FileHandler(os.path.join(tmp, "bench.log"))
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        # Swap out the console, system.log and audit log for the duration
+        root.handlers = [handler]
+        saved_audit = logger.audit
+        if saved_audit is not None:
+            logger.audit = AuditLog(os.path.join(tmp, "audit"))
+        try:
+            cases = [
+                ("log_login_attempt", logger.log_login_attempt, ("user1", True, "127.0.0.1")),
+                ("log_login_attempt_failed", logger.log_login_attempt, ("user1", False)),
+                ("log_user_registration", logger.log_user_registration, ("user1", True)),
+                ("log_security_event", logger.log_security_event,
+                 ("brute_force", "user1", "3 failures")),
+                ("log_database_operation", logger.log_database_operation, ("insert", True)),
+            ]
+            for name, func, args in cases:
+                result = {"benchmark": f"SystemLogger.{name}"}
+                result.update(summarize(time_calls(func, [args] * calls)))
+                results.append(result)
+        finally:
+            root.handlers = saved_handlers
+            handler.close()
+            if saved_audit is not None:
+                logger.audit.close()
+                logger.audit = saved_audit
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Before/after comparisons
+# ---------------------------------------------------------------------------
+
+def bench_connection_reuse(calls=2000, users=1000):
+    """Compare a fresh connection per call against the pooled per-thread connection"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench_users.db")
+        db = UserDatabase(db_path, hasher=FAST_HASHER)
+        seed_users(db, users)
+        # Measure the connection itself, not the user lookup cache
+        db.cache = LRUCache(maxsize=0)
+
+        lookups = [(f"user{i % users}",) for i in range(calls)]
+
+        def user_exists_fresh_connection(username):
+            # The pre-pooling code path: open, query and drop a connection per call
+            with sqlite3.connect(db_path) as fresh:
+                cursor = fresh.cursor()
+                cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
+                return cursor.fetchone() is not None
+
+        before = summarize(time_calls(user_exists_fresh_connection, lookups))
+        after = summarize(time_calls(db.user_exists, lookups))
+        db.close()
+
+    return {
+        "benchmark": "connection_reuse",
+        "before": before,
+        "after": after,
+        "speedup": round(before["mean_us"] / after["mean_us"], 2),
+    }
+
+
+def bench_bulk_create(users=5000):
+    """Compare create_user in a loop against create_users_bulk"""
+    pairs = [(f"user{i}", f"Passw0rd!{i}") for i in range(users)]
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("loop", "bulk"):
+            db = UserDatabase(os.path.join(tmp, f"{name}.db"), hasher=FAST_HASHER)
+            start = time.perf_counter()
+            if name == "loop":
+                for username, password in pairs:
+                    db.create_user(username, password)
+            else:
+                db.create_users_bulk(pairs)
+            elapsed = time.perf_counter() - start
+            db.close()
+            timings[name] = {
+                "users": users,
+                "seconds": round(elapsed, 4),
+                "users_per_sec": round(users / elapsed, 1),
+            }
+
+    return {
+        "benchmark": "bulk_create",
+        "before": timings["loop"],
+        "after": timings["bulk"],
+        "speedup": round(timings["loop"]["seconds"] / timings["bulk"]["seconds"], 2),
+    }
+
+
+def bench_sharded_writes(users=2000, shards=4, threads=8):
+    """Compare concurrent registrations on one database file against sharded files"""
+    pairs = [(f"user{i}", BENCH_PASSWORD) for i in range(users)]
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, count in (("single_file", 1), ("sharded", shards)):
+            paths = shard_paths(os.path.join(tmp, f"{name}.db"), count)
+            db = (UserDatabase(paths[0], hasher=FAST_HASHER) if count == 1
+                  else ShardedUserDatabase(paths, hasher=FAST_HASHER))
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(lambda pair: db.create_user(*pair), pairs))
+            elapsed = time.perf_counter() - start
+            db.close()
+            timings[name] = {
+                "shards": count,
+                "threads": threads,
+                "users_per_sec": round(users / elapsed, 1),
+            }
+
+    return {
+        "benchmark": "sharded_writes",
+        "before": timings["single_file"],
+        "after": timings["sharded"],
+        "speedup": round(timings["sharded"]["users_per_sec"]
+                         / timings["single_file"]["users_per_sec"], 2),
+    }
+
+
+def bench_user_cache(calls=2000, users=1000):
+    """Compare get_user_info with and without the read-through cache on a skewed workload"""
+    # Most lookups go to a small set of active users, as with a logged-in dashboard
+    hot = max(1, users // 20)
+    lookups = [(f"user{i % hot if i % 5 else i % users}",) for i in range(calls)]
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench_users.db")
+        with UserDatabase(db_path, hasher=FAST_HASHER) as db:
+            seed_users(db, users)
+        for name, cache in (("uncached", LRUCache(maxsize=0)), ("cached", None)):
+            db = UserDatabase(db_path, hasher=FAST_HASHER)
+            if cache is not None:
+                db.cache = cache
+            timings[name] = summarize(time_calls(db.get_user_info, lookups))
+            if cache is None:
+                timings[name]["hit_rate"] = db.cache_stats()["hit_rate"]
+            db.close()
+
+    return {
+        "benchmark": "user_cache",
+        "before": timings["uncached"],
+        "after": timings["cached"],
+        "speedup": round(timings["uncached"]["mean_us"] / timings["cached"]["mean_us"], 2),
+    }
+
+
+def bench_read_replica(calls=2000, users=1000):
+    """Compare the login read path (verify_user + get_user_info) on SQLite and on the replica"""
+    lookups = [(f"user{random.randrange(users)}",) for _ in range(calls)]
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench_users.db")
+        with UserDatabase(db_path, hasher=FAST_HASHER) as db:
+            seed_users(db, users)
+        for name in ("sqlite", "replica"):
+            # Write-behind keeps the last_login UPDATE out of both measurements
+            db = UserDatabase(db_path, write_behind=True, hasher=FAST_HASHER)
+            db.cache = LRUCache(maxsize=0)
+            db.rate_limiter = None
+            if name == "replica":
+                db.replica = ReadReplica(db, refresh_seconds=0)
+
+            def login_read(username):
+                db.verify_user(username, BENCH_PASSWORD)
+                return db.get_user_info(username)
+
+            timings[name] = summarize(time_calls(login_read, lookups))
+            db.close()
+
+    return {
+        "benchmark": "read_replica",
+        "before": timings["sqlite"],
+        "after": timings["replica"],
+        "speedup": round(timings["sqlite"]["mean_us"] / timings["replica"]["mean_us"], 2),
+    }
+
+
+def bench_username_filter(calls=2000, users=1000):
+    """Compare user_exists on free usernames with and without the username filter"""
+    # Enumeration traffic: every name is new, so the lookup cache never helps
+    lookups = [(f"probe{i}",) for i in range(calls)]
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench_users.db")
+        with UserDatabase(db_path, hasher=FAST_HASHER) as db:
+            seed_users(db, users)
+        for name in ("sqlite", "filter"):
+            db = UserDatabase(db_path, hasher=FAST_HASHER)
+            if name == "sqlite":
+                db.username_filter = None
+            timings[name] = summarize(time_calls(db.user_exists, lookups))
+            db.close()
+
+        # Startup cost: full rebuild from the table vs loading the saved snapshot
+        startup = {}
+        for name in ("rebuild", "snapshot"):
+            if name == "rebuild":
+                os.remove(db_path + ".usernames")
+            start = time.perf_counter()
+            db = UserDatabase(db_path, hasher=FAST_HASHER)
+            startup[f"{name}_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            db.close()
+
+    return {
+        "benchmark": "username_filter",
+        "before": timings["sqlite"],
+        "after": timings["filter"],
+        "speedup": round(timings["sqlite"]["mean_us"] / timings["filter"]["mean_us"], 2),
+        "startup": dict(startup, users=users),
+    }
+
+
+def bench_write_behind(calls=2000, users=1000):
+    """Compare verify_user with inline last_login writes against write-behind mode"""
+    logins = [(f"user{i % users}", BENCH_PASSWORD) for i in range(calls)]
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench_users.db")
+        with UserDatabase(db_path, hasher=FAST_HASHER) as db:
+            seed_users(db, users)
+        for name, write_behind in (("inline", False), ("write_behind", True)):
+            db = UserDatabase(db_path, write_behind=write_behind, hasher=FAST_HASHER)
+            db.rate_limiter = None
+            timings[name] = summarize(time_calls(db.verify_user, logins))
+            db.close()
+
+    return {
+        "benchmark": "last_login_write_behind",
+        "before": timings["inline"],
+        "after": timings["write_behind"],
+        "speedup": round(timings["inline"]["mean_us"] / timings["write_behind"]["mean_us"], 2),
+    }
+
+
+def bench_async_logging(calls=2000, users=1000):
+    """Compare verify_user plus login logging with synchronous and async handlers"""
+    from logger import logger, AsyncLogHandler, LOG_FORMAT
+
+    root = logging.getLogger()
+    saved_handlers = root.handlers[:]
+    logins = [(f"user{i % users}", BENCH_PASSWORD) for i in range(calls)]
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db = UserDatabase(os.path.join(tmp, "bench_users.db"), hasher=FAST_HASHER)
+        db.rate_limiter = None
+        seed_users(db, users)
+
+        def login(username, password):
+            success, _ = db.verify_user(username, password)
+            logger.log_login_attempt(username, success, "127.0.0.1")
+
+        devnull = open(os.devnull, "w")
+        try:
+            for name in ("sync", "async"):
+                # A log file plus a console-like stream, as SystemLogger sets up
+                handlers = [logging.FileHandler(os.path.join(tmp, f"{name}.log")),
+                            logging.StreamHandler(devnull)]
+                for handler in handlers:
+                    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+                if name == "async":
+                    handlers = [AsyncLogHandler(handlers)]
+                root.handlers = handlers
+                timings[name] = summarize(time_calls(login, logins))
+                for handler in handlers:
+                    handler.close()
+        finally:
+            root.handlers = saved_handlers
+            devnull.close()
+            db.close()
+
+    return {
+        "benchmark": "async_logging",
+        "before": timings["sync"],
+        "after": timings["async"],
+        "speedup": round(timings["sync"]["mean_us"] / timings["async"]["mean_us"], 2),
+    }
+
+
+def bench_metrics_overhead(calls=2000, users=1000, rounds=5):
+    """Compare a login round trip (policy check, verify_user, get_user_info) with
+    metrics disabled and enabled"""
+    lookups = [(f"user{random.randrange(users)}",) for _ in range(calls)]
+    timings = {}
+    enabled = metrics.enabled
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench_users.db")
+        with UserDatabase(db_path, hasher=FAST_HASHER) as db:
+            seed_users(db, users)
+        db = UserDatabase(db_path, write_behind=True, hasher=FAST_HASHER)
+        db.rate_limiter = None
+        db.lockout = None
+
+        def login(username):
+            policy.is_strong(BENCH_PASSWORD)
+            db.verify_user(username, BENCH_PASSWORD)
+            return db.get_user_info(username)
+
+        try:
+            time_calls(login, lookups)  # Warm the connection, cache and policy verdicts
+            # Alternate the two modes and keep each one's best round, so drift
+            # on a busy machine does not land on one side only
+            for _ in range(rounds):
+                for name in ("disabled", "enabled"):
+                    metrics.enabled = name == "enabled"
+                    result = summarize(time_calls(login, lookups))
+                    if name not in timings or result["mean_us"] < timings[name]["mean_us"]:
+                        timings[name] = result
+            series = len(metrics.collect())
+        finally:
+            metrics.enabled = enabled
+            db.close()
+
+    # The end-to-end difference is small next to run-to-run noise, so also time
+    # the wrappers alone around a no-op
+    registry = Metrics(enabled=True)
+    wrappers = {
+        "call_wrapper_us": registry.call("noop")(lambda: None),
+        "timed_wrapper_us": registry.timed("noop_seconds", "noop")(lambda: None),
+    }
+    noop = min(sum(time_calls(lambda: None, [()] * calls)) for _ in range(rounds)) / calls
+    wrapper_costs = {
+        name: round(min(sum(time_calls(wrapper, [()] * calls)) for _ in range(rounds)) / calls - noop, 2)
+        for name, wrapper in wrappers.items()
+    }
+
+    overhead = timings["enabled"]["mean_us"] - timings["disabled"]["mean_us"]
+    return {
+        "benchmark": "metrics_overhead",
+        "before": timings["disabled"],
+        "after": timings["enabled"],
+        "overhead_us": round(overhead, 2),
+        "overhead_pct": round(100 * overhead / timings["disabled"]["mean_us"], 1),
+        "series": series,
+        **wrapper_costs,
+    }
+
+
+def bench_policy_audit(passwords=200000):
+    """Compare the original five-scan strength check against PasswordPolicy.audit"""
+    import string
+    from PasswordMatch import PasswordPolicy
+
+    rng = random.Random(0)
+    alphabet = string.ascii_letters + string.digits + string.punctuation
+    candidates = ["".join(rng.choice(alphabet) for _ in range(rng.randrange(4, 17)))
+                  for _ in range(passwords)]
+
+    def original_strength(password):
+        # The pre-policy implementation: one any() scan per requirement
+        issues = []
+        if len(password) < 8:
+            issues.append("At least 8 characters")
+        if not any(c.isupper() for c in password):
+            issues.append("At least one uppercase letter")
+        if not any(c.islower() for c in password):
+            issues.append("At least one lowercase letter")
+        if not any(c.isdigit() for c in password):
+            issues.append("At least one digit")
+        if not any(c in string.punctuation for c in password):
+            issues.append("At least one special character (!@#$%^&*)")
+        return issues
+
+    start = time.perf_counter()
+    for password in candidates:
+        original_strength(password)
+    before = time.perf_counter() - start
+
+    # Same checks on both sides; the blocklist lookup is measured separately
+    start = time.perf_counter()
+    PasswordPolicy(blocklist=None).audit(candidates)
+    after = time.perf_counter() - start
+
+    blocklisted_policy = PasswordPolicy()
+    blocklisted_policy.blocklist  # Load or build the index outside the timing
+    start = time.perf_counter()
+    blocklisted_policy.audit(candidates)
+    with_blocklist = time.perf_counter() - start
+
+    return {
+        "benchmark": "policy_audit",
+        "before": {"passwords": passwords, "passwords_per_sec": round(passwords / before, 1)},
+        "after": {"passwords": passwords, "passwords_per_sec": round(passwords / after, 1)},
+        "speedup": round(before / after, 2),
+        "with_blocklist": {
+            "passwords": passwords,
+            "passwords_per_sec": round(passwords / with_blocklist, 1),
+            "blocklist_us_per_password": round((with_blocklist - after) / passwords * 1e6, 3),
+        },
+    }
+
+
+def bench_strength_meter(length=20000):
+    """Compare rescanning the password per keystroke against StrengthMeter updates"""
+    from PasswordMatch import PasswordPolicy, StrengthMeter
+
+    policy = PasswordPolicy(blocklist=None)
+    keystrokes = ("aB3!" * (length // 4 + 1))[:length]
+    timings = {}
+
+    start = time.perf_counter()
+    for i in range(1, length + 1):
+        policy.strength(keystrokes[:i])  # What the form would do with a full check
+    timings["rescan"] = time.perf_counter() - start
+
+    meter = StrengthMeter(policy)
+    start = time.perf_counter()
+    for c in keystrokes:
+        meter.insert(c)
+        meter.strength()
+    timings["incremental"] = time.perf_counter() - start
+
+    return {
+        "benchmark": "strength_meter",
+        "before": {"keystrokes": length, "seconds": round(timings["rescan"], 4),
+                   "us_per_keystroke": round(timings["rescan"] / length * 1e6, 2)},
+        "after": {"keystrokes": length, "seconds": round(timings["incremental"], 4),
+                  "us_per_keystroke": round(timings["incremental"] / length * 1e6, 2)},
+        "speedup": round(timings["rescan"] / timings["incremental"], 2),
+    }
+
+
+def bench_hash_scaling(logins=64, cost=None, threads=None):
+    """Compare concurrent login hashing in-process against the process pool"""
+    threads = threads or (os.cpu_count() or 1) * 2
+    timings = {}
+    for name, workers in (("single_process", 1), ("process_pool", os.cpu_count() or 1)):
+        hasher = PasswordHasher(cost=cost, workers=workers)
+        encoded = hasher.hash(BENCH_PASSWORD)  # Also warms up the pool
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda _: hasher.verify(BENCH_PASSWORD, encoded), range(logins)))
+        elapsed = time.perf_counter() - start
+        hasher.shutdown()
+        timings[name] = {
+            "workers": workers,
+            "logins": logins,
+            "logins_per_sec": round(logins / elapsed, 1),
+        }
+
+    return {
+        "benchmark": "hash_scaling",
+        "before": timings["single_process"],
+        "after": timings["process_pool"],
+        "speedup": round(timings["process_pool"]["logins_per_sec"]
+                         / timings["single_process"]["logins_per_sec"], 2),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+# ---------------------------------------------------------------------------
+# Startup suite
+# ---------------------------------------------------------------------------
+
+# Budget for what a scripted start adds on top of a bare interpreter: import
+# main, construct LoginSystem and open the database
+STARTUP_BUDGET_MS = 250
+
+STARTUP_SCRIPTS = {
+    "interpreter": "pass",
+    "import_logger": "import logger",
+    "import_main": "import main",
+    "login_system": "from main import LoginSystem; LoginSystem(interactive=False).db.close()",
+}
+
+
+def bench_startup(runs=10):
+    """Time fresh interpreters running each startup script (wall clock, milliseconds)"""
+    results = []
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=repo_dir)
+    with tempfile.TemporaryDirectory() as tmp:
+        # A scratch working directory keeps users.db and logs/ out of the repo;
+        # after the first run the database already exists, as for repeated scripts
+        for name, script in STARTUP_SCRIPTS.items():
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, "-c", script], cwd=tmp, env=env,
+                               check=True, capture_output=True)
+                samples.append((time.perf_counter() - start) * 1000)
+            samples.sort()
+            results.append({
+                "benchmark": f"startup_{name}",
+                "runs": runs,
+                "median_ms": round(samples[len(samples) // 2], 2),
+                "min_ms": round(samples[0], 2),
+                "max_ms": round(samples[-1], 2),
+            })
+
+        # In-process: the first UserDatabase checks the schema, later ones skip it
+        db_path = os.path.join(tmp, "startup.db")
+        samples = []
+        for _ in range(runs * 10):
+            start = time.perf_counter()
+            UserDatabase(db_path, hasher=FAST_HASHER).close()
+            samples.append((time.perf_counter() - start) * 1000)
+        repeat = sorted(samples[1:])
+        results.append({
+            "benchmark": "startup_user_database",
+            "runs": len(samples),
+            "first_ms": round(samples[0], 3),
+            "median_ms": round(repeat[len(repeat) // 2], 3),
+        })
+    return results
+
+
+def check_startup_budget(results, budget_ms=STARTUP_BUDGET_MS):
+    """Return an error message if scripted startup overhead exceeds the budget"""
+    # Only the startup results report median_ms; --suite all mixes in the others
+    medians = {r["benchmark"]: r["median_ms"] for r in results
+               if r.get("benchmark", "").startswith("startup_")}
+    if "startup_login_system" not in medians:
+        return None
+    overhead = medians["startup_login_system"] - medians["startup_interpreter"]
+    if overhead > budget_ms:
+        return (f"Startup regression: LoginSystem start adds {overhead:.1f} ms "
+                f"over a bare interpreter (budget {budget_ms} ms)")
+    return None
+
+
+def run_metadata():
+    """Describe the environment so runs can be compared over time"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_hot_paths(sizes, calls, hash_cost):
+    """Run the hot path suite for every database size"""
+    hasher = PasswordHasher(cost=hash_cost, workers=1) if hash_cost else None
+    results = []
+    for size in sizes:
+        results.extend(bench_database(size, calls, hasher))
+    results.extend(bench_password_policy(calls * 10))
+    results.extend(bench_rate_limiter(calls * 10))
+    results.extend(bench_logger(calls))
+    return results
+
+
+def run_comparisons(calls, users):
+    """Run the before/after optimization comparisons"""
+    return [
+        bench_connection_reuse(calls, users),
+        bench_bulk_create(users),
+        bench_sharded_writes(users),
+        bench_user_cache(calls, users),
+        bench_read_replica(calls, users),
+        bench_username_filter(calls, users),
+        bench_write_behind(calls, users),
+        bench_async_logging(calls, users),
+        bench_metrics_overhead(calls, users),
+        bench_policy_audit(),
+        bench_strength_meter(),
+        bench_hash_scaling(),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Login system benchmarks")
+    parser.add_argument("--suite", choices=["hotpaths", "comparisons", "startup", "all"],
+                        default="hotpaths",
+                        help="which benchmarks to run")
+    parser.add_argument("--sizes", default="1000,10000",
+                        help="comma-separated user counts for database benchmarks (up to 1000000)")
+    parser.add_argument("--calls", type=int, default=2000, help="calls per measurement")
+    parser.add_argument("--users", type=int, default=1000,
+                        help="users in the test database for comparisons")
+    parser.add_argument("--hash-cost", type=int, default=4,
+                        help="scrypt cost for database benchmarks (0 = configured cost)")
+    parser.add_argument("--startup-runs", type=int, default=10,
+                        help="interpreter starts per startup measurement")
+    parser.add_argument("--startup-budget-ms", type=float, default=STARTUP_BUDGET_MS,
+                        help="fail the startup suite above this overhead")
+    parser.add_argument("--output", help="append this run as one JSON line to a file")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    run = {"metadata": run_metadata(), "results": []}
+    if args.suite in ("hotpaths", "all"):
+        run["results"].extend(run_hot_paths(sizes, args.calls, args.hash_cost))
+    if args.suite in ("comparisons", "all"):
+        run["results"].extend(run_comparisons(args.calls, args.users))
+    if args.suite in ("startup", "all"):
+        run["results"].extend(bench_startup(args.startup_runs))
+
+    print(json.dumps(run, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(run) + "\n")
+
+    failure = check_startup_budget(run["results"], args.startup_budget_ms)
+    if failure:
+        print(failure, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
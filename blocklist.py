@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Compact on-disk index of common/breached passwords
+
+The index is built once from a plain word list (one password per line) and
+queried through mmap, so checking a password never loads the list into
+memory. Layout:
+
+    header   magic, bloom size in bits, hash count, entry count
+    bloom    Bloom filter bits; most safe passwords stop here
+    entries  sorted 8-byte BLAKE2b hashes, binary searched on a Bloom hit
+
+Usage:
+    python blocklist.py build common_passwords.txt blocklist.idx
+    python blocklist.py check blocklist.idx "Password1!"
+"""
+
+import argparse
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from config import BLOCKLIST_WORDLIST, BLOCKLIST_INDEX, ENABLE_PASSWORD_BLOCKLIST
+
+MAGIC = b"PWBLOCK1"
+HEADER = struct.Struct(">8sQIQ")
+ENTRY_SIZE = 8
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+
+def normalize(password):
+    """Blocklist matching ignores case and surrounding whitespace"""
+    return password.strip().lower()
+
+def password_key(password):
+    """Return the 8-byte hash stored in the index for a password"""
+    return hashlib.blake2b(normalize(password).encode(), digest_size=ENTRY_SIZE).digest()
+
+def _bloom_positions(key, bits, hashes):
+    """Derive the Bloom filter bit positions for a key by double hashing"""
+    value = int.from_bytes(key, "big")
+    h1 = value & 0xFFFFFFFF
+    h2 = (value >> 32) | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+def build_index(wordlist_path, index_path, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):
+    """Build an index file from a word list and return the number of entries"""
+    keys = array("Q")
+    with open(wordlist_path, encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            word = line.rstrip("\r\n")
+            if normalize(word):
+                keys.append(int.from_bytes(password_key(word), "big"))
+
+    # Sorted, de-duplicated hashes for the binary search
+    unique = sorted(set(keys))
+    del keys
+    count = len(unique)
+
+    bits = max(8, int(math.ceil(-count * math.log(false_positive_rate) / math.log(2) ** 2)))
+    hashes = max(1, int(round(bits / max(count, 1) * math.log(2))))
+    bloom = bytearray((bits + 7) // 8)
+    for value in unique:
+        for position in _bloom_positions(value.to_bytes(ENTRY_SIZE, "big"), bits, hashes):
+            bloom[position >> 3] |= 1 << (position & 7)
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, bits, hashes, count))
+        f.write(bloom)
+        entries = array("Q", unique)
+        if sys.byteorder == "little":
+            entries.byteswap()  # Store big-endian so byte order matches numeric order
+        entries.tofile(f)
+    os.replace(tmp_path, index_path)
+    return count
+
+
+class PasswordBlocklist:
+    def __init__(self, index_path):
+        """Open an index file for memory-mapped queries"""
+        self.index_path = index_path
+        self._file = open(index_path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.bits, self.hashes, self.count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not a password blocklist index: {index_path}")
+        self._bloom_offset = HEADER.size
+        self._entries_offset = self._bloom_offset + (self.bits + 7) // 8
+
+    def __contains__(self, password):
+        """Return True if the password is on the blocklist"""
+        key = password_key(password)
+        mm = self._mm
+        bloom = self._bloom_offset
+        for position in _bloom_positions(key, self.bits, self.hashes):
+            if not mm[bloom + (position >> 3)] & (1 << (position & 7)):
+                return False
+
+        # Possible hit: confirm against the sorted entries
+        low, high = 0, self.count
+        base = self._entries_offset
+        while low < high:
+            middle = (low + high) // 2
+            offset = base + middle * ENTRY_SIZE
+            entry = mm[offset:offset + ENTRY_SIZE]
+            if entry < key:
+                low = middle + 1
+            elif entry > key:
+                high = middle
+            else:
+                return True
+        return False
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """Release the memory map and file handle"""
+        self._mm.close()
+        self._file.close()
+
+_default_blocklist = None
+_default_lock = threading.Lock()
+
+def default_blocklist():
+    """Return the configured blocklist, building its index from the word list if
+    it is missing or stale; None if the blocklist is disabled or unavailable"""
+    global _default_blocklist
+    if not ENABLE_PASSWORD_BLOCKLIST:
+        return None
+    with _default_lock:
+        if _default_blocklist is None:
+            try:
+                if os.path.exists(BLOCKLIST_WORDLIST) and (
+                    not os.path.exists(BLOCKLIST_INDEX) or
+                    os.path.getmtime(BLOCKLIST_INDEX) < os.path.getmtime(BLOCKLIST_WORDLIST)
+                ):
+                    build_index(BLOCKLIST_WORDLIST, BLOCKLIST_INDEX)
+                if os.path.exists(BLOCKLIST_INDEX):
+                    _default_blocklist = PasswordBlocklist(BLOCKLIST_INDEX)
+            except (OSError, ValueError):
+                return None
+        return _default_blocklist
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Password blocklist index tool")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="build an index from a word list")
+    build.add_argument("wordlist")
+    build.add_argument("index")
+    build.add_argument("--fp-rate", type=float, default=DEFAULT_FALSE_POSITIVE_RATE,
+                       help="Bloom filter false positive rate")
+
+    check = subparsers.add_parser("check", help="check passwords against an index")
+    check.add_argument("index")
+    check.add_argument("passwords", nargs="+")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        count = build_index(args.wordlist, args.index, args.fp_rate)
+        print(f"Indexed {count} passwords into {args.index}")
+    else:
+        blocklist = PasswordBlocklist(args.index)
+        for password in args.passwords:
+            status = "BLOCKED" if password in blocklist else "ok"
+            print(f"{status}\t{password}")
+        blocklist.close()
+
+
+if __name__ == "__main__":
+    main()
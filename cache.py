@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=30, clock=time.monotonic):
+        """Thread-safe LRU cache whose entries also expire after ttl seconds"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()  # key -> (expires_at, value), least recent first
+        self._lock = threading.Lock()
+        self._loads = {}  # key -> [loads in flight, generation bumped by invalidate()]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Return the cached value, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            if entry[0] <= self.clock():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (self.clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Read-through lookup: call loader() on a miss and cache its result.
+
+        If the key is invalidated while loader() runs, the result may predate
+        the change: it is returned but not cached.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            load = self._loads.setdefault(key, [0, 0])  # [loads in flight, generation]
+            load[0] += 1
+            generation = load[1]
+        try:
+            value = loader()
+        finally:
+            with self._lock:
+                load[0] -= 1
+                if not load[0]:
+                    del self._loads[key]
+        with self._lock:
+            if load[1] == generation:
+                self._store(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            load = self._loads.get(key)
+            if load is not None:
+                load[1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            for load in self._loads.values():
+                load[1] += 1
+
+    def stats(self):
+        """Hit/miss counters for sizing the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self):
+        return len(self._data)
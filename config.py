@@ -2,24 +2,86 @@
 
 # Database settings
 DATABASE_NAME = "users.db"
+DB_JOURNAL_MODE = "WAL"         # WAL lets readers run alongside the writer
+DB_SYNCHRONOUS = "NORMAL"       # Safe with WAL, far fewer fsyncs than FULL
+DB_BUSY_TIMEOUT_MS = 5000       # Wait this long for a locked database
+DB_STATEMENT_CACHE_SIZE = 128   # Prepared statements cached per connection
+BULK_INSERT_CHUNK_SIZE = 500    # Rows per transaction in create_users_bulk
+TRANSFER_BATCH_SIZE = 5000      # Rows per page when exporting users
+
+# Buffer last_login updates in memory and write them in batches
+LAST_LOGIN_WRITE_BEHIND = False
+LAST_LOGIN_FLUSH_INTERVAL_SECONDS = 5
+LAST_LOGIN_FLUSH_THRESHOLD = 100  # Flush early once this many logins are pending
+
+# Read-through cache for user_exists/get_user_info (0 disables it)
+USER_CACHE_SIZE = 1024          # Max cached lookups
+USER_CACHE_TTL_SECONDS = 30     # Bounds staleness from writes made by other processes
+
+# Bloom filter of usernames so user_exists skips SQLite for names that are free.
+# Saved next to the database as <db_name>.usernames and caught up at startup.
+ENABLE_USERNAME_FILTER = True
+USERNAME_FILTER_FP_RATE = 0.01
+USERNAME_FILTER_MIN_CAPACITY = 10000
+USERNAME_FILTER_SYNC_SECONDS = 1.0  # "Not taken" answers older than this re-read new users first
+
+# In-memory copy of the users table for verify_user/get_user_info/user_exists.
+# Writes from this process update it at once; a periodic refresh picks up
+# changes made by other processes, so a password changed elsewhere keeps
+# working here for up to READ_REPLICA_REFRESH_SECONDS. Refreshes are skipped
+# while no other connection has written to the database.
+ENABLE_READ_REPLICA = False
+READ_REPLICA_REFRESH_SECONDS = 5   # 0 disables the background refresh
+READ_REPLICA_MAX_ABSENT = 100000   # Unknown usernames remembered without a username filter
+
+# Password hashing
+PASSWORD_HASH_ALGORITHM = "scrypt"  # "scrypt" or "pbkdf2_sha256"
+SCRYPT_COST = 14                    # scrypt N = 2 ** SCRYPT_COST
+PBKDF2_ITERATIONS = 600000
+HASH_WORKERS = None                 # Hashing processes; None = one per CPU core
 
 # Security settings
 MIN_PASSWORD_LENGTH = 8
 MAX_LOGIN_ATTEMPTS = 3
+MAX_FAILURES_PER_SOURCE = 20       # Failed logins from one source (IP) before it is locked
+LOCKOUT_WINDOW_MINUTES = 15        # Failures older than this are forgotten
+LOCKOUT_DURATION_MINUTES = 15
+LOCKOUT_FLUSH_INTERVAL_SECONDS = 10
 REQUIRE_SPECIAL_CHARS = True
 REQUIRE_NUMBERS = True
 REQUIRE_UPPERCASE = True
 REQUIRE_LOWERCASE = True
 
+# Token-bucket rate limits checked before any hashing or SQL:
+# (tokens per second, burst) for each bucket family. Source families are
+# skipped for requests without a client address (local front ends).
+RATE_LIMITS = {
+    "login_source": (5.0, 30),      # Login attempts per IP
+    "login_user": (1.0, 10),        # Login attempts per username
+    "register_source": (0.2, 10),   # Registrations per IP
+}
+RATE_LIMIT_MAX_KEYS = 100000        # Buckets kept per family; least recently used go first
+RATE_LIMIT_SHARED_PATH = None       # e.g. "/dev/shm/login-ratelimit" to share limits
+                                    # between worker processes (POSIX only)
+RATE_LIMIT_SHARED_SLOTS = 65536     # Fixed bucket slots per family in the shared file
+
+# Common/breached password blocklist (index is rebuilt when the word list changes)
+ENABLE_PASSWORD_BLOCKLIST = True
+BLOCKLIST_WORDLIST = "common_passwords.txt"
+BLOCKLIST_INDEX = "blocklist.idx"
+
 # Session settings
 SESSION_TIMEOUT_MINUTES = 30
 AUTO_LOGOUT_WARNING_MINUTES = 5
+SESSION_SLIDING_RENEWAL = True  # Activity extends the session timeout
+SESSION_PERSISTENCE = False  # Keep sessions in the users database across restarts
 
 # System messages
 MESSAGES = {
     "welcome": "Welcome to the Secure Login System!",
     "goodbye": "Thank you for using our system. Goodbye!",
     "access_denied": "Access denied. Maximum login attempts exceeded.",
+    "account_locked": "Account temporarily locked due to too many failed attempts. Try again later.",
     "session_expired": "Your session has expired. Please login again.",
     "registration_success": "Registration successful! You can now login.",
     "login_success": "Login successful! Welcome back.",
@@ -28,18 +90,65 @@ MESSAGES = {
     "username_exists": "Username already exists. Please choose another.",
     "passwords_no_match": "Passwords do not match. Please try again.",
     "weak_password": "Password does not meet security requirements.",
+    "password_reused": "You have used this password recently. Please choose a different one.",
+    "rate_limited": "Too many attempts. Please wait a moment and try again.",
 }
 
 # Console formatting
 HEADER_WIDTH = 50
 SEPARATOR = "=" * HEADER_WIDTH
 
+# GUI: blocking database/hashing calls run on this many worker threads
+GUI_WORKER_THREADS = 4
+GUI_POLL_INTERVAL_MS = 20       # How often the Tk thread collects finished calls
+STRENGTH_METER_DEBOUNCE_MS = 150  # Redraw the strength meter once typing pauses
+
+# Local auth server (auth_server.py): line-delimited JSON over TCP
+AUTH_SERVER_HOST = "127.0.0.1"
+AUTH_SERVER_PORT = 8765
+AUTH_SERVER_WORKERS = 8           # Threads running hashing and database calls
+AUTH_SERVER_MAX_PENDING = 256     # In-flight requests across all connections
+AUTH_SERVER_PIPELINE_DEPTH = 32   # Unanswered requests read ahead per connection
+AUTH_SERVER_MAX_LINE_BYTES = 65536
+AUTH_SERVER_DRAIN_SECONDS = 10    # Time given to in-flight requests on shutdown
+AUTH_SERVER_TRUSTED_PROXIES = ()  # Front ends whose relayed "ip" is trusted, e.g. ("127.0.0.1",)
+
+# Metrics (metrics.py): per-thread counters and latency histograms in
+# Prometheus text format, served over HTTP and/or written to a file
+ENABLE_METRICS = False
+METRICS_LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005,
+                           0.01, 0.05, 0.1, 0.5, 1.0, 5.0)  # Seconds
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = None                # e.g. 9464 to serve GET /metrics
+METRICS_FILE = None                # e.g. "login.prom" for a textfile collector
+METRICS_FILE_INTERVAL_SECONDS = 15
+
 # Logging settings
 LOG_FILE = "system.log"
 LOG_LEVEL = "INFO"  # DEBUG, INFO, WARNING, ERROR, CRITICAL
+LOG_ASYNC = False             # Write log records from a background thread
+LOG_QUEUE_SIZE = 10000        # Records buffered in async mode
+LOG_OVERFLOW_POLICY = "block" # When the queue is full: "block", "drop" or "sample"
+LOG_SAMPLE_RATE = 10          # "sample" keeps 1 in N overflowing INFO/DEBUG records
+LOG_BATCH_SIZE = 256          # Records written per flush by the background thread
+
+# Structured audit log (JSON lines + per-user index), alongside the text log
+ENABLE_AUDIT_LOG = True
+AUDIT_LOG_DIR = "logs/audit"
+AUDIT_SEGMENT_MAX_BYTES = 64 * 1024 * 1024  # Rotate segments at this size...
+AUDIT_SEGMENT_MAX_SECONDS = 24 * 60 * 60    # ...or after this long
+AUDIT_INDEX_BUCKET_SECONDS = 60 * 60        # Time granularity of the per-user index
+AUDIT_ASYNC = True                          # Write events from a background thread
+AUDIT_QUEUE_SIZE = 10000                    # Events buffered before record() waits
+AUDIT_BATCH_SIZE = 256                      # Events written per flush
+AUDIT_INDEX_CHECKPOINT_SECONDS = 5          # Rewrite the open segment's index this often
+AUDIT_RETENTION_DAYS = 365                  # Delete closed segments older than this...
+AUDIT_MAX_SEGMENTS = 1000                   # ...and the oldest beyond this many
 
 # Feature flags
 ENABLE_LOGGING = True
 ENABLE_PASSWORD_HISTORY = False  # Prevent reusing last N passwords
+PASSWORD_HISTORY_SIZE = 5        # N: previous passwords remembered per user
 ENABLE_ACCOUNT_LOCKOUT = True    # Lock account after failed attempts
+ENABLE_RATE_LIMIT = True         # Throttle logins/registrations per IP and username
 ENABLE_PASSWORD_EXPIRY = False   # Force password change after N days
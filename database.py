@@ -1,87 +1,627 @@
+import os
 import sqlite3
-import hashlib
-from datetime import datetime
+import threading
+import time
+import atexit
+from datetime import datetime, timezone
+from itertools import islice
+from config import (
+    DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_BUSY_TIMEOUT_MS, DB_STATEMENT_CACHE_SIZE,
+    BULK_INSERT_CHUNK_SIZE, LAST_LOGIN_WRITE_BEHIND, LAST_LOGIN_FLUSH_INTERVAL_SECONDS,
+    LAST_LOGIN_FLUSH_THRESHOLD, ENABLE_ACCOUNT_LOCKOUT, MESSAGES, USER_CACHE_SIZE,
+    USER_CACHE_TTL_SECONDS, ENABLE_USERNAME_FILTER, USERNAME_FILTER_FP_RATE,
+    USERNAME_FILTER_MIN_CAPACITY, USERNAME_FILTER_SYNC_SECONDS, TRANSFER_BATCH_SIZE, ENABLE_PASSWORD_HISTORY,
+    ENABLE_READ_REPLICA, ENABLE_RATE_LIMIT
+)
+from cache import LRUCache
+from hashing import hasher as default_hasher
+from lockout import LockoutManager
+from logger import logger
+from metrics import metrics
+from password_history import PasswordHistory
+from ratelimit import RateLimiter
+from replica import ReadReplica
+from username_filter import UsernameFilter
+
+# Bump SCHEMA_VERSION whenever SCHEMA changes; it is stored in PRAGMA user_version
+SCHEMA_VERSION = 2
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_login TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS login_failures (
+        key TEXT PRIMARY KEY,
+        failures TEXT NOT NULL,
+        locked_until REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS sessions (
+        token_hash TEXT PRIMARY KEY,
+        username TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS password_history (
+        user_id INTEGER NOT NULL,
+        slot INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        password_hash TEXT NOT NULL,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, slot)
+    ) WITHOUT ROWID
+    ''',
+)
+
+def _timestamp():
+    """Now, in the same format and UTC clock as SQLite's CURRENT_TIMESTAMP"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+# Database files whose schema this process has already checked
+_schema_checked = set()
+_schema_lock = threading.Lock()
 
 class UserDatabase:
-    def __init__(self, db_name="users.db"):
-        """Initialize database connection and create tables if they don't exist"""
+    def __init__(self, db_name="users.db", write_behind=LAST_LOGIN_WRITE_BEHIND, hasher=None,
+                 lockout=None, rate_limiter=None):
+        """Initialize database connection and create tables if they don't exist.
+
+        lockout and rate_limiter share another database's instances (as
+        shards do); they are then left for that database to flush and close.
+        """
         self.db_name = db_name
+        self.hasher = hasher or default_hasher
+        # Read-through cache for user_exists/get_user_info, keyed by (kind, username)
+        self.cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.init_database()
-    
+        self._owns_lockout = lockout is None
+        self._owns_rate_limiter = rate_limiter is None
+        if lockout is None and ENABLE_ACCOUNT_LOCKOUT:
+            lockout = LockoutManager(db=self)
+        if rate_limiter is None and ENABLE_RATE_LIMIT:
+            rate_limiter = RateLimiter()
+        self.lockout = lockout
+        self.rate_limiter = rate_limiter
+        self.history = PasswordHistory(self) if ENABLE_PASSWORD_HISTORY else None
+        # In-memory users table serving the login read path
+        self.replica = ReadReplica(self) if ENABLE_READ_REPLICA else None
+
+        # Bloom filter of usernames; a miss means the name is definitely free
+        self.username_filter_path = f"{db_name}.usernames"
+        self._filter_lock = threading.Lock()
+        self._filter_synced = 0.0  # time.monotonic() of the last catch-up with the table
+        self.username_filter = self.load_username_filter() if ENABLE_USERNAME_FILTER else None
+
+        # Write-behind buffer for last_login updates (username -> timestamp)
+        self.write_behind = write_behind
+        self._pending_logins = {}
+        self._pending_lock = threading.Lock()
+        self._flush_wakeup = threading.Event()
+        self._stop_flusher = threading.Event()
+        self._flusher = None
+        if write_behind:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="last-login-flusher", daemon=True
+            )
+            self._flusher.start()
+            atexit.register(self.flush_last_logins)
+
+    def get_connection(self):
+        """Return this thread's connection, opening and tuning it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            started = time.perf_counter()
+            conn = sqlite3.connect(
+                self.db_name,
+                timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                cached_statements=DB_STATEMENT_CACHE_SIZE,
+                check_same_thread=False,  # Only so close() can run from any thread
+            )
+            conn.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}")
+            conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+            conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+            if metrics.enabled:
+                elapsed = time.perf_counter() - started
+                metrics.observe("userdb_connect_seconds", elapsed)
+                metrics.add_phase("connect", elapsed)
+        return conn
+
+    def close(self):
+        """Flush buffered writes and close every connection opened by this object"""
+        if self._flusher is not None:
+            self._stop_flusher.set()
+            self._flush_wakeup.set()
+            self._flusher.join()
+            self._flusher = None
+            atexit.unregister(self.flush_last_logins)
+        # Run every step even if an earlier one fails; report the first failure
+        steps = [self.flush_last_logins]
+        if self.replica is not None:
+            steps.append(self.replica.close)
+        if self.lockout is not None and self._owns_lockout:
+            steps.append(self.lockout.flush)
+        if self.rate_limiter is not None and self._owns_rate_limiter:
+            steps.append(self.rate_limiter.close)
+        if self.username_filter is not None:
+            steps.append(self.save_username_filter)
+        errors = []
+        try:
+            for step in steps:
+                try:
+                    step()
+                except Exception as e:
+                    errors.append(e)
+        finally:
+            # Even if a final write failed, don't leak the connections
+            with self._connections_lock:
+                connections, self._connections = self._connections, []
+            for conn in connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._local = threading.local()
+        for error in errors[1:]:
+            logger.log_system_error(str(error), "database close")
+        if errors:
+            raise errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def init_database(self):
-        """Create the users table if it doesn't exist"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_login TIMESTAMP
-                )
-            ''')
-            conn.commit()
-    
+        """Bring the schema up to SCHEMA_VERSION; checked once per file per process"""
+        path = os.path.abspath(self.db_name) if self.db_name != ":memory:" else None
+        # A file that no longer exists was deleted since the check and must be redone
+        if path in _schema_checked and os.path.exists(path):
+            return
+        conn = self.get_connection()
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for statement in SCHEMA:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if path is not None:
+            with _schema_lock:
+                _schema_checked.add(path)
+
     def hash_password(self, password):
-        """Hash password using SHA-256 for security"""
-        return hashlib.sha256(password.encode()).hexdigest()
-    
-    def create_user(self, username, password):
-        """Create a new user in the database"""
+        """Hash password with a salted, cost-tunable KDF"""
+        return self.hasher.hash(password)
+
+    @metrics.call("create_user")
+    def create_user(self, username, password, source=None):
+        """Create a new user in the database; source (e.g. an IP address) is rate limited"""
+        if self.rate_limiter is not None and not self.rate_limiter.allow_registration(source):
+            return False, MESSAGES["rate_limited"]
         try:
-            with sqlite3.connect(self.db_name) as conn:
+            conn = self.get_connection()
+            with conn:
                 cursor = conn.cursor()
                 password_hash = self.hash_password(password)
                 cursor.execute(
                     "INSERT INTO users (username, password_hash) VALUES (?, ?)",
                     (username, password_hash)
                 )
-                conn.commit()
-                return True, "User created successfully!"
-        except sqlite3.IntegrityError:
+            self.invalidate_user(username)
+            if self.replica is not None:
+                self.replica.reload([username])
+            self._add_to_filter([username])
+            return True, "User created successfully!"
+        except sqlite3.IntegrityError as e:
+            if "UNIQUE" not in str(e):
+                return False, f"Error creating user: {str(e)}"
+            # Created by another process since our filter was caught up
+            self._add_to_filter([username])
             return False, "Username already exists!"
         except Exception as e:
             return False, f"Error creating user: {str(e)}"
-    
-    def verify_user(self, username, password):
-        """Verify user credentials"""
+
+    def hash_passwords(self, passwords):
+        """Hash a batch of passwords in parallel, returning hashes in the same order"""
+        return self.hasher.hash_many(passwords)
+
+    @metrics.call("create_users_bulk")
+    def create_users_bulk(self, users, chunk_size=BULK_INSERT_CHUNK_SIZE):
+        """Create many users from an iterable of (username, password) pairs.
+
+        Pairs are consumed lazily and written in one transaction per chunk.
+        Returns a list of (username, success, message) tuples in input order;
+        duplicates are reported per row instead of aborting the batch.
+        """
+        results = []
+        users = iter(users)
+        while True:
+            chunk = list(islice(users, chunk_size))
+            if not chunk:
+                break
+            results.extend(self._create_users_chunk(chunk))
+        return results
+
+    def _create_users_chunk(self, chunk):
+        """Hash and insert one chunk of new users"""
+        usernames = [username for username, _ in chunk]
+        hashes = self.hash_passwords(password for _, password in chunk)
+        return self.insert_users_chunk(
+            (username, password_hash, None, None)
+            for username, password_hash in zip(usernames, hashes)
+        )
+
+    @metrics.call("insert_users_chunk")
+    def insert_users_chunk(self, rows):
+        """Insert already-hashed users inside a single write transaction.
+
+        rows are (username, password_hash, created_at, last_login) tuples;
+        a created_at of None means now. Returns (username, success, message)
+        tuples in input order; existing usernames are reported, not raised.
+        """
+        rows = list(rows)
+        if not rows:
+            return []
+        usernames = [row[0] for row in rows]
         try:
-            with sqlite3.connect(self.db_name) as conn:
+            conn = self.get_connection()
+            with conn:
+                # Take the write lock up front so the duplicate check stays valid
+                conn.execute("BEGIN IMMEDIATE")
+                distinct = list(set(usernames))
+                placeholders = ",".join("?" * len(distinct))
+                cursor = conn.execute(
+                    f"SELECT username FROM users WHERE username IN ({placeholders})",
+                    distinct
+                )
+                taken = {row[0] for row in cursor}
+
+                new_rows, results = [], []
+                for row in rows:
+                    username = row[0]
+                    if username in taken:
+                        results.append((username, False, "Username already exists!"))
+                    else:
+                        taken.add(username)
+                        new_rows.append(row)
+                        results.append((username, True, "User created successfully!"))
+
+                conn.executemany(
+                    "INSERT INTO users (username, password_hash, created_at, last_login) "
+                    "VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)", new_rows
+                )
+            for row in new_rows:
+                self.invalidate_user(row[0])
+            if self.replica is not None:
+                self.replica.reload(row[0] for row in new_rows)
+            self._add_to_filter([row[0] for row in new_rows])
+            return results
+        except Exception as e:
+            return [(username, False, f"Error creating user: {str(e)}")
+                    for username in usernames]
+
+    def iter_users(self, after_id=0, batch_size=TRANSFER_BATCH_SIZE):
+        """Yield (id, username, password_hash, created_at, last_login) rows in id order.
+
+        Reads one keyset page (id > last seen id) at a time, so memory stays
+        flat and no read transaction stays open across the whole table.
+        """
+        conn = self.get_connection()
+        while True:
+            rows = conn.execute(
+                "SELECT id, username, password_hash, created_at, last_login FROM users "
+                "WHERE id > ? ORDER BY id LIMIT ?", (after_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            after_id = rows[-1][0]
+
+    @metrics.call("verify_user")
+    def verify_user(self, username, password, source=None):
+        """Verify user credentials; source (e.g. an IP address) feeds the lockout counters"""
+        if self.rate_limiter is not None and not self.rate_limiter.allow_login(username, source):
+            # Floods stop here, before any SQL or hashing
+            return False, MESSAGES["rate_limited"]
+        if self.lockout is not None and self.lockout.is_locked(username, source):
+            # Rejected before any SQL or hashing, so attack traffic stays cheap
+            return False, MESSAGES["account_locked"]
+        try:
+            conn = self.get_connection()
+            if self.replica is not None:
+                row = self.replica.get(username)
+                result = row[:2] if row else None
+            else:
                 cursor = conn.cursor()
-                password_hash = self.hash_password(password)
                 cursor.execute(
-                    "SELECT id FROM users WHERE username = ? AND password_hash = ?",
-                    (username, password_hash)
+                    "SELECT id, password_hash FROM users WHERE username = ?",
+                    (username,)
                 )
                 result = cursor.fetchone()
-                
-                if result:
-                    # Update last login time
-                    cursor.execute(
-                        "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE username = ?",
-                        (username,)
+
+            if not result:
+                # Do the same hashing work so unknown usernames aren't revealed by timing.
+                # Only the source is counted: a lockout row per made-up name would grow forever.
+                self.hasher.verify_dummy(password)
+                return self._login_failed(None, source)
+
+            user_id, stored_hash = result
+            if not self.hasher.verify(password, stored_hash):
+                return self._login_failed(username, source)
+
+            if self.lockout is not None:
+                self.lockout.record_success(username)
+
+            if self.hasher.needs_rehash(stored_hash):
+                # Upgrade legacy SHA-256 or outdated KDF rows now that we know the password
+                with conn:
+                    conn.execute(
+                        "UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                        (self.hash_password(password), user_id, stored_hash)
                     )
-                    conn.commit()
-                    return True, "Login successful!"
-                else:
-                    return False, "Invalid username or password!"
+                if self.replica is not None:
+                    self.replica.reload([username])
+
+            if self.write_behind:
+                self._record_login(username)
+            else:
+                # Update last login time
+                now = _timestamp()
+                with conn:
+                    conn.execute("UPDATE users SET last_login = ? WHERE id = ?", (now, user_id))
+                if self.replica is not None:
+                    self.replica.set_last_login({username: now})
+                self.cache.invalidate(("info", username))
+            return True, "Login successful!"
         except Exception as e:
             return False, f"Error during login: {str(e)}"
-    
+
+    @metrics.call("update_password")
+    def update_password(self, username, old_password, new_password):
+        """Change a password if old_password is correct.
+
+        The new hash is computed first; the write is a compare-and-swap on
+        the hash that was verified, so of several concurrent changes only
+        one can win and none is silently overwritten. The replaced hash
+        goes into the password history in the same transaction. Returns
+        (success, message).
+        """
+        if self.lockout is not None and self.lockout.is_locked(username):
+            return False, MESSAGES["account_locked"]
+        try:
+            conn = self.get_connection()
+            row = conn.execute(
+                "SELECT id, password_hash FROM users WHERE username = ?", (username,)
+            ).fetchone()
+            if not row:
+                self.hasher.verify_dummy(old_password)
+                return False, "Current password is incorrect!"
+
+            user_id, stored_hash = row
+            if not self.hasher.verify(old_password, stored_hash):
+                if self.lockout is not None and self.lockout.record_failure(username):
+                    return False, MESSAGES["account_locked"]
+                return False, "Current password is incorrect!"
+            if self.history is not None and self.history.is_reused(username, new_password):
+                return False, MESSAGES["password_reused"]
+
+            new_hash = self.hash_password(new_password)
+            with conn:
+                cursor = conn.execute(
+                    "UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                    (new_hash, user_id, stored_hash)
+                )
+                if cursor.rowcount == 0:
+                    return False, "Password was changed by another session. Please try again."
+                if self.history is not None:
+                    self.history.remember(conn, user_id, stored_hash)
+            self.invalidate_user(username)
+            if self.replica is not None:
+                self.replica.reload([username])
+            return True, MESSAGES["password_changed"]
+        except Exception as e:
+            return False, f"Error changing password: {str(e)}"
+
+    def _login_failed(self, username, source):
+        """Count a failed login and build the response"""
+        if self.lockout is not None and self.lockout.record_failure(username, source):
+            return False, MESSAGES["account_locked"]
+        return False, "Invalid username or password!"
+
+    def _record_login(self, username):
+        """Buffer a last_login timestamp, waking the flusher past the threshold"""
+        with self._pending_lock:
+            self._pending_logins[username] = _timestamp()
+            pending = len(self._pending_logins)
+        if pending >= LAST_LOGIN_FLUSH_THRESHOLD:
+            self._flush_wakeup.set()
+
+    def _flush_loop(self):
+        """Background thread: flush buffered logins on an interval or when woken"""
+        while not self._stop_flusher.is_set():
+            self._flush_wakeup.wait(LAST_LOGIN_FLUSH_INTERVAL_SECONDS)
+            self._flush_wakeup.clear()
+            try:
+                self.flush_last_logins()
+            except sqlite3.Error as e:
+                # The batch was put back; keep the thread alive and retry next tick
+                logger.log_system_error(str(e), "last_login flush")
+
+    @metrics.call("flush_last_logins")
+    def flush_last_logins(self):
+        """Write all buffered last_login timestamps in one batched UPDATE"""
+        with self._pending_lock:
+            if not self._pending_logins:
+                return 0
+            pending, self._pending_logins = self._pending_logins, {}
+        try:
+            conn = self.get_connection()
+            with conn:
+                conn.executemany(
+                    "UPDATE users SET last_login = ? WHERE username = ?",
+                    [(timestamp, username) for username, timestamp in pending.items()]
+                )
+        except sqlite3.Error:
+            # Put the batch back so a later flush can retry it, keeping newer logins
+            with self._pending_lock:
+                pending.update(self._pending_logins)
+                self._pending_logins = pending
+            raise
+        # Cached rows predate these timestamps and the pending overlay is gone now.
+        # Update the replica first so a reload after the invalidation sees them.
+        if self.replica is not None:
+            self.replica.set_last_login(pending)
+        for username in pending:
+            self.cache.invalidate(("info", username))
+        return len(pending)
+
+    @metrics.call("is_password_reused")
+    def is_password_reused(self, username, password):
+        """Return True if password history is enabled and the password is the
+        current one or one of the last PASSWORD_HISTORY_SIZE"""
+        if self.history is None:
+            return False
+        return self.history.is_reused(username, password)
+
+    @metrics.call("user_exists")
     def user_exists(self, username):
         """Check if username already exists"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-            return cursor.fetchone() is not None
-    
+        if self.filter_rules_out(username):
+            return False
+        return self.cache.get_or_load(("exists", username),
+                                      lambda: self._load_exists(username))
+
+    def filter_rules_out(self, username):
+        """True if the username filter says the name is free.
+
+        Other processes may have registered users since the filter last
+        caught up with the table; a negative answer is only trusted for
+        USERNAME_FILTER_SYNC_SECONDS before new rows are read in again.
+        """
+        username_filter = self.username_filter
+        if username_filter is None or username in username_filter:
+            return False
+        if time.monotonic() - self._filter_synced < USERNAME_FILTER_SYNC_SECONDS:
+            return True
+        self._catch_up_filter(username_filter, recount=False)
+        return username not in username_filter
+
+    def _load_exists(self, username):
+        if self.replica is not None:
+            return self.replica.get(username) is not None
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
+        return cursor.fetchone() is not None
+
+    @metrics.call("get_user_info")
     def get_user_info(self, username):
         """Get user information"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT username, created_at, last_login FROM users WHERE username = ?",
-                (username,)
-            )
-            return cursor.fetchone()
+        row = self.cache.get_or_load(("info", username), lambda: self._load_info(username))
+        if row and self.write_behind:
+            with self._pending_lock:
+                pending = self._pending_logins.get(username)
+            if pending:
+                row = (row[0], row[1], pending)
+        return row
+
+    def _load_info(self, username):
+        if self.replica is not None:
+            row = self.replica.get(username)
+            return (username, row[2], row[3]) if row else None
+        cursor = self.get_connection().cursor()
+        cursor.execute(
+            "SELECT username, created_at, last_login FROM users WHERE username = ?",
+            (username,)
+        )
+        return cursor.fetchone()
+
+    def invalidate_user(self, username):
+        """Drop cached lookups for a user after a write"""
+        self.cache.invalidate(("exists", username))
+        self.cache.invalidate(("info", username))
+
+    def load_username_filter(self):
+        """Load the saved username filter and add users created since it was saved,
+        rebuilding from the users table if it is missing, stale or too small"""
+        conn = self.get_connection()
+        max_id, total = conn.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM users").fetchone()
+        try:
+            username_filter = UsernameFilter.load(self.username_filter_path)
+        except (OSError, ValueError):
+            return self.rebuild_username_filter()
+        if username_filter.max_id > max_id or total > username_filter.capacity:
+            # Snapshot of a different/recreated database, or outgrown
+            return self.rebuild_username_filter()
+        self._catch_up_filter(username_filter)
+        return username_filter
+
+    def rebuild_username_filter(self):
+        """Build a fresh username filter from the users table and save it"""
+        conn = self.get_connection()
+        total = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        # Leave room to grow before the next rebuild
+        username_filter = UsernameFilter(max(USERNAME_FILTER_MIN_CAPACITY, total * 2),
+                                         USERNAME_FILTER_FP_RATE)
+        self._catch_up_filter(username_filter)
+        with self._filter_lock:
+            self.username_filter = username_filter
+        self.save_username_filter()
+        return username_filter
+
+    def _catch_up_filter(self, username_filter, recount=True):
+        """Add every user with an id above the filter's max_id.
+
+        Ids only grow, so this picks up users registered by any process.
+        recount=False skips the COUNT(*) scan for the frequent catch-ups.
+        """
+        conn = self.get_connection()
+        self._filter_synced = time.monotonic()
+        cursor = conn.execute(
+            "SELECT id, username FROM users WHERE id > ? ORDER BY id", (username_filter.max_id,)
+        )
+        with self._filter_lock:
+            for user_id, username in cursor:
+                username_filter.add(username)
+                username_filter.max_id = user_id
+            if recount:
+                username_filter.count = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def save_username_filter(self):
+        """Catch the filter up with the table and write it next to the database"""
+        username_filter = self.username_filter
+        if username_filter is None or not username_filter.dirty or self.db_name == ":memory:":
+            return
+        self._catch_up_filter(username_filter)
+        with self._filter_lock:
+            username_filter.save(self.username_filter_path)
+
+    def _add_to_filter(self, usernames):
+        """Record new usernames, growing the filter once it passes its capacity"""
+        username_filter = self.username_filter
+        if username_filter is None:
+            return
+        with self._filter_lock:
+            for username in usernames:
+                username_filter.add(username)
+            full = username_filter.is_full()
+        if full:
+            self.rebuild_username_filter()
+
+    def cache_stats(self):
+        """Hit/miss counters of the user lookup cache"""
+        return self.cache.stats()
@@ -0,0 +1,94 @@
+import queue
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import GUI_WORKER_THREADS, GUI_POLL_INTERVAL_MS
+from logger import logger
+
+
+class TaskDispatcher:
+    def __init__(self, schedule, workers=GUI_WORKER_THREADS, poll_ms=GUI_POLL_INTERVAL_MS,
+                 on_poll=None, clock=time.perf_counter):
+        """Run blocking calls (hashing, SQLite) on worker threads and hand the
+        results back on the UI thread.
+
+        schedule(delay_ms, callback) must run callback on the UI thread later,
+        e.g. Tk's root.after. Workers never touch the UI: they put finished
+        calls on a queue that the UI thread drains every poll_ms while work is
+        pending. on_poll() runs on the UI thread after every drain, so a
+        status display can track pending work.
+        """
+        self.schedule = schedule
+        self.poll_ms = poll_ms
+        self.on_poll = on_poll
+        self.clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ui-worker")
+        self._done = queue.SimpleQueue()
+        self._started = {}  # request id -> start time, for requests still pending
+        self._next_id = 0
+        self._polling = False
+        self.latencies = deque(maxlen=50)  # Seconds, most recent last
+
+    def submit(self, func, *args, on_done=None, on_error=None):
+        """Call func(*args) on a worker; then on_done(result) or on_error(exception)
+        runs on the UI thread"""
+        request_id = self._next_id
+        self._next_id += 1
+        self._started[request_id] = self.clock()
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(
+            lambda f: self._done.put((request_id, f, on_done, on_error))
+        )
+        if not self._polling:
+            self._polling = True
+            self.schedule(self.poll_ms, self._poll)
+        return request_id
+
+    def _poll(self):
+        """UI thread: deliver finished calls, then poll again while any are pending.
+
+        A callback that raises is logged and the rest are still delivered.
+        """
+        try:
+            while True:
+                try:
+                    request_id, future, on_done, on_error = self._done.get_nowait()
+                except queue.Empty:
+                    break
+                self.latencies.append(self.clock() - self._started.pop(request_id))
+                try:
+                    error = future.exception()
+                    if error is None:
+                        if on_done is not None:
+                            on_done(future.result())
+                    elif on_error is not None:
+                        on_error(error)
+                except Exception as e:
+                    logger.log_system_error(str(e), "UI callback")
+            if self.on_poll is not None:
+                try:
+                    self.on_poll()
+                except Exception as e:
+                    logger.log_system_error(str(e), "UI poll hook")
+        finally:
+            self._polling = bool(self._started)
+            if self._polling:
+                self.schedule(self.poll_ms, self._poll)
+
+    @property
+    def pending(self):
+        return len(self._started)
+
+    def oldest_pending(self):
+        """Seconds the oldest pending call has been running, or None"""
+        if not self._started:
+            return None
+        return self.clock() - min(self._started.values())
+
+    def last_latency(self):
+        """Seconds taken by the most recently finished call, or None"""
+        return self.latencies[-1] if self.latencies else None
+
+    def shutdown(self):
+        """Stop accepting work; calls already running finish in the background"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,10 +1,12 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-from database import UserDatabase
-from PasswordMatch import PasswordMatch
+from sharding import open_database
+from PasswordMatch import PasswordMatch, StrengthMeter, policy
 from logger import logger
-import threading
-import time
+from session import SessionStore
+from dispatcher import TaskDispatcher
+from metrics import metrics
+from config import SESSION_PERSISTENCE, MESSAGES, STRENGTH_METER_DEBOUNCE_MS
 
 class LoginGUI:
     def __init__(self):
@@ -15,8 +17,17 @@ class LoginGUI:
         self.root.resizable(False, False)
         
         # Initialize database
-        self.db = UserDatabase()
+        self.db = open_database()
+        self.sessions = SessionStore(db=self.db if SESSION_PERSISTENCE else None)
         self.current_user = None
+        self.session_token = None
+        self.session_check_job = None
+        self.screen_id = 0  # Bumped on every screen change, so late results can be dropped
+        self.strength_meter = StrengthMeter()
+        self.strength_job = None
+        
+        # Database and hashing calls run on worker threads; results come back via root.after
+        self.dispatcher = TaskDispatcher(self.root.after, on_poll=self.update_latency_indicator)
         
         # Configure styles
         self.setup_styles()
@@ -49,12 +60,55 @@ class LoginGUI:
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
         self.main_frame.columnconfigure(1, weight=1)
+        
+        # Latency indicator, outside main_frame so it survives screen changes
+        self.latency_var = tk.StringVar()
+        latency_label = ttk.Label(self.root, textvariable=self.latency_var, style='Info.TLabel')
+        latency_label.grid(row=1, column=0, sticky=tk.E, padx=10, pady=(0, 5))
     
     def clear_frame(self):
         """Clear all widgets from main frame"""
+        self.screen_id += 1
+        if self.strength_job is not None:
+            self.root.after_cancel(self.strength_job)
+            self.strength_job = None
         for widget in self.main_frame.winfo_children():
             widget.destroy()
     
+    def run_in_background(self, func, *args, on_done, controls=()):
+        """Run a blocking call on the worker pool, keeping `controls` disabled
+        until it finishes. on_done(result) runs on the Tk thread, and only if
+        the user is still on the screen that started the call."""
+        screen = self.screen_id
+        for control in controls:
+            control.state(['disabled'])
+        
+        def finish():
+            for control in controls:
+                if control.winfo_exists():
+                    control.state(['!disabled'])
+            return self.screen_id == screen
+        
+        def done(result):
+            if finish():
+                on_done(result)
+        
+        def failed(error):
+            finish()
+            logger.log_system_error(str(error), "GUI worker")
+            messagebox.showerror("System Error", f"An error occurred: {error}")
+        
+        self.dispatcher.submit(func, *args, on_done=done, on_error=failed)
+        self.update_latency_indicator()
+    
+    def update_latency_indicator(self):
+        """Show how long pending work has been running, or the last request's latency"""
+        running = self.dispatcher.oldest_pending()
+        if running is not None:
+            self.latency_var.set(f"Working... {running:.1f} s")
+        elif self.dispatcher.last_latency() is not None:
+            self.latency_var.set(f"Last request: {self.dispatcher.last_latency() * 1000:.0f} ms")
+    
     def show_login_screen(self):
         """Display the login screen"""
         self.clear_frame()
@@ -78,11 +132,11 @@ class LoginGUI:
         button_frame = ttk.Frame(self.main_frame)
         button_frame.grid(row=3, column=0, columnspan=2, pady=20)
         
-        login_btn = ttk.Button(button_frame, text="Login", command=self.login_user)
-        login_btn.pack(side=tk.LEFT, padx=5)
+        self.login_btn = ttk.Button(button_frame, text="Login", command=self.login_user)
+        self.login_btn.pack(side=tk.LEFT, padx=5)
         
-        register_btn = ttk.Button(button_frame, text="Register", command=self.show_register_screen)
-        register_btn.pack(side=tk.LEFT, padx=5)
+        self.to_register_btn = ttk.Button(button_frame, text="Register", command=self.show_register_screen)
+        self.to_register_btn.pack(side=tk.LEFT, padx=5)
         
         exit_btn = ttk.Button(button_frame, text="Exit", command=self.root.quit)
         exit_btn.pack(side=tk.LEFT, padx=5)
@@ -114,14 +168,26 @@ class LoginGUI:
         
         ttk.Label(self.main_frame, text="Password:", style='Heading.TLabel').grid(row=2, column=0, sticky=tk.W, pady=5)
         self.reg_password_var = tk.StringVar()
-        password_entry = ttk.Entry(self.main_frame, textvariable=self.reg_password_var, width=25, show="*")
+        # Every keystroke reports just the inserted/deleted text to the strength meter
+        track_edit = self.root.register(self.on_password_edit)
+        password_entry = ttk.Entry(self.main_frame, textvariable=self.reg_password_var, width=25, show="*",
+                                   validate="key", validatecommand=(track_edit, '%d', '%S'))
         password_entry.grid(row=2, column=1, pady=5, padx=(10, 0))
+        self.strength_meter.reset()
         
         ttk.Label(self.main_frame, text="Confirm Password:", style='Heading.TLabel').grid(row=3, column=0, sticky=tk.W, pady=5)
         self.reg_confirm_var = tk.StringVar()
         confirm_entry = ttk.Entry(self.main_frame, textvariable=self.reg_confirm_var, width=25, show="*")
         confirm_entry.grid(row=3, column=1, pady=5, padx=(10, 0))
         
+        # Live strength meter
+        self.strength_bar = ttk.Progressbar(self.main_frame, maximum=3, length=200)
+        self.strength_bar.grid(row=4, column=0, columnspan=2, pady=(10, 0))
+        self.strength_var = tk.StringVar()
+        self.strength_label = ttk.Label(self.main_frame, textvariable=self.strength_var, style='Info.TLabel',
+                                        justify=tk.LEFT, wraplength=340)
+        self.strength_label.grid(row=5, column=0, columnspan=2)
+        
         # Password requirements
         req_text = """Password Requirements:
 • At least 8 characters
@@ -130,14 +196,14 @@ class LoginGUI:
 • At least one special character"""
         
         req_label = ttk.Label(self.main_frame, text=req_text, style='Info.TLabel', justify=tk.LEFT)
-        req_label.grid(row=4, column=0, columnspan=2, pady=10, sticky=tk.W)
+        req_label.grid(row=6, column=0, columnspan=2, pady=10, sticky=tk.W)
         
         # Buttons
         button_frame = ttk.Frame(self.main_frame)
-        button_frame.grid(row=5, column=0, columnspan=2, pady=20)
+        button_frame.grid(row=7, column=0, columnspan=2, pady=20)
         
-        register_btn = ttk.Button(button_frame, text="Register", command=self.register_user)
-        register_btn.pack(side=tk.LEFT, padx=5)
+        self.register_btn = ttk.Button(button_frame, text="Register", command=self.register_user)
+        self.register_btn.pack(side=tk.LEFT, padx=5)
         
         back_btn = ttk.Button(button_frame, text="Back to Login", command=self.show_login_screen)
         back_btn.pack(side=tk.LEFT, padx=5)
@@ -145,11 +211,37 @@ class LoginGUI:
         # Status label
         self.reg_status_var = tk.StringVar()
         self.reg_status_label = ttk.Label(self.main_frame, textvariable=self.reg_status_var, style='Info.TLabel')
-        self.reg_status_label.grid(row=6, column=0, columnspan=2, pady=10)
+        self.reg_status_label.grid(row=8, column=0, columnspan=2, pady=10)
         
         # Focus on username entry
         username_entry.focus()
     
+    def on_password_edit(self, action, text):
+        """Entry validation hook: update the running counts, redraw once typing pauses"""
+        if action == '1':
+            self.strength_meter.insert(text)
+        elif action == '0':
+            self.strength_meter.delete(text)
+        if self.strength_job is not None:
+            self.root.after_cancel(self.strength_job)
+        self.strength_job = self.root.after(STRENGTH_METER_DEBOUNCE_MS, self.show_strength)
+        return True  # Never reject the edit
+    
+    def show_strength(self):
+        """Redraw the strength meter (includes the blocklist check)"""
+        self.strength_job = None
+        if not self.strength_meter.length:
+            self.strength_bar['value'] = 0
+            self.strength_var.set("")
+            return
+        strength, issues = self.strength_meter.strength(self.reg_password_var.get())
+        self.strength_bar['value'] = {"Weak": 1, "Medium": 2, "Strong": 3}[strength]
+        text = f"Strength: {strength}"
+        if issues:
+            text += " - missing: " + ", ".join(issues)
+        self.strength_var.set(text)
+        self.strength_label.configure(style='Success.TLabel' if strength == "Strong" else 'Error.TLabel')
+    
     def show_dashboard(self):
         """Display user dashboard after successful login"""
         self.clear_frame()
@@ -158,29 +250,40 @@ class LoginGUI:
         title_label = ttk.Label(self.main_frame, text=f"Welcome, {self.current_user}!", style='Title.TLabel')
         title_label.grid(row=0, column=0, columnspan=2, pady=(0, 30))
         
-        # User info
-        user_info = self.db.get_user_info(self.current_user)
-        if user_info:
-            username, created_at, last_login = user_info
-            info_text = f"Account created: {created_at}\nLast login: {last_login or 'First time'}"
-            info_label = ttk.Label(self.main_frame, text=info_text, style='Info.TLabel', justify=tk.LEFT)
-            info_label.grid(row=1, column=0, columnspan=2, pady=10)
+        # User info, filled in once loaded
+        info_var = tk.StringVar(value="Loading account info...")
+        info_label = ttk.Label(self.main_frame, textvariable=info_var, style='Info.TLabel', justify=tk.LEFT)
+        info_label.grid(row=1, column=0, columnspan=2, pady=10)
+        
+        def show_info(user_info):
+            if user_info:
+                username, created_at, last_login = user_info
+                info_var.set(f"Account created: {created_at}\nLast login: {last_login or 'First time'}")
+            else:
+                info_var.set("")
         
         # Dashboard buttons
         btn_frame = ttk.Frame(self.main_frame)
         btn_frame.grid(row=2, column=0, columnspan=2, pady=20)
         
-        ttk.Button(btn_frame, text="Change Password", command=self.change_password).pack(pady=5, fill=tk.X)
-        ttk.Button(btn_frame, text="View Account Info", command=self.show_account_info).pack(pady=5, fill=tk.X)
+        self.change_password_btn = ttk.Button(btn_frame, text="Change Password", command=self.change_password)
+        self.change_password_btn.pack(pady=5, fill=tk.X)
+        self.account_info_btn = ttk.Button(btn_frame, text="View Account Info", command=self.show_account_info)
+        self.account_info_btn.pack(pady=5, fill=tk.X)
         ttk.Button(btn_frame, text="Logout", command=self.logout).pack(pady=5, fill=tk.X)
         
         # Status label
         self.dash_status_var = tk.StringVar()
         self.dash_status_label = ttk.Label(self.main_frame, textvariable=self.dash_status_var, style='Info.TLabel')
         self.dash_status_label.grid(row=3, column=0, columnspan=2, pady=10)
+        
+        self.run_in_background(self.db.get_user_info, self.current_user, on_done=show_info)
     
     def login_user(self):
         """Handle user login"""
+        if not self.login_btn.winfo_exists() or self.login_btn.instate(['disabled']):
+            return  # Not on the login screen, or a login is already in progress
+        
         username = self.username_var.get().strip()
         password = self.password_var.get()
         
@@ -189,15 +292,26 @@ class LoginGUI:
             self.status_label.configure(style='Error.TLabel')
             return
         
-        # Verify credentials
+        self.status_var.set("Signing in...")
+        self.status_label.configure(style='Info.TLabel')
+        self.run_in_background(self.verify_login, username, password,
+                               on_done=lambda result: self.finish_login(username, *result),
+                               controls=(self.login_btn, self.to_register_btn))
+    
+    def verify_login(self, username, password):
+        """Worker thread: check credentials and log the attempt"""
         success, message = self.db.verify_user(username, password)
-        
+        logger.log_login_attempt(username, success)
+        return success, message
+    
+    def finish_login(self, username, success, message):
+        """Tk thread: open the dashboard or show why the login failed"""
         if success:
             self.current_user = username
-            logger.log_login_attempt(username, True)
+            self.session_token = self.sessions.create(username)
             self.show_dashboard()
+            self.schedule_session_check()
         else:
-            logger.log_login_attempt(username, False)
             self.status_var.set(message)
             self.status_label.configure(style='Error.TLabel')
             self.password_var.set("")  # Clear password field
@@ -219,11 +333,12 @@ class LoginGUI:
             self.reg_status_label.configure(style='Error.TLabel')
             return
         
-        # Check password strength
-        try:
-            PasswordMatch(password)
-        except ValueError as e:
-            strength, issues = PasswordMatch.get_password_strength(password)
+        # Check the submitted string itself: paste, undo or a selection
+        # replace can leave the meter's running counts out of step
+        strength, issues = policy.strength(password)
+        self.strength_meter.reset(password)
+        self.show_strength()
+        if strength != "Strong":
             error_msg = f"Password strength: {strength}\n"
             if issues:
                 error_msg += "Missing: " + ", ".join(issues)
@@ -231,11 +346,22 @@ class LoginGUI:
             messagebox.showerror("Weak Password", error_msg)
             return
         
-        # Create user
+        # Create user (hashing and the insert run on a worker)
+        self.reg_status_var.set("Creating account...")
+        self.reg_status_label.configure(style='Info.TLabel')
+        self.run_in_background(self.create_account, username, password,
+                               on_done=lambda result: self.finish_registration(*result),
+                               controls=(self.register_btn,))
+    
+    def create_account(self, username, password):
+        """Worker thread: create the user and log the outcome"""
         success, message = self.db.create_user(username, password)
-        
+        logger.log_user_registration(username, success)
+        return success, message
+    
+    def finish_registration(self, success, message):
+        """Tk thread: report the registration result"""
         if success:
-            logger.log_user_registration(username, True)
             self.reg_status_var.set("Registration successful! You can now login.")
             self.reg_status_label.configure(style='Success.TLabel')
             
@@ -243,27 +369,66 @@ class LoginGUI:
             self.reg_username_var.set("")
             self.reg_password_var.set("")
             self.reg_confirm_var.set("")
+            self.strength_meter.reset()  # Setting the variable bypasses the edit hook
+            self.show_strength()
             
             # Auto-switch to login after delay
             self.root.after(2000, self.show_login_screen)
         else:
-            logger.log_user_registration(username, False)
             self.reg_status_var.set(message)
             self.reg_status_label.configure(style='Error.TLabel')
     
+    def require_session(self):
+        """Validate (and renew) the session before a user action"""
+        if self.sessions.validate(self.session_token) == self.current_user:
+            return True
+        self.expire_session()
+        return False
+    
+    def schedule_session_check(self):
+        """Check the session for expiry or an upcoming auto-logout every 30 seconds"""
+        self.session_check_job = self.root.after(30000, self.check_session)
+    
+    def check_session(self):
+        """Periodic session check; does not count as activity"""
+        self.session_check_job = None
+        if not self.current_user:
+            return
+        if self.sessions.validate(self.session_token, renew=False) != self.current_user:
+            self.expire_session()
+            return
+        if self.sessions.needs_warning(self.session_token):
+            minutes = int(self.sessions.time_remaining(self.session_token) // 60) + 1
+            self.dash_status_var.set(f"Session expires in about {minutes} minute(s)")
+            self.dash_status_label.configure(style='Error.TLabel')
+        self.schedule_session_check()
+    
+    def expire_session(self):
+        """Log out because the session has expired"""
+        logger.log_security_event("Session expired", self.current_user)
+        self.end_session()
+        self.show_login_screen()
+        messagebox.showwarning("Session Expired", MESSAGES["session_expired"])
+    
+    def end_session(self):
+        """Revoke the session and forget the current user"""
+        if self.session_check_job is not None:
+            self.root.after_cancel(self.session_check_job)
+            self.session_check_job = None
+        self.sessions.revoke(self.session_token)
+        self.session_token = None
+        self.current_user = None
+    
     def change_password(self):
         """Handle password change"""
+        if not self.require_session():
+            return
+        
         # Get current password
         current_pwd = simpledialog.askstring("Change Password", "Enter current password:", show='*')
         if not current_pwd:
             return
         
-        # Verify current password
-        success, message = self.db.verify_user(self.current_user, current_pwd)
-        if not success:
-            messagebox.showerror("Error", "Current password is incorrect!")
-            return
-        
         # Get new password
         new_pwd = simpledialog.askstring("Change Password", "Enter new password:", show='*')
         if not new_pwd:
@@ -287,15 +452,34 @@ class LoginGUI:
             messagebox.showerror("Error", "Passwords do not match!")
             return
         
-        # Update password (simplified - in real app, you'd have an update method)
-        messagebox.showinfo("Success", "Password changed successfully!")
-        logger.log_password_change(self.current_user)
-        self.dash_status_var.set("Password changed successfully!")
+        # Verifying the current password and hashing the new one run on a worker
+        username = self.current_user
+        self.run_in_background(self.db.update_password, username, current_pwd, new_pwd,
+                               on_done=lambda result: self.finish_password_change(username, *result),
+                               controls=(self.change_password_btn, self.account_info_btn))
+    
+    def finish_password_change(self, username, success, message):
+        """Tk thread: report the outcome of update_password"""
+        if not success:
+            messagebox.showerror("Error", message)
+            return
+        
+        logger.log_password_change(username)
+        messagebox.showinfo("Success", message)
+        self.dash_status_var.set(message)
         self.dash_status_label.configure(style='Success.TLabel')
     
     def show_account_info(self):
         """Show account information"""
-        user_info = self.db.get_user_info(self.current_user)
+        if not self.require_session():
+            return
+        
+        self.run_in_background(self.db.get_user_info, self.current_user,
+                               on_done=self.display_account_info,
+                               controls=(self.account_info_btn,))
+    
+    def display_account_info(self, user_info):
+        """Tk thread: show the loaded account information"""
         if user_info:
             username, created_at, last_login = user_info
             info_msg = f"Username: {username}\n"
@@ -307,7 +491,7 @@ class LoginGUI:
     def logout(self):
         """Handle user logout"""
         logger.log_logout(self.current_user)
-        self.current_user = None
+        self.end_session()
         self.username_var.set("")
         self.password_var.set("")
         self.show_login_screen()
@@ -316,12 +500,17 @@ class LoginGUI:
     def run(self):
         """Start the GUI application"""
         try:
+            metrics.start_exporters()
             self.root.mainloop()
         except KeyboardInterrupt:
             print("Application closed by user")
         except Exception as e:
             messagebox.showerror("System Error", f"An error occurred: {e}")
             logger.log_system_error(str(e), "GUI Application")
+        finally:
+            self.dispatcher.shutdown()
+            self.db.close()
+            metrics.stop_exporters()
 
 if __name__ == "__main__":
     app = LoginGUI()
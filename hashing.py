@@ -0,0 +1,182 @@
+import hashlib
+import hmac
+import os
+import atexit
+import threading
+from config import (
+    PASSWORD_HASH_ALGORITHM, SCRYPT_COST, PBKDF2_ITERATIONS, HASH_WORKERS
+)
+from metrics import metrics
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+SCRYPT_BLOCK_SIZE = 8
+SCRYPT_PARALLELISM = 1
+
+def default_cost(algorithm):
+    """Return the configured cost for an algorithm"""
+    return SCRYPT_COST if algorithm == "scrypt" else PBKDF2_ITERATIONS
+
+def hash_password(password, algorithm=PASSWORD_HASH_ALGORITHM, cost=None):
+    """Hash a password with a fresh salt and return the encoded hash string.
+
+    The encoded form carries everything needed to verify it later:
+      scrypt$<log2 N>$<r>$<p>$<salt hex>$<key hex>
+      pbkdf2_sha256$<iterations>$<salt hex>$<key hex>
+    """
+    if cost is None:
+        cost = default_cost(algorithm)
+    salt = os.urandom(SALT_BYTES)
+    if algorithm == "scrypt":
+        key = _scrypt(password, salt, cost, SCRYPT_BLOCK_SIZE, SCRYPT_PARALLELISM)
+        return f"scrypt${cost}${SCRYPT_BLOCK_SIZE}${SCRYPT_PARALLELISM}${salt.hex()}${key.hex()}"
+    if algorithm == "pbkdf2_sha256":
+        key = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, cost, KEY_BYTES)
+        return f"pbkdf2_sha256${cost}${salt.hex()}${key.hex()}"
+    raise ValueError(f"Unsupported password hash algorithm: {algorithm}")
+
+def verify_password(password, encoded):
+    """Check a password against an encoded hash (KDF or legacy SHA-256)"""
+    parts = encoded.split("$")
+    if len(parts) == 1:
+        # Legacy rows hold a bare unsalted SHA-256 hex digest
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(candidate, encoded)
+    if parts[0] == "scrypt" and len(parts) == 6:
+        cost, block_size, parallelism = int(parts[1]), int(parts[2]), int(parts[3])
+        salt, expected = bytes.fromhex(parts[4]), bytes.fromhex(parts[5])
+        key = _scrypt(password, salt, cost, block_size, parallelism, len(expected))
+        return hmac.compare_digest(key, expected)
+    if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        iterations = int(parts[1])
+        salt, expected = bytes.fromhex(parts[2]), bytes.fromhex(parts[3])
+        key = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, len(expected))
+        return hmac.compare_digest(key, expected)
+    return False
+
+def is_valid_hash(encoded):
+    """Return True if a value is an encoded hash this module can verify"""
+    if not isinstance(encoded, str):
+        return False
+    parts = encoded.split("$")
+    try:
+        if len(parts) == 1:
+            return len(encoded) == 64 and bytes.fromhex(encoded) is not None
+        if parts[0] == "scrypt" and len(parts) == 6:
+            int(parts[1]), int(parts[2]), int(parts[3])
+            return bool(bytes.fromhex(parts[4])) and bool(bytes.fromhex(parts[5]))
+        if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            int(parts[1])
+            return bool(bytes.fromhex(parts[2])) and bool(bytes.fromhex(parts[3]))
+    except ValueError:
+        return False
+    return False
+
+def needs_rehash(encoded, algorithm=PASSWORD_HASH_ALGORITHM, cost=None):
+    """Return True if a stored hash is legacy or uses outdated parameters"""
+    if cost is None:
+        cost = default_cost(algorithm)
+    parts = encoded.split("$")
+    if parts[0] != algorithm:
+        return True
+    return int(parts[1]) != cost
+
+def _scrypt(password, salt, cost, block_size, parallelism, key_bytes=KEY_BYTES):
+    """Run scrypt with N = 2**cost, allowing enough memory for the chosen cost"""
+    n = 2 ** cost
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=block_size, p=parallelism,
+        maxmem=max(32 * 1024 * 1024, 256 * block_size * n * parallelism), dklen=key_bytes
+    )
+
+
+class PasswordHasher:
+    def __init__(self, algorithm=PASSWORD_HASH_ALGORITHM, cost=None, workers=HASH_WORKERS):
+        """Hashing engine that runs the KDF in a process pool when more than one
+        worker is available, so concurrent logins use every core"""
+        self.algorithm = algorithm
+        self.cost = default_cost(algorithm) if cost is None else cost
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._dummy_hash = None
+
+    def _get_executor(self):
+        """Start the worker pool on first use; None means hash in-process"""
+        if self.workers <= 1:
+            return None
+        with self._executor_lock:
+            if self._executor is None:
+                # Imported here so processes that never hash don't pay for it at startup
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    @metrics.timed("password_hash_seconds", "hash", phase="hash")
+    def hash(self, password):
+        """Hash a single password"""
+        executor = self._get_executor()
+        if executor is None:
+            return hash_password(password, self.algorithm, self.cost)
+        return executor.submit(hash_password, password, self.algorithm, self.cost).result()
+
+    @metrics.timed("password_hash_seconds", "hash_many", phase="hash")
+    def hash_many(self, passwords):
+        """Hash a batch of passwords in parallel, preserving input order"""
+        passwords = list(passwords)
+        executor = self._get_executor()
+        if executor is None:
+            return [hash_password(p, self.algorithm, self.cost) for p in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(executor.map(
+            hash_password, passwords,
+            [self.algorithm] * len(passwords), [self.cost] * len(passwords),
+            chunksize=chunksize
+        ))
+
+    @metrics.timed("password_hash_seconds", "verify", phase="hash")
+    def verify(self, password, encoded):
+        """Verify a password against an encoded hash"""
+        executor = self._get_executor()
+        if executor is None:
+            return verify_password(password, encoded)
+        return executor.submit(verify_password, password, encoded).result()
+
+    @metrics.timed("password_hash_seconds", "verify_any", phase="hash")
+    def verify_any(self, password, encoded_hashes):
+        """Return True if the password matches any of the encoded hashes.
+
+        The checks run in parallel on the worker pool, so N hashes cost
+        about as much wall time as one when there are N free workers.
+        """
+        encoded_hashes = list(encoded_hashes)
+        executor = self._get_executor()
+        if executor is None or len(encoded_hashes) <= 1:
+            return any(verify_password(password, encoded) for encoded in encoded_hashes)
+        return any(executor.map(verify_password, [password] * len(encoded_hashes), encoded_hashes))
+
+    def verify_dummy(self, password):
+        """Spend the same work as a real check, for usernames that don't exist"""
+        if self._dummy_hash is None:
+            self._dummy_hash = hash_password("dummy-password", self.algorithm, self.cost)
+        self.verify(password, self._dummy_hash)
+        return False
+
+    def needs_rehash(self, encoded):
+        """Return True if a stored hash should be upgraded to current settings"""
+        return needs_rehash(encoded, self.algorithm, self.cost)
+
+    def shutdown(self):
+        """Stop the worker pool, if one was started"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+# Global hasher instance shared by every UserDatabase in the process
+hasher = PasswordHasher()
+atexit.register(hasher.shutdown)
@@ -0,0 +1,166 @@
+import heapq
+import threading
+import time
+from collections import deque
+from config import (
+    MAX_LOGIN_ATTEMPTS, MAX_FAILURES_PER_SOURCE, LOCKOUT_WINDOW_MINUTES,
+    LOCKOUT_DURATION_MINUTES, LOCKOUT_FLUSH_INTERVAL_SECONDS
+)
+
+
+class FailureCounter:
+    __slots__ = ("failures", "locked_until", "expires_at", "dirty")
+
+    def __init__(self, limit):
+        # Only the newest `limit` failures matter, so the deque never grows past it
+        self.failures = deque(maxlen=limit)
+        self.locked_until = 0.0
+        self.expires_at = 0.0  # When the counter is idle: window after the newest failure, or unlock
+        self.dirty = False
+
+
+class LockoutManager:
+    def __init__(self, max_failures=MAX_LOGIN_ATTEMPTS, max_source_failures=MAX_FAILURES_PER_SOURCE,
+                 window_minutes=LOCKOUT_WINDOW_MINUTES, lockout_minutes=LOCKOUT_DURATION_MINUTES,
+                 db=None, clock=time.time):
+        """Sliding-window failure counters per user and per source (e.g. IP).
+
+        A key is locked once it reaches its failure limit within the window.
+        Every update is O(log n); idle counters expire on their own, in
+        deadline order. Pass a UserDatabase as db to persist counters in
+        batches so locks survive a restart.
+        """
+        self.limits = {"user": max_failures, "source": max_source_failures}
+        self.window = window_minutes * 60
+        self.lockout = lockout_minutes * 60
+        self.db = db
+        self.clock = clock
+        self._counters = {}
+        # Min-heap of (expires_at, key). Entries are not updated when a
+        # counter's deadline moves later; _expire() re-pushes those.
+        self._expiry = []
+        self._deleted = set()
+        self._lock = threading.Lock()
+        self._last_flush = clock()
+        if db is not None:
+            self._load()
+
+    def _load(self):
+        """Restore counters that are still relevant and delete the rest"""
+        cutoff = self.clock() - max(self.window, self.lockout)
+        with self.db.get_connection() as conn:
+            conn.execute("DELETE FROM login_failures WHERE updated_at < ?", (cutoff,))
+            rows = conn.execute(
+                "SELECT key, failures, locked_until FROM login_failures ORDER BY updated_at"
+            ).fetchall()
+        with self._lock:
+            for key, failures, locked_until in rows:
+                counter = FailureCounter(self.limits[key.split(":", 1)[0]])
+                counter.failures.extend(float(t) for t in failures.split(",") if t)
+                counter.locked_until = locked_until
+                self._counters[key] = counter
+                self._set_deadline(key, counter, counter.failures[-1] if counter.failures else 0.0)
+
+    def _keys(self, username, source):
+        keys = []
+        if username:
+            keys.append(f"user:{username}")
+        if source:
+            keys.append(f"source:{source}")
+        return keys
+
+    def is_locked(self, username, source=None):
+        """Return True if the user or the source is currently locked out"""
+        now = self.clock()
+        counters = self._counters
+        for key in self._keys(username, source):
+            counter = counters.get(key)
+            if counter is not None and counter.locked_until > now:
+                return True
+        return False
+
+    def record_failure(self, username, source=None):
+        """Count a failed login; return True if it triggered a lockout.
+
+        Pass username=None when the account does not exist: only the source
+        is counted, so names sprayed at random can't grow the table.
+        """
+        now = self.clock()
+        locked = False
+        with self._lock:
+            for key in self._keys(username, source):
+                counter = self._counters.get(key)
+                new = counter is None
+                if new:
+                    counter = FailureCounter(self.limits[key.split(":", 1)[0]])
+                    self._counters[key] = counter
+                counter.failures.append(now)
+                counter.dirty = True
+                failures = counter.failures
+                # Full deque whose oldest entry is inside the window = limit reached
+                if len(failures) == failures.maxlen and failures[0] > now - self.window:
+                    counter.locked_until = now + self.lockout
+                    failures.clear()
+                    locked = True
+                self._set_deadline(key, counter, now, push=new)
+            self._expire(now)
+        self._maybe_flush(now)
+        return locked
+
+    def record_success(self, username):
+        """Clear a user's failure history after a successful login"""
+        key = f"user:{username}"
+        with self._lock:
+            if self._counters.pop(key, None) is not None:
+                self._deleted.add(key)
+
+    def _set_deadline(self, key, counter, newest, push=True):
+        """Move a counter's expiry to after its newest failure or its lock (caller holds the lock)"""
+        counter.expires_at = max(newest + self.window, counter.locked_until)
+        if push:
+            heapq.heappush(self._expiry, (counter.expires_at, key))
+
+    def _expire(self, now):
+        """Drop counters whose deadline has passed (caller holds the lock)"""
+        expiry = self._expiry
+        counters = self._counters
+        while expiry and expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(expiry)
+            counter = counters.get(key)
+            if counter is None:
+                continue  # Cleared by a successful login
+            if counter.expires_at > now:
+                heapq.heappush(expiry, (counter.expires_at, key))
+                continue
+            del counters[key]
+            self._deleted.add(key)
+
+    def _maybe_flush(self, now):
+        if self.db is not None and now - self._last_flush >= LOCKOUT_FLUSH_INTERVAL_SECONDS:
+            self.flush()
+
+    def flush(self):
+        """Write changed counters to the database in one batch"""
+        if self.db is None:
+            return
+        now = self.clock()
+        with self._lock:
+            self._last_flush = now
+            rows = []
+            for key, counter in self._counters.items():
+                if counter.dirty:
+                    counter.dirty = False
+                    rows.append((key, ",".join(f"{t:.3f}" for t in counter.failures),
+                                 counter.locked_until, now))
+            deleted, self._deleted = [(key,) for key in self._deleted], set()
+        if not rows and not deleted:
+            return
+        with self.db.get_connection() as conn:
+            conn.executemany("DELETE FROM login_failures WHERE key = ?", deleted)
+            conn.executemany(
+                "INSERT OR REPLACE INTO login_failures (key, failures, locked_until, updated_at) "
+                "VALUES (?, ?, ?, ?)", rows
+            )
+
+    def __len__(self):
+        return len(self._counters)
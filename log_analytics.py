@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Streaming security report over logs/system.log
+
+Reads the log through mmap as a generator pipeline (lines -> parsed events
+-> aggregates), so memory stays flat however large the file is. With
+--approx, per-user/per-IP counts use a Count-Min sketch plus a Space-Saving
+top-k summary, so memory is constant even with millions of distinct keys.
+With --workers, the file is split into newline-aligned byte ranges that are
+analyzed in parallel and merged.
+
+Usage:
+    python log_analytics.py                          # whole of logs/system.log
+    python log_analytics.py --date 2026-10-18 --json
+    python log_analytics.py big.log --workers 8 --approx --top 20
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import mmap
+import os
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from config import LOG_FILE
+
+DEFAULT_LOG = os.path.join("logs", LOG_FILE)
+
+# ---------------------------------------------------------------------------
+# Pipeline stages
+# ---------------------------------------------------------------------------
+
+def iter_lines(mm, start=0, end=None):
+    """Yield raw lines that start inside [start, end) of a memory-mapped file.
+
+    A range that begins mid-line skips ahead to the next full line; the
+    range before it owns that line.
+    """
+    end = len(mm) if end is None else end
+    pos = start
+    if pos > 0 and mm[pos - 1:pos] != b"\n":
+        newline = mm.find(b"\n", pos)
+        pos = len(mm) if newline == -1 else newline + 1
+    while pos < end:
+        newline = mm.find(b"\n", pos)
+        if newline == -1:
+            newline = len(mm)
+        yield mm[pos:newline]
+        pos = newline + 1
+
+def parse_events(lines, date=None):
+    """Turn SystemLogger lines into (date, kind, user, ip, detail) tuples.
+
+    Line format: "YYYY-MM-DD HH:MM:SS,mmm - LEVEL - message". Lines from
+    other days are skipped on a byte-prefix check before any decoding.
+    """
+    date_prefix = date.encode() if date else None
+    for raw in lines:
+        if date_prefix is not None and not raw.startswith(date_prefix):
+            continue
+        parts = raw.decode("utf-8", "replace").rstrip("\r").split(" - ", 2)
+        if len(parts) != 3:
+            continue
+        event = parse_message(parts[2])
+        if event is not None:
+            yield (parts[0][:10],) + event
+
+def _split_source(text):
+    """Split "user from ip" into (user, ip)"""
+    user, sep, ip = text.rpartition(" from ")
+    return (user, ip) if sep else (text, None)
+
+def parse_message(message):
+    """Classify one log message as (kind, user, ip, detail), or None if not of interest"""
+    if message.startswith("Login successful: "):
+        return ("login_success",) + _split_source(message[18:]) + (None,)
+    if message.startswith("Login failed: "):
+        return ("login_failed",) + _split_source(message[14:]) + (None,)
+    if message.startswith("User registration successful: "):
+        return ("registration_success", message[30:], None, None)
+    if message.startswith("User registration failed: "):
+        return ("registration_failed", message[26:], None, None)
+    if message.startswith("Security event: "):
+        body = message[16:]
+        user = None
+        event, sep, rest = body.partition(" - User: ")
+        if sep:
+            user = rest.split(" - Details: ", 1)[0]
+        else:
+            event = body.split(" - Details: ", 1)[0]
+        return ("security_event", user, None, event)
+    return None
+
+# ---------------------------------------------------------------------------
+# Counters
+# ---------------------------------------------------------------------------
+
+class ExactCounter:
+    def __init__(self, top=10):
+        """Exact counts; memory grows with the number of distinct keys"""
+        self.counts = Counter()
+
+    def add(self, key, count=1):
+        self.counts[key] += count
+
+    def estimate(self, key):
+        return self.counts.get(key, 0)
+
+    def top(self, k):
+        return self.counts.most_common(k)
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+
+class ApproxCounter:
+    def __init__(self, top=10, width=2048, depth=4):
+        """Count-Min sketch for point estimates plus Space-Saving for the top keys.
+
+        Memory is fixed: width * depth sketch cells and at most
+        `capacity` tracked keys, regardless of how many keys are seen.
+        """
+        self.width = width
+        self.depth = depth
+        self.cells = array("Q", [0]) * (width * depth)
+        self.capacity = max(top * 10, 100)
+        self.heavy = {}
+        # Min-heap of (count, key), one entry per tracked key. Increments
+        # don't touch it, so an entry may be behind its key's count; it is
+        # corrected when it reaches the top.
+        self._heap = []
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        for position in self._positions(key):
+            self.cells[position] += count
+        heavy = self.heavy
+        if key in heavy:
+            heavy[key] += count
+        elif len(heavy) < self.capacity:
+            heavy[key] = count
+            heapq.heappush(self._heap, (count, key))
+        else:
+            # Space-Saving: the new key replaces the smallest tracked one
+            heap = self._heap
+            while True:
+                smallest_count, smallest = heap[0]
+                current = heavy[smallest]
+                if current == smallest_count:
+                    break
+                heapq.heapreplace(heap, (current, smallest))
+            del heavy[smallest]
+            heavy[key] = current + count
+            heapq.heapreplace(heap, (current + count, key))
+
+    def estimate(self, key):
+        return min(self.cells[position] for position in self._positions(key))
+
+    def top(self, k):
+        ranked = sorted(self.heavy, key=self.heavy.get, reverse=True)[:k]
+        # Report the tighter Count-Min estimate for each heavy hitter
+        return [(key, self.estimate(key)) for key in ranked]
+
+    def merge(self, other):
+        for i, value in enumerate(other.cells):
+            self.cells[i] += value
+        for key, count in other.heavy.items():
+            self.heavy[key] = self.heavy.get(key, 0) + count
+        if len(self.heavy) > self.capacity:
+            keep = sorted(self.heavy, key=self.heavy.get, reverse=True)[:self.capacity]
+            self.heavy = {key: self.heavy[key] for key in keep}
+        self._heap = [(count, key) for key, count in self.heavy.items()]
+        heapq.heapify(self._heap)
+
+# ---------------------------------------------------------------------------
+# Aggregation
+# ---------------------------------------------------------------------------
+
+class SecurityReport:
+    def __init__(self, approx=False, top=10):
+        """Mergeable aggregates for the daily security report"""
+        make = ApproxCounter if approx else ExactCounter
+        self.top_n = top
+        self.logins = Counter()          # success / failed totals
+        self.registrations = Counter()   # success / failed totals
+        self.days = Counter()            # events per day
+        self.user_attempts = make(top)
+        self.user_failures = make(top)
+        self.ip_attempts = make(top)
+        self.ip_failures = make(top)
+        self.security_events = make(top)
+
+    def add(self, event):
+        day, kind, user, ip, detail = event
+        self.days[day] += 1
+        if kind in ("login_success", "login_failed"):
+            failed = kind == "login_failed"
+            self.logins["failed" if failed else "success"] += 1
+            self.user_attempts.add(user)
+            if ip:
+                self.ip_attempts.add(ip)
+            if failed:
+                self.user_failures.add(user)
+                if ip:
+                    self.ip_failures.add(ip)
+        elif kind == "registration_success":
+            self.registrations["success"] += 1
+        elif kind == "registration_failed":
+            self.registrations["failed"] += 1
+        elif kind == "security_event":
+            self.security_events.add(detail)
+
+    def consume(self, events):
+        for event in events:
+            self.add(event)
+        return self
+
+    def merge(self, other):
+        self.logins.update(other.logins)
+        self.registrations.update(other.registrations)
+        self.days.update(other.days)
+        for name in ("user_attempts", "user_failures", "ip_attempts", "ip_failures",
+                     "security_events"):
+            getattr(self, name).merge(getattr(other, name))
+        return self
+
+    def _failure_rates(self, failures, attempts):
+        rows = []
+        for key, failed in failures.top(self.top_n):
+            total = max(attempts.estimate(key), failed)
+            rows.append({"key": key, "failed": failed, "attempts": total,
+                         "failure_rate": round(failed / total, 3) if total else 0.0})
+        return rows
+
+    def to_dict(self):
+        total_logins = self.logins["success"] + self.logins["failed"]
+        return {
+            "days": dict(sorted(self.days.items())),
+            "logins": {
+                "total": total_logins,
+                "failed": self.logins["failed"],
+                "failure_rate": round(self.logins["failed"] / total_logins, 3)
+                                if total_logins else 0.0,
+            },
+            "registrations": dict(self.registrations),
+            "failed_logins_by_user": self._failure_rates(self.user_failures, self.user_attempts),
+            "failed_logins_by_ip": self._failure_rates(self.ip_failures, self.ip_attempts),
+            "top_security_events": [{"event": event, "count": count}
+                                    for event, count in self.security_events.top(self.top_n)],
+        }
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def analyze_range(path, start, end, date=None, approx=False, top=10):
+    """Analyze the lines starting in one byte range of a log file"""
+    report = SecurityReport(approx, top)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return report
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            report.consume(parse_events(iter_lines(mm, start, end), date))
+    return report
+
+def analyze(path, date=None, approx=False, top=10, workers=1):
+    """Build a SecurityReport for a log file, optionally across worker processes"""
+    size = os.path.getsize(path)
+    if workers <= 1 or size == 0:
+        return analyze_range(path, 0, size, date, approx, top)
+
+    step = -(-size // workers)
+    ranges = [(start, min(start + step, size)) for start in range(0, size, step)]
+    report = SecurityReport(approx, top)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_range, path, start, end, date, approx, top)
+                   for start, end in ranges]
+        for future in futures:
+            report.merge(future.result())
+    return report
+
+def format_report(report):
+    """Render a report as plain text"""
+    lines = ["Security report", "=" * 50]
+    logins = report["logins"]
+    lines.append(f"Logins: {logins['total']} total, {logins['failed']} failed "
+                 f"({logins['failure_rate']:.1%})")
+    registrations = report["registrations"]
+    lines.append(f"Registrations: {registrations.get('success', 0)} successful, "
+                 f"{registrations.get('failed', 0)} failed")
+    for title, key in (("Failed logins by user", "failed_logins_by_user"),
+                       ("Failed logins by IP", "failed_logins_by_ip")):
+        lines.append(f"\n{title}:")
+        for row in report[key] or []:
+            lines.append(f"  {row['key']:<30} {row['failed']:>8} / {row['attempts']:<8} "
+                         f"({row['failure_rate']:.1%})")
+    lines.append("\nTop security events:")
+    for row in report["top_security_events"]:
+        lines.append(f"  {row['event']:<40} {row['count']:>8}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Security report from the system log")
+    parser.add_argument("log", nargs="?", default=DEFAULT_LOG, help="log file to analyze")
+    parser.add_argument("--date", help="only include this day (YYYY-MM-DD)")
+    parser.add_argument("--top", type=int, default=10, help="rows per ranking")
+    parser.add_argument("--approx", action="store_true",
+                        help="constant-memory approximate counting (Count-Min + Space-Saving)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="split the file across this many processes")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = analyze(args.log, args.date, args.approx, args.top, args.workers).to_dict()
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
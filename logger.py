@@ -1,93 +1,276 @@
 import logging
 import os
+import queue
+import threading
+import time
+import atexit
 from datetime import datetime
-from config import LOG_FILE, LOG_LEVEL, ENABLE_LOGGING
+from config import (
+    LOG_FILE, LOG_LEVEL, ENABLE_LOGGING, LOG_ASYNC, LOG_QUEUE_SIZE, LOG_OVERFLOW_POLICY,
+    LOG_SAMPLE_RATE, LOG_BATCH_SIZE, ENABLE_AUDIT_LOG
+)
+from audit import AuditLog
+from metrics import metrics
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+class AsyncLogHandler(logging.Handler):
+    def __init__(self, handlers, maxsize=LOG_QUEUE_SIZE, overflow=LOG_OVERFLOW_POLICY,
+                 sample_rate=LOG_SAMPLE_RATE, batch_size=LOG_BATCH_SIZE):
+        """Queue records for a background thread that writes them to `handlers` in batches.
+
+        When the queue is full, `overflow` decides what happens to records
+        below WARNING: "block" waits for space, "drop" discards them and
+        "sample" keeps one in every `sample_rate`. Warnings and errors
+        always wait, so security events are never lost.
+        """
+        super().__init__()
+        if overflow not in ("block", "drop", "sample"):
+            raise ValueError(f"Unknown log overflow policy: {overflow}")
+        self.handlers = handlers
+        self.overflow = overflow
+        self.sample_rate = max(1, sample_rate)
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._overflowed = 0
+        self._queue = queue.Queue(maxsize)
+        self._writer = threading.Thread(target=self._write_loop, name="log-writer", daemon=True)
+        self._writer.start()
+
+    def emit(self, record):
+        """Enqueue a record; formatting happens later on the writer thread"""
+        if self.overflow == "block" or record.levelno >= logging.WARNING:
+            self._queue.put(record)
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._overflowed += 1
+            if self.overflow == "sample" and self._overflowed % self.sample_rate == 0:
+                self._queue.put(record)
+            else:
+                self.dropped += 1
+                metrics.inc("log_records_dropped_total")
+
+    def _write_loop(self):
+        """Writer thread: drain the queue in batches, flushing once per batch"""
+        while True:
+            record = self._queue.get()
+            if record is None:
+                return
+            batch = [record]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            self._write_batch(batch)
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        started = time.perf_counter()
+        self._write_handlers(batch)
+        if metrics.enabled:
+            metrics.observe("log_batch_write_seconds", time.perf_counter() - started)
+            metrics.inc("log_records_written_total", len(batch))
+
+    def _write_handlers(self, batch):
+        for handler in self.handlers:
+            records = [r for r in batch if r.levelno >= handler.level]
+            if not records:
+                continue
+            if not isinstance(handler, logging.StreamHandler):
+                for record in records:
+                    handler.handle(record)
+                continue
+            # One write and one flush per batch instead of per record
+            handler.acquire()
+            try:
+                lines = []
+                for record in records:
+                    try:
+                        lines.append(handler.format(record) + handler.terminator)
+                    except Exception:
+                        handler.handleError(record)
+                handler.stream.write("".join(lines))
+                handler.flush()
+            except Exception:
+                handler.handleError(records[-1])
+            finally:
+                handler.release()
+
+    def close(self):
+        """Write everything still queued, then close the target handlers"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        for handler in self.handlers:
+            handler.close()
+        super().close()
 
 class SystemLogger:
     def __init__(self):
-        """Initialize the logging system"""
-        if ENABLE_LOGGING:
-            self.setup_logger()
-    
+        """Initialize the logging system; files and handlers are set up on first use"""
+        self._logger = None
+        self._audit = None
+        self.async_handler = None
+        self._setup_lock = threading.Lock()
+
+    def _ensure_setup(self):
+        """Run setup_logger once, the first time something is logged"""
+        with self._setup_lock:
+            if self._logger is None and ENABLE_LOGGING:
+                self.setup_logger()
+                if ENABLE_AUDIT_LOG:
+                    self._audit = AuditLog()
+                    atexit.register(self._audit.close)
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._ensure_setup()
+        return self._logger
+
+    @property
+    def audit(self):
+        if self._logger is None:
+            self._ensure_setup()
+        return self._audit
+
+    @audit.setter
+    def audit(self, audit_log):
+        self._audit = audit_log
+
     def setup_logger(self):
         """Configure the logger"""
         # Create logs directory if it doesn't exist
         log_dir = "logs"
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
-        
+
         # Configure logging
         log_path = os.path.join(log_dir, LOG_FILE)
-        
+        handlers = [
+            logging.FileHandler(log_path),
+            logging.StreamHandler()  # Also log to console
+        ]
+
+        self.async_handler = None
+        if LOG_ASYNC:
+            formatter = logging.Formatter(LOG_FORMAT)
+            for handler in handlers:
+                handler.setFormatter(formatter)
+            self.async_handler = AsyncLogHandler(handlers)
+            handlers = [self.async_handler]
+            atexit.register(self.shutdown)
+
         logging.basicConfig(
             level=getattr(logging, LOG_LEVEL),
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_path),
-                logging.StreamHandler()  # Also log to console
-            ]
+            format=LOG_FORMAT,
+            handlers=handlers
         )
-        
-        self.logger = logging.getLogger(__name__)
-        self.logger.info("Login system started")
-    
+
+        self._logger = logging.getLogger(__name__)
+        self._logger.info("Login system started")
+
+    def shutdown(self):
+        """Flush and stop the background writer (async mode)"""
+        if self.async_handler is not None:
+            handler, self.async_handler = self.async_handler, None
+            if handler.dropped:
+                self.logger.warning("Log queue overflow: %s record(s) dropped", handler.dropped)
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+
+    # Messages are passed as %-style arguments so they are only formatted if
+    # the record is actually emitted (and, in async mode, off the caller's thread)
+
+    @metrics.timed("log_call_seconds", "registration", label="event")
     def log_user_registration(self, username, success=True):
         """Log user registration attempts"""
         if ENABLE_LOGGING:
             if success:
-                self.logger.info(f"User registration successful: {username}")
+                self.logger.info("User registration successful: %s", username)
             else:
-                self.logger.warning(f"User registration failed: {username}")
-    
+                self.logger.warning("User registration failed: %s", username)
+            if self.audit:
+                self.audit.record("registration", username, success)
+
+    @metrics.timed("log_call_seconds", "login", label="event")
     def log_login_attempt(self, username, success=True, ip_address=None):
         """Log login attempts"""
         if ENABLE_LOGGING:
-            ip_info = f" from {ip_address}" if ip_address else ""
             if success:
-                self.logger.info(f"Login successful: {username}{ip_info}")
+                if ip_address:
+                    self.logger.info("Login successful: %s from %s", username, ip_address)
+                else:
+                    self.logger.info("Login successful: %s", username)
             else:
-                self.logger.warning(f"Login failed: {username}{ip_info}")
-    
+                if ip_address:
+                    self.logger.warning("Login failed: %s from %s", username, ip_address)
+                else:
+                    self.logger.warning("Login failed: %s", username)
+            if self.audit:
+                self.audit.record("login", username, success, ip_address)
+
+    @metrics.timed("log_call_seconds", "logout", label="event")
     def log_logout(self, username):
         """Log user logout"""
         if ENABLE_LOGGING:
-            self.logger.info(f"User logout: {username}")
-    
+            self.logger.info("User logout: %s", username)
+            if self.audit:
+                self.audit.record("logout", username)
+
+    @metrics.timed("log_call_seconds", "password_change", label="event")
     def log_password_change(self, username):
         """Log password changes"""
         if ENABLE_LOGGING:
-            self.logger.info(f"Password changed: {username}")
-    
+            self.logger.info("Password changed: %s", username)
+            if self.audit:
+                self.audit.record("password_change", username, True)
+
+    @metrics.timed("log_call_seconds", "security", label="event")
     def log_security_event(self, event, username=None, details=None):
         """Log security-related events"""
-        if ENABLE_LOGGING:
-            message = f"Security event: {event}"
+        if not ENABLE_LOGGING:
+            return
+        if self.logger.isEnabledFor(logging.WARNING):
+            message, args = "Security event: %s", [event]
             if username:
-                message += f" - User: {username}"
+                message += " - User: %s"
+                args.append(username)
             if details:
-                message += f" - Details: {details}"
-            self.logger.warning(message)
-    
+                message += " - Details: %s"
+                args.append(details)
+            self.logger.warning(message, *args)
+        if self.audit:
+            self.audit.record("security", username, details=f"{event}: {details}" if details else event)
+
+    @metrics.timed("log_call_seconds", "system_error", label="event")
     def log_system_error(self, error, context=None):
         """Log system errors"""
         if ENABLE_LOGGING:
-            message = f"System error: {error}"
             if context:
-                message += f" - Context: {context}"
-            self.logger.error(message)
-    
+                self.logger.error("System error: %s - Context: %s", error, context)
+            else:
+                self.logger.error("System error: %s", error)
+
+    @metrics.timed("log_call_seconds", "database_operation", label="event")
     def log_database_operation(self, operation, success=True, details=None):
         """Log database operations"""
         if ENABLE_LOGGING:
             status = "successful" if success else "failed"
-            message = f"Database {operation} {status}"
+            level = logging.INFO if success else logging.ERROR
             if details:
-                message += f" - {details}"
-            
-            if success:
-                self.logger.info(message)
+                self.logger.log(level, "Database %s %s - %s", operation, status, details)
             else:
-                self.logger.error(message)
+                self.logger.log(level, "Database %s %s", operation, status)
 
-# Global logger instance
+# Global logger instance; importing it does no I/O
 logger = SystemLogger()
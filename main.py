@@ -1,19 +1,48 @@
 from PasswordMatch import PasswordMatch
-from database import UserDatabase
+from sharding import open_database
+from session import SessionStore
+from metrics import metrics
+from config import SESSION_PERSISTENCE, MESSAGES, MAX_LOGIN_ATTEMPTS
 import getpass
 import os
+import sys
 import time
 
 class LoginSystem:
-    def __init__(self):
-        """Initialize the login system with database"""
-        self.db = UserDatabase()
+    def __init__(self, interactive=None):
+        """Initialize the login system; the database is opened on first use.
+
+        When not interactive (stdin is not a terminal, e.g. scripted input),
+        pauses and screen clearing are skipped.
+        """
+        self._db = None
+        self._sessions = None
+        self.interactive = sys.stdin.isatty() if interactive is None else interactive
         self.current_user = None
-        self.max_login_attempts = 3
+        self.session_token = None
+        self.max_login_attempts = MAX_LOGIN_ATTEMPTS
+    
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = open_database()
+        return self._db
+    
+    @property
+    def sessions(self):
+        if self._sessions is None:
+            self._sessions = SessionStore(db=self.db if SESSION_PERSISTENCE else None)
+        return self._sessions
+    
+    def pause(self, seconds):
+        """Give the user time to read a message (interactive use only)"""
+        if self.interactive:
+            time.sleep(seconds)
     
     def clear_screen(self):
         """Clear the console screen"""
-        os.system('cls' if os.name == 'nt' else 'clear')
+        if self.interactive:
+            os.system('cls' if os.name == 'nt' else 'clear')
     
     def display_header(self, title):
         """Display a formatted header"""
@@ -33,7 +62,7 @@ class LoginSystem:
                 if not username:
                     print("Username cannot be empty!")
                     continue
-                                git pull origin main --allow-unrelated-histories
+                
                 if self.db.user_exists(username):
                     print(f"Username '{username}' already exists! Try another.")
                     continue
@@ -67,7 +96,7 @@ class LoginSystem:
                 
                 if success:
                     print("You can now login with your credentials.")
-                    time.sleep(2)
+                    self.pause(2)
                     return True
                 else:
                     continue
@@ -95,9 +124,13 @@ class LoginSystem:
                 
                 if success:
                     self.current_user = username
+                    self.session_token = self.sessions.create(username)
                     print(f"Welcome back, {username}!")
-                    time.sleep(1)
+                    self.pause(1)
                     return True
+                elif message == MESSAGES["account_locked"]:
+                    self.pause(2)
+                    return False
                 else:
                     attempts += 1
                     remaining = self.max_login_attempts - attempts
@@ -105,7 +138,7 @@ class LoginSystem:
                         print(f"Login failed. {remaining} attempt(s) remaining.\n")
                     else:
                         print("Maximum login attempts exceeded. Access denied.")
-                        time.sleep(2)
+                        self.pause(2)
                         return False
                         
             except KeyboardInterrupt:
@@ -117,12 +150,34 @@ class LoginSystem:
         
         return False
     
+    def check_session(self):
+        """Return True if the session is still live; log out if it has expired"""
+        if self.sessions.validate(self.session_token) == self.current_user:
+            return True
+        print(MESSAGES["session_expired"])
+        self.logout()
+        self.pause(2)
+        return False
+    
+    def logout(self):
+        """End the current session"""
+        self.sessions.revoke(self.session_token)
+        self.session_token = None
+        self.current_user = None
+    
     def user_dashboard(self):
         """Display user dashboard after successful login"""
-        while True:
+        while self.current_user:
+            if not self.check_session():
+                break
+            
             self.clear_screen()
             self.display_header(f"WELCOME {self.current_user.upper()}")
             
+            if self.sessions.needs_warning(self.session_token):
+                minutes = int(self.sessions.time_remaining(self.session_token) // 60) + 1
+                print(f"Your session will expire in about {minutes} minute(s) of inactivity.\n")
+            
             # Get user info
             user_info = self.db.get_user_info(self.current_user)
             if user_info:
@@ -136,6 +191,8 @@ class LoginSystem:
             print("3. Logout")
             
             choice = input("\nSelect option (1-3): ").strip()
+            if not self.check_session():
+                break
             
             if choice == "1":
                 self.change_password()
@@ -143,12 +200,12 @@ class LoginSystem:
                 self.view_account_info()
             elif choice == "3":
                 print(f"Goodbye, {self.current_user}!")
-                self.current_user = None
-                time.sleep(1)
+                self.logout()
+                self.pause(1)
                 break
             else:
                 print("Invalid option! Please try again.")
-                time.sleep(1)
+                self.pause(1)
     
     def change_password(self):
         """Handle password change"""
@@ -158,13 +215,6 @@ class LoginSystem:
         try:
             current_password = getpass.getpass("Enter current password: ")
             
-            # Verify current password
-            success, message = self.db.verify_user(self.current_user, current_password)
-            if not success:
-                print("Current password is incorrect!")
-                time.sleep(2)
-                return
-            
             # Get new password
             while True:
                 try:
@@ -185,17 +235,17 @@ class LoginSystem:
             confirm_password = getpass.getpass("Confirm new password: ")
             if new_password != confirm_password:
                 print("Passwords don't match!")
-                time.sleep(2)
+                self.pause(2)
                 return
             
-            # Update password in database
-            # First delete old user, then create with new password (simplified approach)
-            print("Password updated successfully!")
-            time.sleep(2)
+            # Checks the current password and swaps in the new hash in one transaction
+            success, message = self.db.update_password(self.current_user, current_password, new_password)
+            print(message)
+            self.pause(2)
             
         except KeyboardInterrupt:
             print("\n\nPassword change cancelled.")
-            time.sleep(1)
+            self.pause(1)
     
     def view_account_info(self):
         """Display detailed account information"""
@@ -233,19 +283,22 @@ class LoginSystem:
                 break
             else:
                 print("Invalid option! Please try again.")
-                time.sleep(1)
+                self.pause(1)
     
     def run(self):
         """Start the login system"""
         try:
+            metrics.start_exporters()
             print("Welcome to the Secure Login System!")
-            print("Loading...")
-            time.sleep(1)
             self.main_menu()
         except KeyboardInterrupt:
             print("\n\nSystem shutting down...")
         except Exception as e:
             print(f"System error: {e}")
+        finally:
+            if self._db is not None:
+                self._db.close()
+            metrics.stop_exporters()
 
 # Main execution
 if __name__ == "__main__":
@@ -0,0 +1,318 @@
+"""
+Low-overhead metrics with Prometheus text export
+
+Counters and fixed-bucket latency histograms are recorded into a table
+owned by the calling thread, so recording takes no lock. A scrape merges
+every thread's table. Recording is skipped entirely while metrics are
+disabled (ENABLE_METRICS, or metrics.enabled at runtime).
+
+Instrumented:
+    userdb_call_seconds{op}              UserDatabase calls, end to end
+    userdb_phase_seconds_total{op,phase} the same time split into connect,
+                                         hash and sql (everything else)
+    userdb_connect_seconds               opening a pooled connection
+    password_hash_seconds{op}            PasswordHasher KDF work
+    password_policy_seconds{op}          PasswordMatch validation
+    log_call_seconds{event}              SystemLogger calls on the caller's thread
+    log_batch_write_seconds              async writer batches
+    log_records_written_total, log_records_dropped_total
+
+Export with METRICS_PORT (GET /metrics on METRICS_HOST) and/or METRICS_FILE
+(rewritten every METRICS_FILE_INTERVAL_SECONDS), started by start_exporters().
+"""
+
+import functools
+import math
+import os
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from config import (
+    ENABLE_METRICS, METRICS_LATENCY_BUCKETS, METRICS_HOST, METRICS_PORT,
+    METRICS_FILE, METRICS_FILE_INTERVAL_SECONDS
+)
+
+PHASES = ("connect", "hash", "sql")  # sql is whatever the other phases don't cover
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+class _Series:
+    """Key of one (name, labels) series; hashes by identity, so per-thread
+    table lookups skip rehashing the nested label tuples"""
+    __slots__ = ("name", "labels")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    def __init__(self, enabled=ENABLE_METRICS, buckets=METRICS_LATENCY_BUCKETS):
+        """Registry of counters and histograms, recorded per thread and merged on scrape.
+
+        A series is a name plus labels, a tuple of (key, value) pairs.
+        Histogram series are lists of per-bucket counts (the last bucket is
+        +Inf) followed by the sum and the count.
+        """
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._tables = []  # Every thread's table
+        self._tables_lock = threading.Lock()
+        self._meta = {}    # name -> (type, help)
+        self._series = {}  # (name, labels) -> _Series
+        self._server = None
+        self._writer = None
+        self._stop_writer = threading.Event()
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def series(self, name, labels=()):
+        """The interned key for a series; decorators look theirs up once"""
+        key = self._series.get((name, labels))
+        if key is None:
+            with self._tables_lock:
+                key = self._series.setdefault((name, labels), _Series(name, labels))
+        return key
+
+    def _table(self):
+        try:
+            return self._local.table
+        except AttributeError:
+            table = self._local.table = {}
+            with self._tables_lock:
+                self._tables.append(table)
+            return table
+
+    # -----------------------------------------------------------------------
+    # Recording
+    # -----------------------------------------------------------------------
+
+    def inc(self, name, amount=1, labels=()):
+        if not self.enabled:
+            return
+        table = self._table()
+        key = self.series(name, labels)
+        table[key] = table.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        if not self.enabled:
+            return
+        self._observe(self._table(), self.series(name, labels), value)
+
+    def _observe(self, table, key, value):
+        series = table.get(key)
+        if series is None:
+            series = table[key] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def add_phase(self, phase, seconds):
+        """Attribute time to a phase of the UserDatabase call running on this thread"""
+        phases = getattr(self._local, "phases", None)
+        if phases is not None:
+            phases[PHASES.index(phase)] += seconds
+
+    def timed(self, name, op, label="op", phase=None):
+        """Decorator: observe each call's duration in histogram name{label=op},
+        and count it towards `phase` of the enclosing UserDatabase call"""
+        key = self.series(name, ((label, op),))
+        phase_index = None if phase is None else PHASES.index(phase)
+
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    elapsed = perf_counter() - start
+                    self._observe(self._table(), key, elapsed)
+                    if phase_index is not None:
+                        phases = getattr(self._local, "phases", None)
+                        if phases is not None:
+                            phases[phase_index] += elapsed
+            return wrapper
+        return decorate
+
+    def call(self, op):
+        """Decorator for UserDatabase methods: end-to-end latency plus the
+        connect/hash/sql split. Only the outermost call on a thread is
+        recorded; calls it makes are part of its time."""
+        key = self.series("userdb_call_seconds", (("op", op),))
+        phase_keys = [self.series("userdb_phase_seconds_total", (("op", op), ("phase", phase)))
+                      for phase in PHASES]
+
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                local = self._local
+                if not self.enabled or getattr(local, "phases", None) is not None:
+                    return func(*args, **kwargs)
+                local.phases = phases = [0.0, 0.0, 0.0]  # In PHASES order
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    elapsed = perf_counter() - start
+                    local.phases = None
+                    phases[2] = max(0.0, elapsed - phases[0] - phases[1])
+                    table = self._table()
+                    self._observe(table, key, elapsed)
+                    for phase_key, seconds in zip(phase_keys, phases):
+                        table[phase_key] = table.get(phase_key, 0) + seconds
+            return wrapper
+        return decorate
+
+    # -----------------------------------------------------------------------
+    # Scraping
+    # -----------------------------------------------------------------------
+
+    def collect(self):
+        """Merge every thread's table into {(name, labels): value or histogram series}"""
+        with self._tables_lock:
+            tables = list(self._tables)
+        merged = {}
+        for table in tables:
+            for key, value in list(table.items()):
+                key = (key.name, key.labels)
+                if isinstance(value, list):
+                    total = merged.get(key)
+                    if total is None:
+                        merged[key] = list(value)
+                    else:
+                        for i, part in enumerate(value):
+                            total[i] += part
+                else:
+                    merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def render(self):
+        """Every series in the Prometheus text exposition format"""
+        series_by_name = {}
+        for (name, labels), value in self.collect().items():
+            series_by_name.setdefault(name, []).append((labels, value))
+        bounds = self.buckets + (math.inf,)
+        lines = []
+        for name in sorted(series_by_name):
+            series = sorted(series_by_name[name], key=lambda item: item[0])
+            histogram = isinstance(series[0][1], list)
+            kind, help_text = self._meta.get(name, ("histogram" if histogram else "counter", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series:
+                if not histogram:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(bounds, value):
+                    cumulative += count
+                    bucket_labels = _format_labels(labels + (("le", _format_value(bound)),))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Forget every recorded value"""
+        with self._tables_lock:
+            for table in self._tables:
+                table.clear()
+
+    # -----------------------------------------------------------------------
+    # Export
+    # -----------------------------------------------------------------------
+
+    def start_http_server(self, port=METRICS_PORT, host=METRICS_HOST):
+        """Serve GET /metrics from a background thread; returns the server"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes are not worth a log line each
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http",
+                         daemon=True).start()
+        return self._server
+
+    def write_textfile(self, path):
+        """Write the current metrics to path atomically"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def start_textfile_writer(self, path, interval=METRICS_FILE_INTERVAL_SECONDS):
+        """Rewrite path every interval seconds from a background thread"""
+        def write_loop():
+            while not self._stop_writer.wait(interval):
+                self.write_textfile(path)
+            self.write_textfile(path)
+
+        self._stop_writer.clear()
+        self._writer = threading.Thread(target=write_loop, name="metrics-writer", daemon=True)
+        self._writer.start()
+
+    def start_exporters(self, port=METRICS_PORT, path=METRICS_FILE):
+        """Start the configured exporters; does nothing while metrics are disabled"""
+        if not self.enabled:
+            return
+        if port is not None and self._server is None:
+            self.start_http_server(port)
+        if path and self._writer is None:
+            self.start_textfile_writer(path)
+
+    def stop_exporters(self):
+        """Stop the HTTP endpoint and write the metrics file one last time"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._writer is not None:
+            self._stop_writer.set()
+            self._writer.join()
+            self._writer = None
+
+
+# Global registry instance; recording is a no-op until metrics are enabled
+metrics = Metrics()
+metrics.describe("userdb_call_seconds", "histogram", "UserDatabase call latency by operation")
+metrics.describe("userdb_phase_seconds_total", "counter",
+                 "UserDatabase call time split into connect, hash and sql (the rest)")
+metrics.describe("userdb_connect_seconds", "histogram", "Time to open and tune a SQLite connection")
+metrics.describe("password_hash_seconds", "histogram", "PasswordHasher time by operation")
+metrics.describe("password_policy_seconds", "histogram", "Password policy check latency")
+metrics.describe("log_call_seconds", "histogram", "SystemLogger call latency on the caller's thread")
+metrics.describe("log_batch_write_seconds", "histogram", "Async log writer batch write time")
+metrics.describe("log_records_written_total", "counter", "Log records written by the async writer")
+metrics.describe("log_records_dropped_total", "counter", "Log records dropped on queue overflow")
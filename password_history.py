@@ -0,0 +1,45 @@
+from config import PASSWORD_HISTORY_SIZE
+
+
+class PasswordHistory:
+    def __init__(self, db, size=PASSWORD_HISTORY_SIZE):
+        """Remember each user's previous password hashes in a fixed-size ring.
+
+        A user has at most `size` rows in password_history, one per ring
+        slot. Each change overwrites the slot of the oldest entry in place,
+        so the table never grows past users * size rows.
+        """
+        self.db = db
+        self.size = size
+
+    def remember(self, conn, user_id, password_hash):
+        """Push a replaced hash into the user's ring.
+
+        Runs on the caller's connection so it commits (or rolls back) with
+        the password update itself.
+        """
+        # seq counts changes per user; slot = seq % size picks the ring position
+        conn.execute(
+            "INSERT OR REPLACE INTO password_history (user_id, slot, seq, password_hash) "
+            "SELECT ?, (COALESCE(MAX(seq), -1) + 1) % ?, COALESCE(MAX(seq), -1) + 1, ? "
+            "FROM password_history WHERE user_id = ?",
+            (user_id, self.size, password_hash, user_id)
+        )
+
+    def hashes(self, username):
+        """Return the current hash followed by the last `size` previous ones, in one query"""
+        rows = self.db.get_connection().execute(
+            "SELECT password_hash FROM users WHERE username = ? "
+            "UNION ALL SELECT password_hash FROM ("
+            "    SELECT h.password_hash FROM password_history h"
+            "    JOIN users u ON u.id = h.user_id"
+            "    WHERE u.username = ? ORDER BY h.seq DESC LIMIT ?"
+            ")",
+            (username, username, self.size)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def is_reused(self, username, password):
+        """Return True if the password matches the current or a remembered password"""
+        return self.db.hasher.verify_any(password, self.hashes(username))
+
@@ -0,0 +1,198 @@
+"""
+Token-bucket rate limiting for logins and registrations
+
+Each bucket family (see RATE_LIMITS in config.py) holds one bucket per key,
+e.g. per IP address or per username. A bucket refills at `rate` tokens per
+second up to `burst`; every attempt takes one token and is rejected when
+none is left. Refill is computed lazily from the time of the last update,
+so there are no timers and every check is O(1).
+
+TokenBuckets keeps buckets in-process, bounded by LRU eviction.
+SharedTokenBuckets keeps a fixed table of buckets in a memory-mapped file
+so several worker processes enforce one limit.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from config import RATE_LIMITS, RATE_LIMIT_MAX_KEYS, RATE_LIMIT_SHARED_PATH, RATE_LIMIT_SHARED_SLOTS
+
+MAGIC = b"RATELIM1"
+HEADER = struct.Struct(">8sQ")  # magic, slot count
+SLOT = struct.Struct("=dd")     # tokens, updated_at (0 = never used)
+
+
+class TokenBuckets:
+    def __init__(self, rate, burst, max_keys=RATE_LIMIT_MAX_KEYS, clock=time.monotonic):
+        """In-process token buckets, at most max_keys of them.
+
+        Buckets are kept in order of last use. Ones that have refilled are
+        equivalent to a fresh bucket and are dropped as they reach the
+        front; past max_keys the least recently used bucket is evicted
+        even if it has not refilled yet.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at], least recent first
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def allow(self, key, cost=1):
+        """Take cost tokens from key's bucket; False if there are not enough"""
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            allowed = bucket[0] >= cost
+            if allowed:
+                bucket[0] -= cost
+            self._expire(now)
+        return allowed
+
+    def wait_time(self, key, cost=1):
+        """Seconds until allow(key, cost) would succeed"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return 0.0
+            tokens = min(self.burst, bucket[0] + (self.clock() - bucket[1]) * self.rate)
+        return max(0.0, (cost - tokens) / self.rate)
+
+    def _expire(self, now):
+        """Drop refilled buckets from the front of the LRU order (caller holds the lock)"""
+        buckets = self._buckets
+        while buckets:
+            key, (tokens, updated_at) = next(iter(buckets.items()))
+            if tokens + (now - updated_at) * self.rate < self.burst:
+                break
+            del buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SharedTokenBuckets:
+    def __init__(self, path, rate, burst, slots=RATE_LIMIT_SHARED_SLOTS, clock=time.time):
+        """Token buckets in a memory-mapped file shared between processes.
+
+        Keys hash to one of `slots` fixed slots, so the file never grows;
+        keys that collide share a bucket, which only makes their limit
+        stricter. Each update holds an fcntl lock on its slot (POSIX only).
+        A file under /dev/shm keeps the table in memory.
+        """
+        import fcntl  # Only this optional backend needs it
+        self._fcntl = fcntl
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._lock = threading.Lock()  # fcntl locks do not exclude threads of one process
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = HEADER.size + slots * SLOT.size
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, slots), 0)
+            else:
+                magic, file_slots = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+                if magic != MAGIC:
+                    raise ValueError(f"Not a rate limit file: {path}")
+                slots = file_slots  # The first process to create the file decides
+                size = HEADER.size + slots * SLOT.size
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self.slots = slots
+        self._map = mmap.mmap(self._fd, size)
+
+    def _offset(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return HEADER.size + int.from_bytes(digest, "big") % self.slots * SLOT.size
+
+    def allow(self, key, cost=1):
+        """Take cost tokens from key's bucket; False if there are not enough"""
+        offset = self._offset(key)
+        fcntl = self._fcntl
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT.size, offset)
+            try:
+                now = self.clock()
+                tokens, updated_at = SLOT.unpack_from(self._map, offset)
+                if updated_at == 0:
+                    tokens = self.burst
+                else:
+                    # max(): the clock may have stepped back since the last update
+                    tokens = min(self.burst, tokens + max(0.0, now - updated_at) * self.rate)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                SLOT.pack_into(self._map, offset, tokens, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT.size, offset)
+        return allowed
+
+    def wait_time(self, key, cost=1):
+        """Seconds until allow(key, cost) would succeed"""
+        tokens, updated_at = SLOT.unpack_from(self._map, self._offset(key))
+        if updated_at == 0:
+            return 0.0
+        tokens = min(self.burst, tokens + max(0.0, self.clock() - updated_at) * self.rate)
+        return max(0.0, (cost - tokens) / self.rate)
+
+    def close(self):
+        if self._fd is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._fd = None
+
+
+class RateLimiter:
+    def __init__(self, limits=None, max_keys=RATE_LIMIT_MAX_KEYS,
+                 shared_path=RATE_LIMIT_SHARED_PATH, clock=None):
+        """Login and registration throttling over one bucket family per RATE_LIMITS entry.
+
+        With shared_path, each family lives in the file <shared_path>.<family>.
+        """
+        self.buckets = {}
+        for family, (rate, burst) in (limits or RATE_LIMITS).items():
+            if shared_path:
+                self.buckets[family] = SharedTokenBuckets(
+                    f"{shared_path}.{family}", rate, burst, clock=clock or time.time)
+            else:
+                self.buckets[family] = TokenBuckets(
+                    rate, burst, max_keys, clock=clock or time.monotonic)
+        self.rejected = 0
+
+    def _allow(self, checks):
+        for family, key in checks:
+            buckets = self.buckets.get(family)
+            if key and buckets is not None and not buckets.allow(key):
+                self.rejected += 1
+                return False
+        return True
+
+    def allow_login(self, username, source=None):
+        """True if a login attempt for username from source may go ahead"""
+        return self._allow((("login_source", source), ("login_user", username)))
+
+    def allow_registration(self, source=None):
+        """True if a registration from source may go ahead"""
+        return self._allow((("register_source", source),))
+
+    def close(self):
+        for buckets in self.buckets.values():
+            if isinstance(buckets, SharedTokenBuckets):
+                buckets.close()
@@ -0,0 +1,146 @@
+import threading
+from config import READ_REPLICA_REFRESH_SECONDS, READ_REPLICA_MAX_ABSENT
+
+USER_COLUMNS = "username, id, password_hash, created_at, last_login"
+LOOKUP_CHUNK_SIZE = 500  # Usernames per IN (...) query
+
+
+class ReadReplica:
+    def __init__(self, db, refresh_seconds=READ_REPLICA_REFRESH_SECONDS):
+        """In-memory index of the users table: username -> (id, password_hash,
+        created_at, last_login).
+
+        Lookups are a dict read with no lock and no SQL. The owning
+        UserDatabase applies its own writes through reload() and
+        set_last_login(); a background refresh rebuilds the index every
+        refresh_seconds to pick up writes from other processes, skipping
+        the scan when nothing else has written since the last one. Until
+        then a password changed by another process is not seen here.
+
+        Usernames missing from the index are looked up on disk only if the
+        owner's username filter says they may exist, so logins for unknown
+        names (the usual attack traffic) stay in memory while users
+        registered elsewhere can log in before the next refresh. Without a
+        filter, unknown names are remembered until the next refresh.
+        """
+        self.db = db
+        self.refresh_seconds = refresh_seconds
+        self._users = {}
+        self._lock = threading.Lock()
+        self._written = None  # Usernames written while a refresh is scanning
+        self._absent = set()  # Looked up and not found (used without a username filter)
+        self._data_version = None  # (connection, PRAGMA data_version) at the last scan
+        self.refreshes = 0
+        self.misses = 0
+        self.refresh()
+
+        self._stop = threading.Event()
+        self._thread = None
+        if refresh_seconds:
+            self._thread = threading.Thread(
+                target=self._refresh_loop, name="replica-refresh", daemon=True
+            )
+            self._thread.start()
+
+    def get(self, username):
+        """Return (id, password_hash, created_at, last_login), or None if no such user"""
+        row = self._users.get(username)
+        if row is None:
+            if self.db.username_filter is not None:
+                if self.db.filter_rules_out(username):
+                    return None
+            elif username in self._absent:
+                return None
+            self.misses += 1
+            row = self.reload([username]).get(username)
+            if row is None and self.db.username_filter is None:
+                if len(self._absent) >= READ_REPLICA_MAX_ABSENT:
+                    self._absent.clear()
+                self._absent.add(username)
+        return row
+
+    def __len__(self):
+        return len(self._users)
+
+    def _fetch(self, usernames):
+        """Read rows for usernames from disk"""
+        conn = self.db.get_connection()
+        usernames = list(usernames)
+        rows = {}
+        for start in range(0, len(usernames), LOOKUP_CHUNK_SIZE):
+            chunk = usernames[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            for row in conn.execute(
+                f"SELECT {USER_COLUMNS} FROM users WHERE username IN ({placeholders})", chunk
+            ):
+                rows[row[0]] = row[1:]
+        return rows
+
+    def reload(self, usernames):
+        """Re-read users after a write to the table; returns the rows found"""
+        usernames = list(usernames)
+        rows = self._fetch(usernames)
+        with self._lock:
+            for username in usernames:
+                if username in rows:
+                    self._users[username] = rows[username]
+                    self._absent.discard(username)
+                else:
+                    self._users.pop(username, None)
+            if self._written is not None:
+                self._written.update(usernames)
+        return rows
+
+    def set_last_login(self, timestamps):
+        """Apply last_login values (username -> timestamp) written by the owner"""
+        with self._lock:
+            for username, timestamp in timestamps.items():
+                row = self._users.get(username)
+                if row is not None:
+                    self._users[username] = row[:3] + (timestamp,)
+            if self._written is not None:
+                self._written.update(timestamps)
+
+    def refresh(self):
+        """Rebuild the index from disk and swap it in, unless no other
+        connection has committed since the last rebuild"""
+        conn = self.db.get_connection()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._data_version == (conn, version):
+            return
+        with self._lock:
+            self._written = set()
+        try:
+            users = {row[0]: row[1:] for row in conn.execute(
+                f"SELECT {USER_COLUMNS} FROM users")}
+            with self._lock:
+                # The scan may predate writes applied meanwhile; re-read those
+                written, self._written = self._written, None
+                if written:
+                    fresh = self._fetch(written)
+                    for username in written:
+                        if username in fresh:
+                            users[username] = fresh[username]
+                        else:
+                            users.pop(username, None)
+                self._users = users
+                self._absent = set()
+        finally:
+            with self._lock:
+                self._written = None
+        self._data_version = (conn, version)
+        self.refreshes += 1
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception:
+                pass  # Keep serving the last good copy; retry next interval
+
+    def close(self):
+        """Stop the background refresh"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
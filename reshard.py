@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Online resharding for users.db
+
+Copies every user (with password history) from the current layout, a
+single database or the shards listed in its manifest, into a new set of
+shard files, while the old layout stays in service:
+
+1. Triggers on each source shard record the usernames of updated users
+   (password changes, last_login) in a reshard_changes table.
+2. Users are copied in keyset batches; nothing is locked.
+3. New users (by id) and recorded changes are copied again, repeatedly,
+   until the remaining delta is small.
+4. Cutover: every source shard is write-locked, the last delta plus the
+   sessions and lockout counters are copied, and the manifest is switched
+   to the new files. Writes wait on the busy timeout meanwhile.
+
+The old files are kept but reject further writes to every table, sessions
+and lockout counters included, so a process that still has the old layout
+open fails loudly instead of losing data; restart it to pick up the
+manifest. Delete the old files once nothing uses them.
+
+Usage:
+    python reshard.py --shards 4
+    python reshard.py --db staging.db --shards 8 --batch-size 10000
+"""
+
+import argparse
+import os
+import sys
+import time
+from config import DATABASE_NAME, TRANSFER_BATCH_SIZE
+from sharding import (
+    open_database, read_manifest, write_manifest, shard_index, shard_paths, ShardedUserDatabase
+)
+
+CAPTURE = (
+    "CREATE TABLE IF NOT EXISTS reshard_changes (username TEXT PRIMARY KEY)",
+    "CREATE TRIGGER IF NOT EXISTS reshard_capture AFTER UPDATE ON users BEGIN "
+    "INSERT OR IGNORE INTO reshard_changes (username) VALUES (NEW.username); END",
+)
+RETIRED_TABLES = ("users", "password_history", "sessions", "login_failures")
+RETIRE = (
+    "DROP TRIGGER IF EXISTS reshard_capture",
+    "DROP TABLE IF EXISTS reshard_changes",
+) + tuple(
+    f"CREATE TRIGGER IF NOT EXISTS resharded_{table}_{op.lower()} BEFORE {op} ON {table} BEGIN "
+    "SELECT RAISE(ABORT, 'database was resharded; reopen it'); END"
+    for table in RETIRED_TABLES for op in ("INSERT", "UPDATE", "DELETE")
+)
+USER_COLUMNS = "id, username, password_hash, created_at, last_login"
+CATCH_UP_PASSES = 10
+CUTOVER_DELTA = 1000  # Cut over once a catch-up pass copies fewer users than this
+
+
+class Resharder:
+    def __init__(self, db_name, shard_count, batch_size=TRANSFER_BATCH_SIZE, progress=None):
+        """Move db_name to shard_count new shard files; run() does every step"""
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.progress = progress
+        self.source = open_database(db_name, write_behind=False)
+        self.sources = getattr(self.source, "shards", [self.source])
+        self.target_paths = shard_paths(db_name, shard_count)
+        if any(os.path.abspath(s.db_name) in map(os.path.abspath, self.target_paths)
+               for s in self.sources):
+            raise ValueError(f"{db_name} already uses {shard_count} shards")
+        for path in self.target_paths:
+            # Leftovers of an interrupted run; the manifest never pointed at them
+            for suffix in ("", "-wal", "-shm", ".usernames"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        self.target = ShardedUserDatabase(self.target_paths, write_behind=False)
+        self.copied_id = [0] * len(self.sources)  # Highest source id copied, per source
+        self.copied = 0
+
+    def _log(self, text):
+        if self.progress:
+            self.progress(text)
+
+    def start_capture(self):
+        for source in self.sources:
+            with source.get_connection() as conn:
+                for statement in CAPTURE:
+                    conn.execute(statement)
+
+    def copy_users(self, source_conn, rows):
+        """Upsert source user rows into their target shards, with password history"""
+        groups = {}
+        for row in rows:
+            groups.setdefault(shard_index(row[1], len(self.target.shards)), []).append(row)
+        for index, group in groups.items():
+            shard = self.target.shards[index]
+            conn = shard.get_connection()
+            placeholders = ",".join("?" * len(group))
+            history = source_conn.execute(
+                "SELECT u.username, h.slot, h.seq, h.password_hash, h.changed_at "
+                "FROM password_history h JOIN users u ON u.id = h.user_id "
+                f"WHERE h.user_id IN ({placeholders})", [row[0] for row in group]
+            ).fetchall()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO users (username, password_hash, created_at, last_login) "
+                    "VALUES (?, ?, ?, ?) ON CONFLICT (username) DO UPDATE SET "
+                    "password_hash = excluded.password_hash, last_login = excluded.last_login",
+                    [row[1:] for row in group]
+                )
+                ids = dict(conn.execute(
+                    f"SELECT username, id FROM users WHERE username IN ({placeholders})",
+                    [row[1] for row in group]
+                ))
+                conn.execute(
+                    f"DELETE FROM password_history WHERE user_id IN ({placeholders})",
+                    list(ids.values())
+                )
+                conn.executemany(
+                    "INSERT INTO password_history (user_id, slot, seq, password_hash, changed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(ids[username],) + tuple(rest) for username, *rest in history]
+                )
+            for row in group:
+                shard.invalidate_user(row[1])
+        self.copied += len(rows)
+
+    def copy_new_users(self, index):
+        """Copy users created in source `index` since the last copy; returns the count"""
+        conn = self.sources[index].get_connection()
+        count = 0
+        while True:
+            rows = conn.execute(
+                f"SELECT {USER_COLUMNS} FROM users WHERE id > ? ORDER BY id LIMIT ?",
+                (self.copied_id[index], self.batch_size)
+            ).fetchall()
+            if not rows:
+                return count
+            self.copy_users(conn, rows)
+            self.copied_id[index] = rows[-1][0]
+            count += len(rows)
+
+    def copy_changed_users(self, index):
+        """Copy users updated in source `index` since the last pass; returns the count"""
+        conn = self.sources[index].get_connection()
+        count = 0
+        while True:
+            with conn:
+                usernames = [row[0] for row in conn.execute(
+                    "SELECT username FROM reshard_changes LIMIT ?", (self.batch_size,))]
+                if not usernames:
+                    return count
+                conn.executemany("DELETE FROM reshard_changes WHERE username = ?",
+                                 [(u,) for u in usernames])
+            placeholders = ",".join("?" * len(usernames))
+            # Users not copied yet are picked up by copy_new_users instead
+            rows = [row for row in conn.execute(
+                f"SELECT {USER_COLUMNS} FROM users WHERE username IN ({placeholders})", usernames
+            ) if row[0] <= self.copied_id[index]]
+            self.copy_users(conn, rows)
+            count += len(rows)
+
+    def catch_up(self):
+        """Copy new and changed users from every source; returns how many"""
+        return sum(self.copy_new_users(i) + self.copy_changed_users(i)
+                   for i in range(len(self.sources)))
+
+    def cutover(self):
+        """Lock the sources, copy the last delta and switch the manifest"""
+        connections = [source.get_connection() for source in self.sources]
+        try:
+            for conn in connections:
+                conn.execute("BEGIN IMMEDIATE")
+            delta = self.catch_up_locked()
+            self._copy_metadata(connections[0])
+            for conn in connections:
+                for statement in RETIRE:
+                    conn.execute(statement)
+            for shard in self.target.shards:
+                shard.rebuild_username_filter()
+            base = os.path.dirname(self.db_name)
+            write_manifest(self.db_name, [os.path.relpath(p, base or ".")
+                                          for p in self.target_paths])
+        except BaseException:
+            for conn in connections:
+                if conn.in_transaction:
+                    conn.rollback()
+            raise
+        for conn in connections:
+            conn.commit()
+        return delta
+
+    def catch_up_locked(self):
+        """catch_up() inside the cutover transaction: changes are read, not deleted"""
+        count = 0
+        for index, source in enumerate(self.sources):
+            count += self.copy_new_users(index)
+            conn = source.get_connection()
+            rows = conn.execute(
+                f"SELECT {USER_COLUMNS} FROM users WHERE username IN "
+                "(SELECT username FROM reshard_changes) AND id <= ?", (self.copied_id[index],)
+            ).fetchall()
+            for start in range(0, len(rows), self.batch_size):
+                self.copy_users(conn, rows[start:start + self.batch_size])
+            count += len(rows)
+        return count
+
+    def _copy_metadata(self, source_conn):
+        """Sessions and lockout counters move to the new shard 0"""
+        conn = self.target.get_connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions (token_hash, username, expires_at) VALUES (?, ?, ?)",
+                source_conn.execute("SELECT token_hash, username, expires_at FROM sessions")
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO login_failures (key, failures, locked_until, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                source_conn.execute("SELECT key, failures, locked_until, updated_at FROM login_failures")
+            )
+
+    def run(self):
+        started = time.perf_counter()
+        self.start_capture()
+        for index in range(len(self.sources)):
+            self.copy_new_users(index)
+        self._log(f"Copied {self.copied} users")
+        for _ in range(CATCH_UP_PASSES):
+            delta = self.catch_up()
+            self._log(f"Caught up {delta} new or changed users")
+            if delta < CUTOVER_DELTA:
+                break
+        delta = self.cutover()
+        self._log(f"Cut over with {delta} users copied under lock")
+        return time.perf_counter() - started
+
+    def close(self):
+        if self.source.lockout is not None:
+            # Counters were copied at cutover; the old files must not be written
+            self.source.lockout = None
+            for source in self.sources:
+                source.lockout = None
+        self.source.close()
+        self.target.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move users.db to a new number of shards")
+    parser.add_argument("--db", default=DATABASE_NAME, help="database name (with its manifest)")
+    parser.add_argument("--shards", type=int, required=True, help="new shard count")
+    parser.add_argument("--batch-size", type=int, default=TRANSFER_BATCH_SIZE)
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+
+    def progress(text):
+        print(text, file=sys.stderr)
+
+    resharder = Resharder(args.db, args.shards, args.batch_size, progress)
+    try:
+        seconds = resharder.run()
+    finally:
+        resharder.close()
+    print(f"Resharded {args.db} into {len(read_manifest(args.db))} shards "
+          f"({resharder.copied} rows copied) in {seconds:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
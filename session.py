@@ -0,0 +1,174 @@
+import hashlib
+import heapq
+import secrets
+import threading
+import time
+from config import SESSION_TIMEOUT_MINUTES, AUTO_LOGOUT_WARNING_MINUTES, SESSION_SLIDING_RENEWAL
+
+# Renewals only reach SQLite once the expiry has moved this far, so a busy
+# session does not turn every validation into a write
+PERSIST_RENEWAL_SECONDS = 60
+
+def token_key(token):
+    """Sessions are stored by a hash of the token, never the token itself"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class Session:
+    __slots__ = ("key", "username", "expires_at", "persisted_expiry")
+
+    def __init__(self, key, username, expires_at):
+        self.key = key
+        self.username = username
+        self.expires_at = expires_at
+        self.persisted_expiry = expires_at
+
+
+class SessionStore:
+    def __init__(self, timeout_minutes=SESSION_TIMEOUT_MINUTES, sliding=SESSION_SLIDING_RENEWAL,
+                 db=None, clock=time.time):
+        """In-memory session store with O(1) token lookup and heap-driven expiry.
+
+        Pass a UserDatabase as db to persist sessions in its SQLite file so
+        they survive a restart.
+        """
+        self.timeout = timeout_minutes * 60
+        self.sliding = sliding
+        self.db = db
+        self.clock = clock
+        self._sessions = {}       # token key -> Session
+        self._user_sessions = {}  # username -> set of token keys
+        self._expiry_heap = []    # (expires_at, token key); one entry per session
+        self._lock = threading.Lock()
+        if db is not None:
+            self._load()
+
+    def _load(self):
+        """Restore unexpired sessions from SQLite and drop the rest"""
+        now = self.clock()
+        with self.db.get_connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            rows = conn.execute("SELECT token_hash, username, expires_at FROM sessions").fetchall()
+        with self._lock:
+            for key, username, expires_at in rows:
+                self._add(Session(key, username, expires_at))
+
+    def _add(self, session):
+        """Index a session (caller holds the lock)"""
+        self._sessions[session.key] = session
+        self._user_sessions.setdefault(session.username, set()).add(session.key)
+        heapq.heappush(self._expiry_heap, (session.expires_at, session.key))
+
+    def _remove(self, key):
+        """Drop a session from every index (caller holds the lock)"""
+        session = self._sessions.pop(key, None)
+        if session is not None:
+            keys = self._user_sessions.get(session.username)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._user_sessions[session.username]
+        return session
+
+    def _expire(self, now):
+        """Pop expired sessions off the heap; only touches what has expired"""
+        heap = self._expiry_heap
+        expired = []
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            session = self._sessions.get(key)
+            if session is None:
+                continue  # Already revoked
+            if session.expires_at <= now:
+                self._remove(key)
+                expired.append(key)
+            else:
+                # Renewed since this entry was pushed; requeue at its new expiry
+                heapq.heappush(heap, (session.expires_at, key))
+        return expired
+
+    def create(self, username):
+        """Start a session for an authenticated user and return its opaque token"""
+        token = secrets.token_urlsafe(32)
+        session = Session(token_key(token), username, self.clock() + self.timeout)
+        with self._lock:
+            expired = self._expire(self.clock())
+            self._add(session)
+        if self.db is not None:
+            with self.db.get_connection() as conn:
+                self._delete_rows(conn, expired)
+                conn.execute(
+                    "INSERT INTO sessions (token_hash, username, expires_at) VALUES (?, ?, ?)",
+                    (session.key, username, session.expires_at)
+                )
+        return token
+
+    def validate(self, token, renew=True):
+        """Return the username for a live session, or None if unknown or expired.
+
+        With sliding expiry enabled, a successful validation renews the
+        session unless renew is False (e.g. for background expiry checks).
+        """
+        if not token:
+            return None
+        key = token_key(token)
+        now = self.clock()
+        renewed = None
+        with self._lock:
+            expired = self._expire(now)
+            session = self._sessions.get(key)
+            if session is not None and self.sliding and renew:
+                session.expires_at = now + self.timeout
+                if session.expires_at - session.persisted_expiry >= PERSIST_RENEWAL_SECONDS:
+                    session.persisted_expiry = session.expires_at
+                    renewed = session
+        if self.db is not None and (expired or renewed):
+            with self.db.get_connection() as conn:
+                self._delete_rows(conn, expired)
+                if renewed:
+                    conn.execute(
+                        "UPDATE sessions SET expires_at = ? WHERE token_hash = ?",
+                        (renewed.expires_at, renewed.key)
+                    )
+        return session.username if session is not None else None
+
+    def time_remaining(self, token):
+        """Seconds until the session expires, or 0 if it is not live"""
+        session = self._sessions.get(token_key(token)) if token else None
+        if session is None:
+            return 0
+        return max(0, session.expires_at - self.clock())
+
+    def needs_warning(self, token):
+        """True when a live session is within AUTO_LOGOUT_WARNING_MINUTES of expiring"""
+        remaining = self.time_remaining(token)
+        return 0 < remaining <= AUTO_LOGOUT_WARNING_MINUTES * 60
+
+    def revoke(self, token):
+        """End a session (logout)"""
+        if not token:
+            return
+        key = token_key(token)
+        with self._lock:
+            self._remove(key)
+        if self.db is not None:
+            with self.db.get_connection() as conn:
+                self._delete_rows(conn, [key])
+
+    def revoke_user(self, username):
+        """End every session belonging to a user"""
+        with self._lock:
+            keys = list(self._user_sessions.get(username, ()))
+            for key in keys:
+                self._remove(key)
+        if self.db is not None:
+            with self.db.get_connection() as conn:
+                self._delete_rows(conn, keys)
+
+    def _delete_rows(self, conn, keys):
+        """Delete persisted sessions by token key"""
+        if keys:
+            conn.executemany("DELETE FROM sessions WHERE token_hash = ?", [(k,) for k in keys])
+
+    def __len__(self):
+        return len(self._sessions)
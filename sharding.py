@@ -0,0 +1,197 @@
+"""
+Sharded user storage
+
+Partitions users across several SQLite files by a stable hash of the
+username, so registrations and login writes for different users do not
+queue behind one writer lock. ShardedUserDatabase offers the same API as
+UserDatabase; each shard is a UserDatabase with its own connections,
+cache, username filter and write-behind buffer.
+
+A sharded database is described by a manifest next to the database name
+(users.db.shards) listing the shard files in shard order. open_database()
+returns a ShardedUserDatabase when the manifest exists and a plain
+UserDatabase otherwise. Sessions and lockout counters live in shard 0.
+
+Use reshard.py to convert an existing database or change the shard count.
+"""
+
+import hashlib
+import heapq
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from config import DATABASE_NAME, BULK_INSERT_CHUNK_SIZE, LAST_LOGIN_WRITE_BEHIND, TRANSFER_BATCH_SIZE
+from database import UserDatabase
+
+def shard_index(username, shard_count):
+    """Shard that owns a username; stable across processes (unlike hash())"""
+    digest = hashlib.blake2b(username.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shard_count
+
+def manifest_path(db_name):
+    return f"{db_name}.shards"
+
+def read_manifest(db_name):
+    """Return the shard file list for db_name, or None if it is not sharded"""
+    try:
+        with open(manifest_path(db_name), encoding="utf-8") as f:
+            return json.load(f)["shards"]
+    except FileNotFoundError:
+        return None
+
+def write_manifest(db_name, paths):
+    """Point db_name at a list of shard files, atomically"""
+    path = manifest_path(db_name)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"shards": list(paths)}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def shard_paths(db_name, shard_count):
+    """Default file names for a layout, e.g. users-4x-0.db ... users-4x-3.db"""
+    root, ext = os.path.splitext(db_name)
+    return [f"{root}-{shard_count}x-{i}{ext}" for i in range(shard_count)]
+
+def open_database(db_name=DATABASE_NAME, **kwargs):
+    """Open db_name as a ShardedUserDatabase if it has a manifest, else a UserDatabase"""
+    paths = read_manifest(db_name)
+    if paths is None:
+        return UserDatabase(db_name, **kwargs)
+    # Shard file names are relative to the manifest's directory
+    base = os.path.dirname(db_name)
+    return ShardedUserDatabase([os.path.join(base, p) for p in paths], db_name=db_name, **kwargs)
+
+
+class ShardedUserDatabase:
+    def __init__(self, paths, db_name=None, write_behind=LAST_LOGIN_WRITE_BEHIND, hasher=None):
+        """UserDatabase API over one UserDatabase per shard file, in shard order"""
+        self.db_name = db_name or paths[0]
+        # Shard 0 owns the one set of lockout counters and rate limits, so
+        # per-source limits are not split across shards
+        first = UserDatabase(paths[0], write_behind=write_behind, hasher=hasher)
+        self.shards = [first] + [
+            UserDatabase(path, write_behind=write_behind, hasher=hasher,
+                         lockout=first.lockout, rate_limiter=first.rate_limiter)
+            for path in paths[1:]
+        ]
+        self.hasher = first.hasher
+        self.write_behind = write_behind
+        self.lockout = first.lockout
+        self.rate_limiter = first.rate_limiter
+        self._writers = ThreadPoolExecutor(max_workers=len(self.shards),
+                                           thread_name_prefix="shard-writer")
+
+    def shard_for(self, username):
+        return self.shards[shard_index(username, len(self.shards))]
+
+    def get_connection(self):
+        """Connection to shard 0, which holds sessions and lockout counters"""
+        return self.shards[0].get_connection()
+
+    def close(self):
+        self._writers.shutdown(wait=True)
+        for shard in self.shards:
+            shard.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # -----------------------------------------------------------------------
+    # Single-user operations: routed to the owning shard
+    # -----------------------------------------------------------------------
+
+    def hash_password(self, password):
+        return self.hasher.hash(password)
+
+    def hash_passwords(self, passwords):
+        return self.hasher.hash_many(passwords)
+
+    def create_user(self, username, password, source=None):
+        return self.shard_for(username).create_user(username, password, source)
+
+    def verify_user(self, username, password, source=None):
+        return self.shard_for(username).verify_user(username, password, source)
+
+    def update_password(self, username, old_password, new_password):
+        return self.shard_for(username).update_password(username, old_password, new_password)
+
+    def is_password_reused(self, username, password):
+        return self.shard_for(username).is_password_reused(username, password)
+
+    def user_exists(self, username):
+        return self.shard_for(username).user_exists(username)
+
+    def get_user_info(self, username):
+        return self.shard_for(username).get_user_info(username)
+
+    def invalidate_user(self, username):
+        self.shard_for(username).invalidate_user(username)
+
+    # -----------------------------------------------------------------------
+    # Batch operations: split by shard, written in parallel
+    # -----------------------------------------------------------------------
+
+    def create_users_bulk(self, users, chunk_size=BULK_INSERT_CHUNK_SIZE):
+        """Create many users from (username, password) pairs; see UserDatabase.create_users_bulk"""
+        results = []
+        users = iter(users)
+        while True:
+            chunk = list(islice(users, chunk_size))
+            if not chunk:
+                break
+            hashes = self.hash_passwords(password for _, password in chunk)
+            results.extend(self.insert_users_chunk(
+                (username, password_hash, None, None)
+                for (username, _), password_hash in zip(chunk, hashes)
+            ))
+        return results
+
+    def insert_users_chunk(self, rows):
+        """Insert already-hashed rows, one transaction per shard, shards in parallel.
+
+        Returns (username, success, message) tuples in input order.
+        """
+        rows = list(rows)
+        groups = {}  # shard index -> [(input position, row)]
+        for position, row in enumerate(rows):
+            groups.setdefault(shard_index(row[0], len(self.shards)), []).append((position, row))
+        futures = [
+            (group, self._writers.submit(self.shards[index].insert_users_chunk,
+                                         [row for _, row in group]))
+            for index, group in groups.items()
+        ]
+        results = [None] * len(rows)
+        for group, future in futures:
+            for (position, _), result in zip(group, future.result()):
+                results[position] = result
+        return results
+
+    def iter_users(self, after_id=0, batch_size=TRANSFER_BATCH_SIZE):
+        """Yield (id, username, password_hash, created_at, last_login) rows in id order.
+
+        Ids are made unique across shards as local_id * shard_count + shard,
+        so after_id resumes exactly like on a single database.
+        """
+        count = len(self.shards)
+
+        def shard_rows(index, shard):
+            for row in shard.iter_users(max(0, (after_id - index) // count), batch_size):
+                yield (row[0] * count + index,) + tuple(row[1:])
+
+        yield from heapq.merge(*(shard_rows(i, shard) for i, shard in enumerate(self.shards)))
+
+    def flush_last_logins(self):
+        return sum(shard.flush_last_logins() for shard in self.shards)
+
+    def cache_stats(self):
+        """Cache counters summed over all shards"""
+        totals = {}
+        for shard in self.shards:
+            for key, value in shard.cache_stats().items():
+                totals[key] = totals.get(key, 0) + value
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_rate"] = round(totals["hits"] / lookups, 4) if lookups else 0.0
+        return totals
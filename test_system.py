@@ -26,6 +26,89 @@ def test_password_validation():
     except ValueError:
         print("❌ 'MyP@ssw0rd123' should have passed but failed")
 
+def test_password_policy():
+    """Test the compiled password policy and batch audit"""
+    print("\nTesting password policy...")
+    
+    from PasswordMatch import PasswordPolicy
+    
+    relaxed = PasswordPolicy(min_length=6, require_special=False, blocklist=None)
+    if relaxed.is_strong("Passw0rd") and not relaxed.is_strong("Pass0"):
+        print("✅ Policy honors configured requirements")
+    else:
+        print("❌ Policy ignored configured requirements")
+    
+    summary = PasswordPolicy(blocklist=None).audit(["123", "Password123", "MyP@ssw0rd123"])
+    if (summary["total"], summary["Strong"], summary["Medium"], summary["Weak"]) == (3, 1, 1, 1):
+        print("✅ Batch audit counted passwords by strength")
+    else:
+        print(f"❌ Unexpected audit summary: {summary}")
+
+def test_strength_meter():
+    """Test the incremental strength meter against a full evaluation"""
+    print("\nTesting incremental strength meter...")
+    
+    from PasswordMatch import PasswordPolicy, StrengthMeter
+    
+    policy = PasswordPolicy(blocklist=None)
+    meter = StrengthMeter(policy)
+    text = ""
+    # Typing, a paste, a non-ASCII character and some backspaces
+    for edit in ("m", "y", "P", "@", "ssw0rd", "É", "-DEL", "-DEL", "12"):
+        if edit == "-DEL":
+            meter.delete(text[-1])
+            text = text[:-1]
+        else:
+            meter.insert(edit)
+            text += edit
+        if meter.strength() != policy.strength(text):
+            print(f"❌ Meter disagrees with full check at {text!r}")
+            return
+    print("✅ Running counts match a full rescan after every edit")
+    
+    meter.reset("a" * 1000000)
+    if meter.length == 1000000 and meter.strength()[0] == "Weak":
+        meter.insert("B1!")
+        if meter.strength()[0] == "Strong":
+            print("✅ Large paste handled and later edits stay incremental")
+        else:
+            print("❌ Meter missed an edit after a large paste")
+    else:
+        print("❌ Meter miscounted a large paste")
+
+def test_password_blocklist():
+    """Test the common/breached password blocklist index"""
+    print("\nTesting password blocklist...")
+    
+    from blocklist import build_index, PasswordBlocklist
+    from PasswordMatch import PasswordPolicy
+    import os
+    
+    wordlist, index = "test_wordlist.txt", "test_blocklist.idx"
+    with open(wordlist, "w") as f:
+        f.write("password1!\nqwerty123!\nwelcome1!\n")
+    
+    build_index(wordlist, index)
+    blocklist = PasswordBlocklist(index)
+    
+    if "Password1!" in blocklist and "MyP@ssw0rd123" not in blocklist:
+        print("✅ Blocklist index lookups working")
+    else:
+        print("❌ Blocklist index returned wrong results")
+    
+    policy = PasswordPolicy(blocklist=blocklist)
+    strength, issues = policy.strength("Qwerty123!")
+    if not policy.is_strong("Qwerty123!") and strength == "Weak":
+        print("✅ Blocklisted password rejected by policy")
+    else:
+        print(f"❌ Blocklisted password accepted: {strength} {issues}")
+    
+    # Cleanup
+    blocklist.close()
+    for path in (wordlist, index):
+        if os.path.exists(path):
+            os.remove(path)
+
 def test_database():
     """Test database operations"""
     print("\nTesting database operations...")
@@ -69,8 +152,1339 @@ def test_database():
         print("❌ Wrong password should have been rejected")
     
     # Cleanup
+    db.close()
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_connection_pool():
+    """Test that database connections are reused and closed cleanly"""
+    print("\nTesting connection pooling...")
+    
+    from database import UserDatabase
+    import os
+    
+    test_db = "test_pool.db"
+    if os.path.exists(test_db):
+        os.remove(test_db)
+    
+    db = UserDatabase(test_db)
+    db.create_user("pooluser", "TestP@ss123")
+    
+    if db.get_connection() is db.get_connection():
+        print("✅ Connection reused across calls")
+    else:
+        print("❌ A new connection was opened for each call")
+    
+    mode = db.get_connection().execute("PRAGMA journal_mode").fetchone()[0]
+    if mode.lower() == "wal":
+        print("✅ WAL journal mode enabled")
+    else:
+        print(f"❌ Expected WAL journal mode, got {mode}")
+    
+    db.close()
+    if db.user_exists("pooluser"):
+        print("✅ Database reopens after close")
+    else:
+        print("❌ User missing after reopening database")
+    db.close()
+    
+    # Cleanup
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_bulk_create():
+    """Test bulk user provisioning"""
+    print("\nTesting bulk user creation...")
+    
+    from database import UserDatabase
+    import os
+    
+    test_db = "test_bulk.db"
+    if os.path.exists(test_db):
+        os.remove(test_db)
+    
+    db = UserDatabase(test_db)
+    db.create_user("existing", "TestP@ss123")
+    
+    pairs = [("bulk1", "TestP@ss123"), ("existing", "TestP@ss123"),
+             ("bulk2", "TestP@ss123"), ("bulk1", "TestP@ss123")]
+    results = db.create_users_bulk(pairs, chunk_size=3)
+    statuses = [success for _, success, _ in results]
+    
+    if statuses == [True, False, True, False]:
+        print("✅ Bulk insert reported per-row success and duplicates")
+    else:
+        print(f"❌ Unexpected bulk results: {results}")
+    
+    if db.verify_user("bulk2", "TestP@ss123")[0]:
+        print("✅ Bulk-created user can login")
+    else:
+        print("❌ Bulk-created user could not login")
+    
+    # Cleanup
+    db.close()
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_write_behind_last_login():
+    """Test buffered last_login updates"""
+    print("\nTesting write-behind last_login...")
+    
+    from database import UserDatabase
+    import os
+    import sqlite3
+    import time
+    
+    test_db = "test_write_behind.db"
     if os.path.exists(test_db):
         os.remove(test_db)
+    
+    db = UserDatabase(test_db, write_behind=True)
+    db.create_user("wbuser", "TestP@ss123")
+    db.verify_user("wbuser", "TestP@ss123")
+    
+    stored = db.get_connection().execute(
+        "SELECT last_login FROM users WHERE username = ?", ("wbuser",)
+    ).fetchone()[0]
+    if stored is None and db.get_user_info("wbuser")[2]:
+        print("✅ Login recorded in memory without a write")
+    else:
+        print("❌ Login was not buffered")
+    
+    # A failed background flush must keep the batch and the flusher thread
+    get_connection = db.get_connection
+    def failing_connection():
+        raise sqlite3.OperationalError("database is locked")
+    db.get_connection = failing_connection
+    db._flush_wakeup.set()
+    deadline = time.time() + 5
+    while db._flush_wakeup.is_set() and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    survived = db._flusher.is_alive() and "wbuser" in db._pending_logins
+    db.get_connection = get_connection
+    if survived:
+        print("✅ Flusher survives a failed write and keeps the batch")
+    else:
+        print("❌ Failed flush killed the flusher or lost the batch")
+    
+    db.close()
+    reopened = UserDatabase(test_db)
+    if reopened.get_user_info("wbuser")[2]:
+        print("✅ Buffered login flushed on close")
+    else:
+        print("❌ Buffered login lost on close")
+    
+    # close() still closes its connections when the final flush fails
+    reopened.write_behind = True
+    reopened._pending_logins["wbuser"] = "2000-01-01 00:00:00"
+    reopened.get_connection()
+    reopened.get_connection = failing_connection
+    saved = []
+    reopened.save_username_filter = lambda: saved.append(True)
+    try:
+        reopened.close()
+        raised = False
+    except sqlite3.Error:
+        raised = True
+    if raised and saved and not reopened._connections:
+        print("✅ close() reports a failed flush and still runs the other steps")
+    else:
+        print("❌ close() leaked connections after a failed flush")
+    
+    # Cleanup
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_user_cache():
+    """Test the read-through user lookup cache and its invalidation"""
+    print("\nTesting user lookup cache...")
+    
+    from cache import LRUCache
+    from database import UserDatabase
+    import os
+    
+    now = [0.0]
+    cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)  # Evicts "b", the least recently used
+    evicted = cache.get("b") is None and cache.get("a") == 1
+    now[0] = 11
+    if evicted and cache.get("a") is None and cache.stats()["expirations"] == 1:
+        print("✅ LRU eviction and TTL expiry work")
+    else:
+        print("❌ LRU eviction or TTL expiry failed")
+    
+    # A load that races with invalidate() must not cache its stale result
+    def stale_loader():
+        cache.invalidate("d")
+        return "old"
+    loaded = cache.get_or_load("d", stale_loader)
+    if loaded == "old" and cache.get("d") is None and cache.get_or_load("d", lambda: "new") == "new" \
+            and cache.get("d") == "new":
+        print("✅ Load invalidated mid-flight not cached")
+    else:
+        print("❌ Stale load cached after invalidate")
+    
+    test_db = "test_cache.db"
+    if os.path.exists(test_db):
+        os.remove(test_db)
+    
+    db = UserDatabase(test_db)
+    db.username_filter = None  # Exercise the cache on its own
+    missing_before = not db.user_exists("cacheuser")
+    db.create_user("cacheuser", "TestP@ss123")
+    if missing_before and db.user_exists("cacheuser"):
+        print("✅ Cached negative lookup invalidated on create")
+    else:
+        print("❌ Stale user_exists result after create")
+    
+    db.get_user_info("cacheuser")
+    db.verify_user("cacheuser", "TestP@ss123")
+    info = db.get_user_info("cacheuser")
+    db.get_user_info("cacheuser")
+    if info[2] and db.cache_stats()["hits"] >= 1:
+        print("✅ Cached user info refreshed after login")
+    else:
+        print("❌ Cached user info missed the new last_login")
+    
+    # Cleanup
+    db.close()
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_read_replica():
+    """Test serving login reads from the in-memory replica"""
+    print("\nTesting read replica...")
+    
+    from cache import LRUCache
+    from database import UserDatabase
+    from hashing import PasswordHasher
+    from replica import ReadReplica
+    import os
+    import time
+    
+    test_db = "test_replica.db"
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+    
+    fast = PasswordHasher(cost=4, workers=1)
+    db = UserDatabase(test_db, write_behind=True, hasher=fast)
+    db.cache = LRUCache(maxsize=0)  # Exercise the replica, not the cache
+    db.replica = ReadReplica(db, refresh_seconds=0)
+    db.create_users_bulk((f"replica{i}", "TestP@ss123") for i in range(20))
+    
+    statements = []
+    db.get_connection().set_trace_callback(statements.append)
+    logged_in = db.verify_user("replica3", "TestP@ss123")[0]
+    info = db.get_user_info("replica3")
+    db.get_connection().set_trace_callback(None)
+    if logged_in and info[0] == "replica3" and info[2] is not None and not statements \
+            and len(db.replica) == 20:
+        print("✅ Login and user info served without SQL")
+    else:
+        print(f"❌ Replica read path ran SQL: {statements}")
+    
+    # Unknown usernames are ruled out by the username filter, or remembered
+    # when there is none, instead of going to disk on every attempt
+    statements.clear()
+    db.get_connection().set_trace_callback(statements.append)
+    filtered = db.verify_user("nosuchuser", "TestP@ss123")[0]
+    username_filter, db.username_filter = db.username_filter, None
+    db.verify_user("nosuchuser2", "TestP@ss123")
+    first_miss = len(statements)
+    db.verify_user("nosuchuser2", "TestP@ss123")
+    db.username_filter = username_filter
+    db.get_connection().set_trace_callback(None)
+    if not filtered and first_miss == 1 and len(statements) == 1:
+        print("✅ Logins for unknown usernames served without SQL")
+    else:
+        print(f"❌ Unknown usernames went to disk: {statements}")
+    
+    db.update_password("replica4", "TestP@ss123", "NewP@ss456")
+    db.create_user("replica_new", "TestP@ss123")
+    if db.verify_user("replica4", "NewP@ss456")[0] and db.user_exists("replica_new"):
+        print("✅ Local writes applied to the replica")
+    else:
+        print("❌ Replica missed a local write")
+    
+    # Changes made through another handle (another process) arrive by refresh
+    other = UserDatabase(test_db, hasher=fast)
+    other.update_password("replica5", "TestP@ss123", "Other#Pass9")
+    other.create_user("elsewhere", "TestP@ss123")
+    stale = db.verify_user("replica5", "TestP@ss123")[0]
+    db.replica.refresh()
+    if stale and db.verify_user("replica5", "Other#Pass9")[0] \
+            and db.verify_user("elsewhere", "TestP@ss123")[0]:
+        print("✅ Refresh picks up writes from other processes; misses fall back to disk")
+    else:
+        print("❌ Replica refresh failed")
+    
+    periodic = ReadReplica(db, refresh_seconds=0.01)
+    time.sleep(0.1)
+    idle_refreshes = periodic.refreshes
+    other.create_user("periodic", "TestP@ss123")
+    deadline = time.time() + 5
+    while "periodic" not in periodic._users and time.time() < deadline:
+        time.sleep(0.01)
+    periodic.close()
+    if "periodic" in periodic._users and idle_refreshes <= 2:
+        print("✅ Background refresh picks up other writers and skips idle scans")
+    else:
+        print(f"❌ Background refresh wrong ({idle_refreshes} idle scans)")
+    
+    # Cleanup
+    other.close()
+    db.close()
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_username_filter():
+    """Test the username Bloom filter, its snapshot and catch-up at startup"""
+    print("\nTesting username filter...")
+    
+    from database import UserDatabase
+    import os
+    
+    test_db = "test_username_filter.db"
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+    
+    db = UserDatabase(test_db)
+    db.create_users_bulk((f"filteruser{i}", "TestP@ss123") for i in range(50))
+    queries = []
+    db.get_connection().set_trace_callback(queries.append)
+    taken = all(db.user_exists(f"filteruser{i}") for i in range(50))
+    queries.clear()
+    free = [db.user_exists(f"freeuser{i}") for i in range(200)]
+    if taken and not any(free) and len(queries) < 20:
+        print(f"✅ Free usernames answered by the filter ({len(queries)}/200 queried)")
+    else:
+        print(f"❌ Filter not skipping SQLite ({len(queries)}/200 queried)")
+    db.get_connection().set_trace_callback(None)
+    db.close()
+    
+    # A user added while no process held the filter is picked up at startup
+    with UserDatabase(test_db) as other:
+        other.username_filter = None
+        other.create_user("lateuser", "TestP@ss123")
+    db = UserDatabase(test_db)
+    if os.path.exists(test_db + ".usernames") and db.user_exists("lateuser") \
+            and db.username_filter.count == 51:
+        print("✅ Saved filter loaded and caught up with new users")
+    else:
+        print("❌ Saved filter missed users created since it was saved")
+    
+    # A user registered by another process while this one is running
+    from config import USERNAME_FILTER_SYNC_SECONDS
+    db.user_exists("remoteuser")
+    with UserDatabase(test_db) as other:
+        other.create_user("remoteuser", "TestP@ss123")
+    db._filter_synced -= USERNAME_FILTER_SYNC_SECONDS  # Let the negative answer age out
+    if db.user_exists("remoteuser") and not db.user_exists("stillfree"):
+        print("✅ Stale filter negatives confirmed against new rows")
+    else:
+        print("❌ User registered elsewhere still reported as free")
+    db.close()
+    
+    # Cleanup
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_fast_startup():
+    """Test the cached schema check and lazy LoginSystem/SystemLogger setup"""
+    print("\nTesting fast startup...")
+    
+    import database
+    from database import UserDatabase
+    from logger import SystemLogger
+    from main import LoginSystem
+    import os
+    import time
+    
+    test_db = "test_startup.db"
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+    
+    UserDatabase(test_db).close()
+    db = UserDatabase(test_db)
+    version = db.get_connection().execute("PRAGMA user_version").fetchone()[0]
+    if version == database.SCHEMA_VERSION and os.path.abspath(test_db) in database._schema_checked:
+        print("✅ Schema version recorded and cached for this process")
+    else:
+        print("❌ Schema version check not cached")
+    db.close()
+    
+    system = LoginSystem(interactive=False)
+    start = time.perf_counter()
+    system.pause(2)
+    if system._db is None and time.perf_counter() - start < 0.5:
+        print("✅ LoginSystem opens nothing up front and skips pauses when scripted")
+    else:
+        print("❌ LoginSystem did eager work or slept")
+    
+    if SystemLogger()._logger is None:
+        print("✅ SystemLogger defers file and handler setup")
+    else:
+        print("❌ SystemLogger set itself up on construction")
+    
+    from benchmark import check_startup_budget
+    # --suite all mixes startup results with ones that have no median_ms
+    mixed = [
+        {"benchmark": "database.verify_user", "mean_us": 50.0},
+        {"benchmark": "startup_interpreter", "median_ms": 20.0},
+        {"benchmark": "startup_login_system", "median_ms": 500.0},
+    ]
+    if check_startup_budget(mixed, budget_ms=100) and check_startup_budget(mixed[:1]) is None:
+        print("✅ Startup budget checked on mixed benchmark suites")
+    else:
+        print("❌ Startup budget check wrong on mixed results")
+    
+    # Cleanup
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_user_transfer():
+    """Test streaming export/import, resume and pre-hashed imports"""
+    print("\nTesting user import/export...")
+    
+    from database import UserDatabase
+    from user_transfer import export_users, import_users
+    import os
+    
+    source_db, target_db = "test_export.db", "test_import.db"
+    jsonl_path, csv_path = "test_users_export.jsonl", "test_users_export.csv"
+    for path in (source_db, target_db):
+        for suffix in ("", "-wal", "-shm", ".usernames"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    
+    source = UserDatabase(source_db)
+    source.create_users_bulk((f"moveuser{i}", "TestP@ss123") for i in range(3))
+    export_users(source, jsonl_path, batch_size=2)
+    
+    # Simulate an export interrupted in the middle of the second record
+    with open(jsonl_path, "rb") as f:
+        first_line = f.readline()
+        torn = f.readline()[:10]
+    with open(jsonl_path, "wb") as f:
+        f.write(first_line + torn)
+    stats = export_users(source, jsonl_path, resume=True)
+    with open(jsonl_path) as f:
+        lines = f.read().splitlines()
+    if stats.rows == 2 and len(lines) == 3 and all(line.endswith("}") for line in lines):
+        print("✅ Export resumed after the last complete record")
+    else:
+        print(f"❌ Resumed export wrote {len(lines)} lines")
+    
+    export_users(source, csv_path)
+    with open(csv_path, "a") as f:
+        f.write(",newuser,,,\n")              # No password at all
+        f.write(",baduser,not-a-hash,,\n")    # Unrecognized hash format
+    target = UserDatabase(target_db)
+    stats = import_users(target, csv_path, chunk_size=2)
+    again = import_users(target, csv_path)
+    if stats.created == 3 and stats.invalid == 2 and again.skipped == 3 \
+            and target.verify_user("moveuser1", "TestP@ss123")[0]:
+        print("✅ Pre-hashed users imported and can log in; duplicates skipped")
+    else:
+        print(f"❌ Import went wrong: {stats.summary()}")
+    
+    # Cleanup
+    source.close()
+    target.close()
+    for path in (source_db, target_db):
+        for suffix in ("", "-wal", "-shm", ".usernames"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    os.remove(jsonl_path)
+    os.remove(csv_path)
+
+def test_sharded_database():
+    """Test hash-partitioned shards and online resharding"""
+    print("\nTesting sharded database...")
+    
+    from database import UserDatabase
+    from hashing import PasswordHasher
+    from reshard import Resharder
+    from session import SessionStore
+    from sharding import ShardedUserDatabase, open_database, shard_index, shard_paths, manifest_path
+    import glob
+    import os
+    import sqlite3
+    
+    def cleanup():
+        for path in glob.glob("test_shards*") + glob.glob("test_reshard*"):
+            os.remove(path)
+    cleanup()
+    fast = PasswordHasher(cost=4, workers=1)
+    
+    db = ShardedUserDatabase(shard_paths("test_shards.db", 3), hasher=fast)
+    users = [(f"shard{i}", "TestP@ss123") for i in range(30)]
+    results = db.create_users_bulk(users + [("shard0", "TestP@ss123")])
+    per_shard = [shard.get_connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+                 for shard in db.shards]
+    if [r[0] for r in results] == [u for u, _ in users] + ["shard0"] and not results[-1][1] \
+            and sum(per_shard) == 30 and min(per_shard) > 0:
+        print("✅ Bulk insert split across shards, results in input order")
+    else:
+        print("❌ Bulk insert not partitioned correctly")
+    
+    owner = db.shards[shard_index("shard7", 3)]
+    if db.verify_user("shard7", "TestP@ss123")[0] and db.user_exists("shard7") \
+            and owner.user_exists("shard7") and db.get_user_info("shard7")[0] == "shard7" \
+            and db.update_password("shard7", "TestP@ss123", "NewP@ss456")[0] \
+            and db.create_user("newshard", "TestP@ss123")[0] and not db.user_exists("nobody"):
+        print("✅ Single-user operations routed to the owning shard")
+    else:
+        print("❌ Single-user operations not routed correctly")
+    
+    ids = [row[0] for row in db.iter_users(batch_size=7)]
+    resumed = [row[0] for row in db.iter_users(after_id=ids[10], batch_size=7)]
+    if len(ids) == 31 and ids == sorted(set(ids)) and resumed == ids[11:]:
+        print("✅ iter_users merges shards with unique, resumable ids")
+    else:
+        print("❌ iter_users ids not unique or resume broken")
+    
+    if all(shard.lockout is db.lockout and shard.rate_limiter is db.rate_limiter
+           for shard in db.shards) and db.shards[0]._owns_lockout \
+            and not any(shard._owns_lockout or shard._owns_rate_limiter for shard in db.shards[1:]):
+        print("✅ Shards share one lockout and rate limiter, built once")
+    else:
+        print("❌ Shards built their own lockout or rate limiter")
+    db.close()
+    
+    # Reshard a live single-file database into 3 shards
+    test_db = "test_reshard.db"
+    live = UserDatabase(test_db, hasher=fast)
+    live.create_users_bulk((f"live{i}", "TestP@ss123") for i in range(40))
+    token = SessionStore(db=live).create("live1")
+    resharder = Resharder(test_db, 3, batch_size=16)
+    resharder.start_capture()
+    resharder.copy_new_users(0)
+    # Writes while the copy is running are picked up by the catch-up passes
+    live.create_user("late1", "TestP@ss123")
+    live.update_password("live2", "TestP@ss123", "Chang3d#Pass")
+    resharder.catch_up()
+    live.create_user("late2", "TestP@ss123")
+    live.update_password("live3", "TestP@ss123", "Chang3d#Pass")
+    resharder.cutover()
+    resharder.close()
+    
+    resharded = open_database(test_db, hasher=fast)
+    if isinstance(resharded, ShardedUserDatabase) and len(resharded.shards) == 3 \
+            and os.path.exists(manifest_path(test_db)) \
+            and len(list(resharded.iter_users())) == 42 \
+            and resharded.verify_user("late2", "TestP@ss123")[0] \
+            and resharded.verify_user("live2", "Chang3d#Pass")[0] \
+            and resharded.verify_user("live3", "Chang3d#Pass")[0] \
+            and SessionStore(db=resharded).validate(token) == "live1":
+        print("✅ Resharded online without losing concurrent writes or sessions")
+    else:
+        print("❌ Resharding lost data")
+    
+    success, message = live.create_user("stale", "TestP@ss123")
+    if not success and "resharded" in message:
+        print("✅ Old layout rejects writes after cutover")
+    else:
+        print("❌ Old layout still accepts writes")
+    try:
+        SessionStore(db=live).create("live1")
+        session_written = True
+    except sqlite3.Error:
+        session_written = False
+    if not session_written:
+        print("✅ Old layout rejects session writes after cutover")
+    else:
+        print("❌ Session written to the old layout after cutover")
+    
+    # Cleanup
+    live.close()
+    resharded.close()
+    cleanup()
+
+def test_task_dispatcher():
+    """Test running blocking calls off the UI thread with results marshalled back"""
+    print("\nTesting GUI task dispatcher...")
+    
+    from dispatcher import TaskDispatcher
+    import threading
+    import time
+    
+    # Stand-in for root.after plus a minimal event loop on this thread
+    scheduled = []
+    dispatcher = TaskDispatcher(lambda delay, callback: scheduled.append(callback), poll_ms=1)
+    ui_thread = threading.get_ident()
+    results, errors, threads = [], [], []
+    
+    def slow_call(value):
+        threads.append(threading.get_ident())
+        time.sleep(0.05)
+        return value * 2
+    
+    def failing_call():
+        raise RuntimeError("database is locked")
+    
+    def on_done(result):
+        results.append((result, threading.get_ident()))
+    
+    start = time.perf_counter()
+    for value in range(4):
+        dispatcher.submit(slow_call, value, on_done=on_done)
+    dispatcher.submit(failing_call, on_error=errors.append)
+    submit_time = time.perf_counter() - start
+    pending = dispatcher.pending
+    
+    while scheduled:
+        time.sleep(0.001)
+        scheduled.pop(0)()
+    
+    if submit_time < 0.02 and pending == 5 and ui_thread not in threads:
+        print("✅ Calls run on worker threads without blocking the caller")
+    else:
+        print("❌ Calls blocked the UI thread")
+    if sorted(r for r, _ in results) == [0, 2, 4, 6] and all(t == ui_thread for _, t in results) \
+            and len(errors) == 1 and dispatcher.pending == 0 and dispatcher.last_latency() is not None:
+        print("✅ Results and errors delivered on the UI thread")
+    else:
+        print("❌ Results not marshalled back correctly")
+    
+    # A callback that raises must not stop later results from being delivered
+    def broken(result):
+        raise ValueError("broken callback")
+    dispatcher.submit(slow_call, 5, on_done=broken)
+    while scheduled:
+        time.sleep(0.001)
+        scheduled.pop(0)()
+    dispatcher.submit(slow_call, 6, on_done=on_done)
+    while scheduled:
+        time.sleep(0.001)
+        scheduled.pop(0)()
+    if results[-1][0] == 12 and dispatcher.pending == 0:
+        print("✅ Polling survives a failing callback")
+    else:
+        print("❌ Results stopped after a callback raised")
+    dispatcher.shutdown()
+
+def test_password_hashing():
+    """Test KDF hashing, the process pool and legacy hash upgrades"""
+    print("\nTesting password hashing...")
+    
+    from database import UserDatabase
+    from hashing import PasswordHasher
+    import hashlib
+    import os
+    
+    pooled = PasswordHasher(cost=4, workers=2)
+    hashes = pooled.hash_many(["TestP@ss123", "Other#Pass9"])
+    if pooled.verify("TestP@ss123", hashes[0]) and not pooled.verify("TestP@ss123", hashes[1]):
+        print("✅ Process pool hashing and verification working")
+    else:
+        print("❌ Process pool hashing returned wrong results")
+    pooled.shutdown()
+    
+    if hashes[0] != PasswordHasher(cost=4, workers=1).hash("TestP@ss123"):
+        print("✅ Hashes are salted")
+    else:
+        print("❌ Identical passwords produced identical hashes")
+    
+    test_db = "test_hashing.db"
+    if os.path.exists(test_db):
+        os.remove(test_db)
+    
+    db = UserDatabase(test_db)
+    legacy_hash = hashlib.sha256("TestP@ss123".encode()).hexdigest()
+    with db.get_connection() as conn:
+        conn.execute(
+            "INSERT INTO users (username, password_hash) VALUES (?, ?)",
+            ("legacyuser", legacy_hash)
+        )
+    
+    success, _ = db.verify_user("legacyuser", "TestP@ss123")
+    stored = db.get_connection().execute(
+        "SELECT password_hash FROM users WHERE username = ?", ("legacyuser",)
+    ).fetchone()[0]
+    if success and stored.startswith("scrypt$") and db.verify_user("legacyuser", "TestP@ss123")[0]:
+        print("✅ Legacy SHA-256 hash upgraded on login")
+    else:
+        print(f"❌ Legacy hash was not upgraded: {stored}")
+    
+    # Cleanup
+    db.close()
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_update_password():
+    """Test the compare-and-swap password change, including concurrent changes"""
+    print("\nTesting password update...")
+    
+    from database import UserDatabase
+    from hashing import PasswordHasher
+    from concurrent.futures import ThreadPoolExecutor
+    import os
+    
+    test_db = "test_update_password.db"
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+    
+    db = UserDatabase(test_db, hasher=PasswordHasher(cost=4, workers=1))
+    db.create_user("changeuser", "OldP@ss123")
+    success, _ = db.update_password("changeuser", "WrongP@ss1", "NewP@ss123")
+    info = db.get_user_info("changeuser")
+    if not success and db.update_password("changeuser", "OldP@ss123", "NewP@ss123")[0] \
+            and db.verify_user("changeuser", "NewP@ss123")[0] and info[2] is None:
+        print("✅ Password changed only with the right current password, without touching last_login")
+    else:
+        print("❌ update_password misbehaved")
+    
+    # Many sessions change the same password at once from the same starting point:
+    # exactly one may win, and the stored hash must be the winner's. The losers'
+    # stale current passwords would otherwise lock the account.
+    db.lockout = None
+    db.create_user("raceuser", "Start!123")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        outcomes = list(pool.map(
+            lambda i: db.update_password("raceuser", "Start!123", f"Racer!{i}aa"), range(16)
+        ))
+    winners = [i for i, (success, _) in enumerate(outcomes) if success]
+    if len(winners) == 1 and db.verify_user("raceuser", f"Racer!{winners[0]}aa")[0]:
+        print("✅ Concurrent changes: one winner, no lost update")
+    else:
+        print(f"❌ Concurrent changes produced {len(winners)} winners")
+    
+    # Chained changes: each thread retries until its change lands on top of the previous one
+    db.create_user("chainuser", "Chain!0aa")
+    current = {"password": "Chain!0aa"}
+    
+    def change(i):
+        while True:
+            old = current["password"]
+            success, _ = db.update_password("chainuser", old, f"Chain!{i}bb")
+            if success:
+                current["password"] = f"Chain!{i}bb"
+                return
+    
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(change, range(1, 9)))
+    if db.verify_user("chainuser", current["password"])[0]:
+        print("✅ Every chained change applied on top of the last one")
+    else:
+        print("❌ A chained change was lost")
+    
+    # Cleanup
+    db.close()
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_password_history():
+    """Test the fixed-size password history ring and the reuse check"""
+    print("\nTesting password history...")
+    
+    from database import UserDatabase
+    from hashing import PasswordHasher
+    from password_history import PasswordHistory
+    from config import MESSAGES
+    import os
+    
+    test_db = "test_history.db"
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+    
+    db = UserDatabase(test_db, hasher=PasswordHasher(cost=4, workers=2))
+    db.history = PasswordHistory(db, size=3)
+    db.create_user("historyuser", "Passw0rd!0")
+    conn = db.get_connection()
+    user_id = conn.execute("SELECT id FROM users WHERE username = ?", ("historyuser",)).fetchone()[0]
+    
+    # Five password changes, each pushing the replaced hash into the ring
+    for i in range(1, 6):
+        db.update_password("historyuser", f"Passw0rd!{i - 1}", f"Passw0rd!{i}")
+    
+    rows = conn.execute("SELECT COUNT(*) FROM password_history WHERE user_id = ?", (user_id,)).fetchone()[0]
+    if rows == 3:
+        print("✅ History ring stays at a fixed size per user")
+    else:
+        print(f"❌ History ring has {rows} rows, expected 3")
+    
+    recent = all(db.is_password_reused("historyuser", f"Passw0rd!{i}") for i in (2, 3, 4, 5))
+    if recent and not db.is_password_reused("historyuser", "Passw0rd!1") \
+            and not db.is_password_reused("historyuser", "Brand-new-1"):
+        print("✅ Current and last N passwords rejected, older ones allowed")
+    else:
+        print("❌ Password reuse check gave the wrong answer")
+    
+    success, message = db.update_password("historyuser", "Passw0rd!5", "Passw0rd!3")
+    if not success and message == MESSAGES["password_reused"]:
+        print("✅ update_password refuses a recently used password")
+    else:
+        print("❌ update_password accepted a recently used password")
+    
+    # Cleanup
+    db.hasher.shutdown()
+    db.close()
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_account_lockout():
+    """Test sliding-window account lockout"""
+    print("\nTesting account lockout...")
+    
+    from lockout import LockoutManager
+    from database import UserDatabase
+    import os
+    
+    now = [1000.0]
+    clock = lambda: now[0]
+    
+    manager = LockoutManager(max_failures=3, max_source_failures=5, window_minutes=1,
+                             lockout_minutes=1, clock=clock)
+    manager.record_failure("lockuser")
+    now[0] += 61
+    manager.record_failure("lockuser")
+    manager.record_failure("lockuser")
+    if not manager.is_locked("lockuser"):
+        print("✅ Failures outside the window are not counted")
+    else:
+        print("❌ Old failures counted toward lockout")
+    
+    manager.record_failure("lockuser")
+    if manager.is_locked("lockuser"):
+        print("✅ Account locked after too many failures")
+    else:
+        print("❌ Account not locked")
+    
+    for i in range(5):
+        manager.record_failure(f"sprayed{i}", source="10.0.0.1")
+    if manager.is_locked("anyone", source="10.0.0.1") and not manager.is_locked("anyone"):
+        print("✅ Source locked after password spraying")
+    else:
+        print("❌ Per-source lockout not working")
+    
+    now[0] += 61
+    manager.record_failure("other")
+    if not manager.is_locked("lockuser") and len(manager) == 1:
+        print("✅ Locks and idle counters expire")
+    else:
+        print("❌ Expired counters were kept")
+    
+    # A long lock at the front must not hold back counters that expire sooner
+    manager = LockoutManager(max_failures=2, window_minutes=1, lockout_minutes=60, clock=clock)
+    manager.record_failure("locked")
+    manager.record_failure("locked")
+    manager.record_failure("idle")
+    now[0] += 61
+    manager.record_failure(None, source="10.0.0.2")
+    if manager.is_locked("locked") and len(manager) == 2 and "user:idle" not in manager._counters:
+        print("✅ Counters expire by deadline, not behind a locked one")
+    else:
+        print("❌ Idle counter kept behind a locked one")
+    
+    test_db = "test_lockout.db"
+    if os.path.exists(test_db):
+        os.remove(test_db)
+    
+    db = UserDatabase(test_db)
+    db.create_user("lockuser", "TestP@ss123")
+    for _ in range(3):
+        db.verify_user("lockuser", "wrongpassword")
+    success, message = db.verify_user("lockuser", "TestP@ss123")
+    db.close()
+    
+    reopened = UserDatabase(test_db)
+    if not success and "locked" in message and reopened.lockout.is_locked("lockuser"):
+        print("✅ verify_user rejects locked accounts and the lock persists")
+    else:
+        print(f"❌ Locked account was not rejected: {message}")
+    
+    # Failures for made-up usernames only count against the source
+    for i in range(20):
+        reopened.verify_user(f"ghost{i}", "wrongpassword", source="10.0.0.3")
+    if not any(key.startswith("user:ghost") for key in reopened.lockout._counters) \
+            and reopened.lockout.is_locked("anyone", source="10.0.0.3"):
+        print("✅ Unknown usernames add no per-user counters")
+    else:
+        print("❌ Per-user counters kept for unknown usernames")
+    
+    # Cleanup
+    reopened.close()
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_rate_limiter():
+    """Test token buckets, their memory bound, the shared backend and login integration"""
+    print("\nTesting rate limiter...")
+    
+    from ratelimit import TokenBuckets, SharedTokenBuckets, RateLimiter
+    from database import UserDatabase
+    from hashing import PasswordHasher
+    from config import MESSAGES
+    import os
+    import subprocess
+    import sys
+    import tempfile
+    
+    now = [0.0]
+    buckets = TokenBuckets(rate=1.0, burst=3, max_keys=2, clock=lambda: now[0])
+    burst = [buckets.allow("10.0.0.1") for _ in range(4)]
+    waited = buckets.wait_time("10.0.0.1")
+    now[0] += 1.0
+    if burst == [True, True, True, False] and waited == 1.0 and buckets.allow("10.0.0.1"):
+        print("✅ Bucket allows a burst, then refills lazily")
+    else:
+        print("❌ Token bucket refill wrong")
+    
+    buckets.allow("10.0.0.2")
+    buckets.allow("10.0.0.3")
+    evicted = len(buckets) == 2 and buckets.evictions == 1
+    now[0] += 10.0
+    buckets.allow("10.0.0.4")
+    if evicted and len(buckets) == 1:
+        print("✅ Memory bounded by LRU eviction; refilled buckets dropped")
+    else:
+        print("❌ Idle buckets not evicted")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "buckets")
+        shared = SharedTokenBuckets(path, rate=0.001, burst=5)
+        # Another process spends three tokens from the same bucket
+        subprocess.run([sys.executable, "-c",
+                        "import sys; from ratelimit import SharedTokenBuckets; "
+                        "b = SharedTokenBuckets(sys.argv[1], rate=0.001, burst=5); "
+                        "[b.allow('10.0.0.9') for _ in range(3)]", path],
+                       check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        allowed = [shared.allow("10.0.0.9") for _ in range(3)]
+        shared.close()
+    if allowed == [True, True, False]:
+        print("✅ Shared backend enforces one limit across processes")
+    else:
+        print(f"❌ Shared buckets not shared: {allowed}")
+    
+    test_db = "test_ratelimit.db"
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+    db = UserDatabase(test_db, hasher=PasswordHasher(cost=4, workers=1))
+    db.lockout = None
+    db.rate_limiter = RateLimiter({"login_user": (0.001, 2), "register_source": (0.001, 1)})
+    db.create_user("ratelimited", "TestP@ss123")
+    db.verify_user("ratelimited", "wrong")
+    db.verify_user("ratelimited", "wrong")
+    if db.verify_user("ratelimited", "TestP@ss123") == (False, MESSAGES["rate_limited"]):
+        print("✅ Login flood rejected ahead of verify_user")
+    else:
+        print("❌ Login flood not rate limited")
+    
+    first = db.create_user("fromip1", "TestP@ss123", source="10.0.0.5")[0]
+    second = db.create_user("fromip2", "TestP@ss123", source="10.0.0.5")
+    if first and second == (False, MESSAGES["rate_limited"]) and not db.user_exists("fromip2"):
+        print("✅ Registration flood rejected ahead of create_user")
+    else:
+        print("❌ Registration flood not rate limited")
+    
+    # Cleanup
+    db.close()
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_sessions():
+    """Test session tokens, expiry, renewal and persistence"""
+    print("\nTesting session store...")
+    
+    from session import SessionStore
+    from database import UserDatabase
+    import os
+    
+    now = [1000.0]
+    clock = lambda: now[0]
+    
+    store = SessionStore(timeout_minutes=1, sliding=True, clock=clock)
+    token = store.create("sessuser")
+    now[0] += 50
+    valid_after_renewal = store.validate(token) == "sessuser"
+    now[0] += 50
+    if valid_after_renewal and store.validate(token) == "sessuser":
+        print("✅ Sliding renewal keeps active sessions alive")
+    else:
+        print("❌ Active session expired despite renewal")
+    
+    now[0] += 61
+    if store.validate(token) is None and len(store) == 0:
+        print("✅ Idle session expired")
+    else:
+        print("❌ Idle session was not expired")
+    
+    test_db = "test_sessions.db"
+    if os.path.exists(test_db):
+        os.remove(test_db)
+    
+    db = UserDatabase(test_db)
+    token = SessionStore(timeout_minutes=1, db=db, clock=clock).create("sessuser")
+    restored = SessionStore(timeout_minutes=1, db=db, clock=clock)
+    if restored.validate(token) == "sessuser":
+        print("✅ Session restored from SQLite")
+    else:
+        print("❌ Persisted session was not restored")
+    
+    restored.revoke(token)
+    if SessionStore(timeout_minutes=1, db=db, clock=clock).validate(token) is None:
+        print("✅ Revoked session removed from SQLite")
+    else:
+        print("❌ Revoked session survived a restart")
+    
+    # Cleanup
+    db.close()
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_auth_server():
+    """Test the line-delimited JSON auth service: pipelining, ordering and drain"""
+    print("\nTesting auth server...")
+    
+    from auth_server import AuthServer, _source
+    from database import UserDatabase
+    from hashing import PasswordHasher
+    import asyncio
+    import ipaddress
+    import json
+    import os
+    import time
+    
+    test_db = "test_auth_server.db"
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+    
+    async def scenario():
+        db = UserDatabase(test_db, hasher=PasswordHasher(cost=4, workers=1))
+        # Stands in for a front end on this host that relays client addresses
+        server = AuthServer(db, port=0, workers=4, trusted_proxies=("127.0.0.1",))
+        await server.start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        
+        async def call(*requests):
+            # Pipeline: write every request before reading any response
+            writer.write(b"".join(json.dumps(r).encode() + b"\n" for r in requests))
+            await writer.drain()
+            return [json.loads(await reader.readline()) for _ in requests]
+        
+        # Pipelined requests run concurrently, so dependent ones go in a later batch
+        registered = await call(
+            {"id": 1, "op": "register", "username": "netuser", "password": "TestP@ss123"},
+        ) + await call(
+            {"id": 2, "op": "register", "username": "netuser", "password": "TestP@ss123"},
+            {"id": 3, "op": "register", "username": "weakuser", "password": "password"},
+            {"id": 4, "op": "ping"},
+            {"id": 5, "op": "verify", "username": "netuser", "password": "TestP@ss123"},
+            {"id": 6, "op": "verify", "username": "netuser", "password": "WrongP@ss1"},
+        )
+        token = registered[4].get("token")
+        checked = await call(
+            {"id": 7, "op": "session", "token": token},
+            {"id": 8, "op": "user_info", "token": token},
+            {"id": 9, "op": "nope"},
+            {"id": 10, "op": "logout", "token": token},
+            {"id": 11, "op": "session", "token": token},
+        )
+        writer.write(b"not json\n")
+        await writer.drain()
+        invalid = json.loads(await reader.readline())
+        
+        # Rate limits per source: a trusted front end that sends no address is
+        # only held to the per-username buckets, relayed addresses to their own
+        load = await call(*[{"op": "register", "username": f"load{i}", "password": "TestP@ss123"}
+                            for i in range(15)])
+        load += await call(*[{"op": "verify", "username": f"load{i % 15}", "password": "TestP@ss123"}
+                             for i in range(45)])
+        relayed = await call(*[{"op": "register", "username": f"relayed{i}",
+                                "password": "TestP@ss123", "ip": "192.0.2.1"} for i in range(15)])
+        
+        # Failures relayed for one end user must not lock out another, nor
+        # count against requests that send no address
+        await call(*[{"op": "verify", "username": f"ghost{i}", "password": "WrongP@ss1",
+                      "ip": "203.0.113.7"} for i in range(25)])
+        sources = await call(
+            {"op": "verify", "username": "netuser", "password": "TestP@ss123", "ip": "203.0.113.7"},
+            {"op": "verify", "username": "netuser", "password": "TestP@ss123", "ip": "198.51.100.2"},
+            {"op": "verify", "username": "netuser", "password": "TestP@ss123"},
+        )
+        
+        # A request still running when shutdown starts must be answered first
+        server.handlers["slow"] = lambda request, source: time.sleep(0.2) or {"ok": True}
+        writer.write(b'{"id": 12, "op": "slow"}\n')
+        await writer.drain()
+        while server.in_flight == 0:
+            await asyncio.sleep(0.001)
+        await server.shutdown(timeout=5)
+        drained = json.loads(await reader.readline())
+        closed = await reader.readline() == b""
+        writer.close()
+        return registered, checked, invalid, load, relayed, sources, drained, closed
+    
+    registered, checked, invalid, load, relayed, sources, drained, closed = asyncio.run(scenario())
+    
+    if [r.get("id") for r in registered + checked] == list(range(1, 12)):
+        print("✅ Pipelined responses returned in request order")
+    else:
+        print("❌ Pipelined responses out of order")
+    if registered[0]["ok"] and not registered[1]["ok"] and not registered[2]["ok"] \
+            and registered[3]["ok"] and registered[4]["ok"] and not registered[5]["ok"]:
+        print("✅ Register, weak-password rejection and verify working")
+    else:
+        print("❌ Register/verify results wrong")
+    if checked[0].get("username") == "netuser" and checked[1].get("username") == "netuser" \
+            and "error" in checked[2] and checked[3]["ok"] and not checked[4]["ok"] and "error" in invalid:
+        print("✅ Session, user info, logout and bad requests handled")
+    else:
+        print("❌ Session operations failed")
+    if all(r["ok"] for r in load) and sum(r["ok"] for r in relayed) == 10:
+        print("✅ Source rate limits apply per client, not server-wide")
+    else:
+        print(f"❌ Source rate limits wrong: {sum(r['ok'] for r in load)}/60 local, "
+              f"{sum(r['ok'] for r in relayed)}/15 relayed")
+    if not sources[0]["ok"] and sources[1]["ok"] and sources[2]["ok"]:
+        print("✅ Lockout keyed on the relayed client address, not the loopback peer")
+    else:
+        print(f"❌ One client's failures locked out others: {sources}")
+    spoofed = {"op": "verify", "ip": "192.0.2.9"}
+    if _source(spoofed, "198.51.100.5") == "198.51.100.5" \
+            and _source(spoofed, "127.0.0.1") == "127.0.0.1" \
+            and _source(spoofed, "10.1.2.3", (ipaddress.ip_network("10.0.0.0/8"),)) == "192.0.2.9":
+        print("✅ Client \"ip\" only trusted from configured proxies")
+    else:
+        print("❌ Spoofable \"ip\" trusted from an unconfigured peer")
+    if drained.get("id") == 12 and drained["ok"] and closed:
+        print("✅ Shutdown answered in-flight request before closing")
+    else:
+        print("❌ Shutdown dropped an in-flight request")
+    
+    # Cleanup
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
+def test_async_logging():
+    """Test the background log writer"""
+    print("\nTesting async logging...")
+    
+    from logger import AsyncLogHandler
+    import logging
+    import os
+    
+    log_path = "test_async.log"
+    file_handler = logging.FileHandler(log_path)
+    file_handler.setFormatter(logging.Formatter("%(levelname)s - %(message)s"))
+    handler = AsyncLogHandler([file_handler], maxsize=100, batch_size=16)
+    
+    test_logger = logging.getLogger("test_async_logging")
+    test_logger.propagate = False
+    test_logger.setLevel(logging.INFO)
+    test_logger.addHandler(handler)
+    for i in range(500):
+        test_logger.info("Login successful: user%s", i)
+    test_logger.removeHandler(handler)
+    handler.close()
+    
+    with open(log_path) as f:
+        lines = f.read().splitlines()
+    if len(lines) == 500 and lines[-1] == "INFO - Login successful: user499":
+        print("✅ All queued records written in order")
+    else:
+        print(f"❌ Expected 500 records, found {len(lines)}")
+    
+    # Cleanup
+    os.remove(log_path)
+
+def test_audit_log():
+    """Test the structured audit log, rotation and per-user queries"""
+    print("\nTesting audit log...")
+    
+    from audit import AuditLog
+    import os
+    import shutil
+    import subprocess
+    import sys
+    
+    audit_dir = "test_audit"
+    shutil.rmtree(audit_dir, ignore_errors=True)
+    
+    now = [1_000_000.0]
+    audit_log = AuditLog(audit_dir, max_bytes=400, bucket_seconds=3600, clock=lambda: now[0],
+                         async_writes=True)
+    for day in range(7):
+        for user in ("alice", "bob", "carol"):
+            audit_log.record("login", user, success=(day % 2 == 0), ip="10.0.0.1")
+        now[0] += 86400
+    
+    # record() must return without touching the file: hold the writer's lock
+    # so nothing can be written until it is released
+    audit_log.flush()
+    with audit_log._lock:
+        size = os.path.getsize(audit_log._path)
+        audit_log.record("login", "erin", success=True)
+        queued = os.path.getsize(audit_log._path) == size
+    audit_log.flush()
+    if queued and len(list(audit_log.query("erin"))) == 1:
+        print("✅ Audit events queued and written by a background thread")
+    else:
+        print("❌ Audit event written on the caller's thread")
+    if len(audit_log.segments()) > 1:
+        print("✅ Audit log rotated into segments")
+    else:
+        print("❌ Audit log did not rotate")
+    
+    since = 1_000_000.0 + 3 * 86400
+    failed = list(audit_log.query("alice", since=since, event="login", success=False))
+    if [r["ts"] for r in failed] == [1_000_000.0 + 3 * 86400, 1_000_000.0 + 5 * 86400]:
+        print("✅ Per-user history query returned the right events")
+    else:
+        print(f"❌ Unexpected query results: {failed}")
+    
+    # A query from another process uses the open segment's checkpointed index
+    # and reads only what was appended after it
+    checkpointed = AuditLog(audit_dir, clock=lambda: now[0], async_writes=False,
+                            checkpoint_seconds=0)
+    checkpointed.record("login", "frank", success=True)
+    other = AuditLog(audit_dir, clock=lambda: now[0], async_writes=False)
+    with open(checkpointed._path, "ab") as f:
+        f.write(b'{"ts":1.0,"event":"login","user":"frank"}\n')
+    scanned = []
+    scan_segment = other._scan_segment
+    other._scan_segment = lambda path, index=None: \
+        scanned.append((path, index and index["size"])) or scan_segment(path, index)
+    frank = list(other.query("frank"))
+    if len(frank) == 2 and (checkpointed._path, os.path.getsize(checkpointed._path) - 42) in scanned:
+        print("✅ Live segment of another writer queried from its checkpointed index")
+    else:
+        print(f"❌ Live segment fully rescanned or records missed: {frank} {scanned}")
+    checkpointed.close()
+    
+    audit_log.close()
+    # Closed segments carry their end time, so a query can skip them unopened
+    opened = []
+    load_index = audit_log._load_index
+    audit_log._load_index = lambda path: opened.append(path) or load_index(path)
+    list(audit_log.query("bob", since=now[0] - 86400))
+    if all(len(os.path.basename(p).split("-")) == 4 for p in audit_log.segments()) \
+            and 0 < len(opened) < len(audit_log.segments()):
+        print("✅ Query skipped closed segments by the end time in their names")
+    else:
+        print(f"❌ Query opened {len(opened)} of {len(audit_log.segments())} segments")
+    
+    # Segments of a process that is still running are still open: left alone.
+    # Those of a dead process get closed when a writer next opens a segment.
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                            capture_output=True, text=True).stdout.strip()
+    live = os.path.join(audit_dir, f"audit-1-{os.getppid()}.jsonl")
+    dead = os.path.join(audit_dir, f"audit-2-{exited}.jsonl")
+    for path in (live, dead):
+        with open(path, "w") as f:
+            f.write('{"ts":1.0,"event":"login","user":"dave"}\n')
+    reopened = AuditLog(audit_dir, clock=lambda: now[0])
+    reopened.record("logout", "dave")
+    reopened.flush()
+    if all(f"-{os.getpid()}." in os.path.basename(p) for p in audit_log.segments()
+           if p != live and f"-{exited}." not in p):
+        print("✅ Segment names carry the writer's pid")
+    else:
+        print("❌ Segment names not unique per process")
+    sealed = os.path.join(audit_dir, f"audit-2-1000-{exited}.jsonl")
+    if len(list(reopened.query("bob"))) == 7 and len(list(reopened.query("dave"))) == 3 \
+            and os.path.exists(live) and not os.path.exists(live[:-len(".jsonl")] + ".idx") \
+            and not os.path.exists(dead) and os.path.exists(sealed[:-len(".jsonl")] + ".idx"):
+        print("✅ Segments of dead writers closed, segments still being written left alone")
+    else:
+        print("❌ Closing abandoned segments lost records or touched a live one")
+    reopened.close()
+    
+    # Retention: old segments and those beyond the count limit are deleted
+    before = len(audit_log.segments())
+    now[0] += 86400
+    pruned = AuditLog(audit_dir, clock=lambda: now[0], async_writes=False,
+                      retention_days=3, max_segments=3)
+    pruned.record("login", "alice", success=True)
+    closed = [p for p in pruned.segments() if len(os.path.basename(p).split("-")) == 4]
+    if len(closed) <= 3 and len(pruned.segments()) < before and os.path.exists(live) \
+            and all(int(os.path.basename(p).split("-")[2]) / 1000 >= now[0] - 3 * 86400
+                    for p in closed):
+        print("✅ Expired and excess audit segments deleted")
+    else:
+        print(f"❌ Retention kept {len(closed)} closed segments")
+    pruned.close()
+    
+    # Cleanup
+    shutil.rmtree(audit_dir, ignore_errors=True)
+
+def test_log_analytics():
+    """Test the streaming security report"""
+    print("\nTesting log analytics...")
+    
+    from log_analytics import analyze, ApproxCounter
+    import os
+    
+    log_path = "test_analytics.log"
+    with open(log_path, "w") as f:
+        for i in range(300):
+            f.write(f"2026-10-18 10:00:{i % 60:02d},000 - INFO - Login successful: alice from 10.0.0.1\n")
+            f.write(f"2026-10-18 10:00:{i % 60:02d},000 - WARNING - Login failed: mallory from 10.0.0.9\n")
+        f.write("2026-10-19 09:00:00,000 - INFO - User registration successful: bob\n")
+        f.write("2026-10-19 09:00:01,000 - WARNING - Security event: Session expired - User: bob\n")
+    
+    report = analyze(log_path).to_dict()
+    top_user = report["failed_logins_by_user"][0]
+    if (report["logins"]["failed"] == 300 and top_user["key"] == "mallory"
+            and top_user["failure_rate"] == 1.0
+            and report["top_security_events"][0]["event"] == "Session expired"):
+        print("✅ Log lines parsed and aggregated")
+    else:
+        print(f"❌ Unexpected report: {report}")
+    
+    if analyze(log_path, workers=3).to_dict() == report:
+        print("✅ Byte-range workers match a single pass")
+    else:
+        print("❌ Parallel analysis differed from a single pass")
+    
+    daily = analyze(log_path, date="2026-10-19", approx=True).to_dict()
+    if daily["logins"]["total"] == 0 and daily["registrations"] == {"success": 1}:
+        print("✅ Date filter and approximate mode working")
+    else:
+        print(f"❌ Unexpected daily report: {daily}")
+    
+    # Space-Saving keeps the heavy hitters among many more keys than it tracks
+    counter = ApproxCounter(top=10)
+    for i in range(5000):
+        counter.add(f"noise{i}")
+        if i % 25 == 0:
+            for j in range(10):
+                counter.add(f"heavy{j}", 5)
+    if {key for key, _ in counter.top(10)} == {f"heavy{j}" for j in range(10)} \
+            and len(counter.heavy) == counter.capacity:
+        print("✅ Approximate top-k found the heavy hitters")
+    else:
+        print(f"❌ Unexpected approximate top-k: {counter.top(10)}")
+    
+    # Cleanup
+    os.remove(log_path)
 
 def test_logger():
     """Test logging system"""
@@ -85,13 +1499,124 @@ def test_logger():
     except Exception as e:
         print(f"❌ Logging system failed: {e}")
 
+def test_metrics():
+    """Test per-thread metrics, the UserDatabase time split and both exporters"""
+    print("\nTesting metrics...")
+    
+    from metrics import Metrics, metrics
+    from database import UserDatabase
+    from hashing import PasswordHasher
+    from PasswordMatch import policy
+    import os
+    import tempfile
+    import threading
+    import urllib.request
+    
+    registry = Metrics(enabled=True, buckets=(0.1, 1.0))
+    
+    def record():
+        for _ in range(1000):
+            registry.inc("logins_total", labels=(("result", "ok"),))
+        registry.observe("latency_seconds", 0.5)
+    
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    text = registry.render()
+    expected = [
+        'logins_total{result="ok"} 4000',
+        'latency_seconds_bucket{le="0.1"} 0',
+        'latency_seconds_bucket{le="1.0"} 4',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_count 4",
+        "# TYPE latency_seconds histogram",
+    ]
+    if len(registry._tables) == 4 and all(line in text.splitlines() for line in expected):
+        print("✅ Per-thread tables merged into Prometheus text on scrape")
+    else:
+        print(f"❌ Metrics merge or format wrong:\n{text}")
+    
+    test_db = "test_metrics.db"
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+    enabled = metrics.enabled
+    metrics.enabled = True
+    metrics.reset()
+    try:
+        db = UserDatabase(test_db, write_behind=False, hasher=PasswordHasher(cost=4, workers=1))
+        db.create_user("metricsuser", "TestP@ss123")
+        db.verify_user("metricsuser", "TestP@ss123")
+        policy.is_strong("TestP@ss123")
+        series = metrics.collect()
+        db.close()
+    finally:
+        metrics.enabled = enabled
+    calls = series.get(("userdb_call_seconds", (("op", "verify_user"),)))
+    phases = {phase: series.get(("userdb_phase_seconds_total",
+                                  (("op", "verify_user"), ("phase", phase))), 0)
+              for phase in ("connect", "hash", "sql")}
+    if calls and calls[-1] == 1 and phases["hash"] > 0 and \
+            abs(sum(phases.values()) - calls[-2]) < 1e-6 and \
+            ("userdb_call_seconds", (("op", "user_exists"),)) not in series and \
+            ("password_policy_seconds", (("op", "is_strong"),)) in series:
+        print("✅ UserDatabase calls split into connect, hash and SQL time")
+    else:
+        print(f"❌ UserDatabase metrics wrong: {calls} {phases}")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "login.prom")
+        server = registry.start_http_server(port=0)
+        registry.start_textfile_writer(path, interval=60)
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            scraped = response.read().decode()
+        registry.stop_exporters()  # Writes the file once more on the way out
+        with open(path, encoding="utf-8") as f:
+            written = f.read()
+    if scraped == written == text:
+        print("✅ Served over HTTP and written to a textfile")
+    else:
+        print("❌ Metrics exporters returned different output")
+    
+    # Cleanup
+    for suffix in ("", "-wal", "-shm", ".usernames"):
+        if os.path.exists(test_db + suffix):
+            os.remove(test_db + suffix)
+
 if __name__ == "__main__":
     print("🔧 Running Login System Tests\n")
     
     try:
         test_password_validation()
+        test_password_policy()
+        test_strength_meter()
+        test_password_blocklist()
         test_database()
+        test_connection_pool()
+        test_bulk_create()
+        test_write_behind_last_login()
+        test_user_cache()
+        test_read_replica()
+        test_username_filter()
+        test_fast_startup()
+        test_user_transfer()
+        test_sharded_database()
+        test_task_dispatcher()
+        test_password_hashing()
+        test_update_password()
+        test_password_history()
+        test_account_lockout()
+        test_rate_limiter()
+        test_sessions()
+        test_auth_server()
+        test_async_logging()
+        test_audit_log()
+        test_log_analytics()
         test_logger()
+        test_metrics()
         
         print("\n✅ All tests completed!")
         print("\n🚀 You can now run 'python main.py' to start the login system")
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Streaming user import/export for users.db
+
+Moves users between a database and CSV or JSON Lines files without
+holding the table or the file in memory. Every record carries the
+columns id, username, password_hash, created_at and last_login.
+
+Exports page through the table by id and can resume an interrupted run
+from the last complete record in the output file. Imports are written
+in chunked transactions. Each record needs either password_hash (already
+hashed, any format hashing.py can verify) or password (hashed on import).
+Usernames that already exist are skipped and counted; imported users
+get new ids in the target database.
+
+Usage:
+    python user_transfer.py export users.csv
+    python user_transfer.py export users.jsonl --resume
+    python user_transfer.py import users.jsonl --db staging.db
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from itertools import islice
+from config import DATABASE_NAME, BULK_INSERT_CHUNK_SIZE, TRANSFER_BATCH_SIZE
+from sharding import open_database
+from hashing import is_valid_hash
+
+FIELDS = ("id", "username", "password_hash", "created_at", "last_login")
+PROGRESS_EVERY = 100000  # Rows between progress lines
+
+def detect_format(path, fmt=None):
+    """Return "csv" or "jsonl", from fmt or the file extension"""
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt == "json":
+        fmt = "jsonl"
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Unknown format for {path}; use --format csv or jsonl")
+    return fmt
+
+
+class TransferStats:
+    def __init__(self, progress=None):
+        """Row counters and throughput for one import or export run"""
+        self.rows = 0
+        self.created = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.last_id = None
+        self.progress = progress
+        self.started = time.perf_counter()
+
+    def tick(self, count=1):
+        before = self.rows
+        self.rows += count
+        if self.progress and self.rows // PROGRESS_EVERY != before // PROGRESS_EVERY:
+            self.progress(self.summary())
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_sec(self):
+        seconds = self.seconds
+        return self.rows / seconds if seconds > 0 else 0.0
+
+    def summary(self):
+        text = f"{self.rows} rows in {self.seconds:.1f} s ({self.rows_per_sec:,.0f} rows/s)"
+        if self.created or self.skipped or self.invalid:
+            text += f", {self.created} created, {self.skipped} skipped, {self.invalid} invalid"
+        if self.last_id is not None:
+            text += f", last id {self.last_id}"
+        return text
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def last_exported_id(path, fmt):
+    """Return the id of the last complete record in an export file, or 0.
+
+    A torn final line from an interrupted run is cut off so the resumed
+    export appends cleanly.
+    """
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        tail_start = max(0, size - 65536)
+        f.seek(tail_start)
+        tail = f.read()
+        complete = tail.rfind(b"\n") + 1
+        if tail_start + complete < size:
+            f.truncate(tail_start + complete)
+        lines = tail[:complete].splitlines()
+    for line in reversed(lines):
+        if not line.strip():
+            continue
+        text = line.decode("utf-8")
+        try:
+            if fmt == "jsonl":
+                return int(json.loads(text)["id"])
+            return int(next(csv.reader([text]))[0])
+        except (ValueError, KeyError, IndexError):
+            return 0  # Header only, or not an export file
+    return 0
+
+def export_users(db, path, fmt=None, resume=False, after_id=0,
+                 batch_size=TRANSFER_BATCH_SIZE, progress=None):
+    """Stream users with id > after_id to a CSV or JSONL file.
+
+    With resume, continue after the last complete record already in the file.
+    """
+    fmt = detect_format(path, fmt)
+    appending = resume and os.path.exists(path) and os.path.getsize(path) > 0
+    if appending:
+        after_id = max(after_id, last_exported_id(path, fmt))
+    db.flush_last_logins()  # Export buffered last_login values too
+
+    stats = TransferStats(progress)
+    with open(path, "a" if appending else "w", newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            if not appending:
+                writer.writerow(FIELDS)
+            write = writer.writerow
+        else:
+            def write(row):
+                f.write(json.dumps(dict(zip(FIELDS, row)), separators=(",", ":")) + "\n")
+        for row in db.iter_users(after_id, batch_size):
+            write(row)
+            stats.last_id = row[0]
+            stats.tick()
+    return stats
+
+# ---------------------------------------------------------------------------
+# Import
+# ---------------------------------------------------------------------------
+
+def read_records(path, fmt=None):
+    """Yield one dict per record of a CSV or JSONL file"""
+    fmt = detect_format(path, fmt)
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def import_users(db, path, fmt=None, chunk_size=BULK_INSERT_CHUNK_SIZE, progress=None):
+    """Stream users from a CSV or JSONL file into the database in chunked transactions"""
+    stats = TransferStats(progress)
+    records = read_records(path, fmt)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        stats.tick(len(chunk))
+
+        rows, plaintext = [], []
+        for record in chunk:
+            username = (record.get("username") or "").strip()
+            password_hash = record.get("password_hash") or None
+            password = record.get("password") or None
+            if not username or (password_hash is None and password is None) or (
+                password_hash is not None and not is_valid_hash(password_hash)
+            ):
+                stats.invalid += 1
+                continue
+            row = [username, password_hash,
+                   record.get("created_at") or None, record.get("last_login") or None]
+            if password_hash is None:
+                plaintext.append((row, password))
+            rows.append(row)
+
+        if plaintext:
+            hashes = db.hash_passwords(password for _, password in plaintext)
+            for (row, _), password_hash in zip(plaintext, hashes):
+                row[1] = password_hash
+
+        for username, success, message in db.insert_users_chunk(map(tuple, rows)):
+            if success:
+                stats.created += 1
+            elif message == "Username already exists!":
+                stats.skipped += 1
+            else:
+                stats.invalid += 1
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream users to and from CSV/JSONL")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="write users to a file")
+    export.add_argument("path")
+    export.add_argument("--resume", action="store_true",
+                        help="append after the last complete record in path")
+    export.add_argument("--after-id", type=int, default=0, help="only users with a larger id")
+    export.add_argument("--batch-size", type=int, default=TRANSFER_BATCH_SIZE)
+
+    load = subparsers.add_parser("import", help="add users from a file")
+    load.add_argument("path")
+    load.add_argument("--chunk-size", type=int, default=BULK_INSERT_CHUNK_SIZE,
+                      help="rows per transaction")
+
+    for sub in (export, load):
+        sub.add_argument("--db", default=DATABASE_NAME, help="database file")
+        sub.add_argument("--format", choices=["csv", "jsonl"],
+                         help="file format (default: from the extension)")
+    args = parser.parse_args()
+
+    def progress(text):
+        print(text, file=sys.stderr)
+
+    with open_database(args.db) as db:
+        if args.command == "export":
+            stats = export_users(db, args.path, args.format, args.resume, args.after_id,
+                                 args.batch_size, progress)
+            print(f"Exported {stats.summary()}")
+        else:
+            stats = import_users(db, args.path, args.format, args.chunk_size, progress)
+            print(f"Imported {stats.summary()}")
+
+
+if __name__ == "__main__":
+    main()
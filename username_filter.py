@@ -0,0 +1,96 @@
+"""
+Bloom filter of registered usernames
+
+Lets user_exists() answer "definitely not taken" without touching SQLite;
+only possible hits fall through to the database. The filter is saved next
+to the database together with the highest user id it covers, so startup
+loads the snapshot and only adds users created since, instead of scanning
+the whole table.
+
+Snapshot layout:
+    header   magic, bloom size in bits, hash count, entry count, capacity, max user id
+    bloom    filter bits
+"""
+
+import hashlib
+import math
+import os
+import struct
+
+MAGIC = b"USRBLOOM"
+HEADER = struct.Struct(">8sQIQQQ")
+
+def _positions(username, bits, hashes):
+    """Bit positions for a username by double hashing one BLAKE2b digest"""
+    digest = hashlib.blake2b(username.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "big")
+    h2 = int.from_bytes(digest[8:], "big") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+class UsernameFilter:
+    def __init__(self, capacity, false_positive_rate=0.01):
+        """Empty filter sized for `capacity` usernames at the given false positive rate"""
+        self.capacity = max(1, capacity)
+        self.bits = max(64, int(math.ceil(
+            -self.capacity * math.log(false_positive_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.bits / self.capacity * math.log(2))))
+        self.count = 0
+        self.max_id = 0  # Every user with id <= max_id has been added
+        self.dirty = True  # Changed since it was last saved or loaded
+        self._bloom = bytearray((self.bits + 7) // 8)
+
+    def add(self, username):
+        bloom = self._bloom
+        for position in _positions(username, self.bits, self.hashes):
+            bloom[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+        self.dirty = True
+
+    def __contains__(self, username):
+        """False means the username is definitely not registered"""
+        bloom = self._bloom
+        for position in _positions(username, self.bits, self.hashes):
+            if not bloom[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def is_full(self):
+        """True once more names were added than the filter was sized for"""
+        return self.count > self.capacity
+
+    def save(self, path):
+        """Write the filter atomically to path"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, self.bits, self.hashes, self.count,
+                                self.capacity, self.max_id))
+            f.write(self._bloom)
+        os.replace(tmp_path, path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path):
+        """Read a filter saved with save(); raises ValueError if the file is invalid"""
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) != HEADER.size:
+                raise ValueError(f"Truncated username filter: {path}")
+            magic, bits, hashes, count, capacity, max_id = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError(f"Not a username filter: {path}")
+            bloom = bytearray(f.read())
+        if len(bloom) != (bits + 7) // 8:
+            raise ValueError(f"Truncated username filter: {path}")
+        self = cls.__new__(cls)
+        self.capacity = capacity
+        self.bits = bits
+        self.hashes = hashes
+        self.count = count
+        self.max_id = max_id
+        self.dirty = False
+        self._bloom = bloom
+        return self